@@ -0,0 +1,539 @@
+"""
+اختبار أداء المعالجات بإعادة تشغيل التحديثات
+Handler Load Benchmark with Update Replay
+
+الاستخدام / Usage:
+    python benchmark.py --mode feed --rate 50 --duration 30 --users 100 --admins 5
+    python benchmark.py --mode webhook --latency-ms 40 --rate-limit 0.02
+    python benchmark.py --mode polling --replay updates.jsonl --json report.json
+    python benchmark.py --pay
+
+يعمل البوت في نفس العملية مقابل خادم واجهة محلي ويكتب مستخدمين افتراضيين في
+قاعدة البيانات؛ لا يعمل إلا إذا كانت DATABASE_URL مساوية لـ BENCHMARK_DATABASE_URL.
+خطوة الدفع (--pay) تتصل بمزودي الدفع وتتطلب PAYMENTS_SANDBOX.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import math
+import random
+import time
+from collections import Counter, defaultdict
+from contextlib import asynccontextmanager
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from config import settings
+from fake_bot_api import FakeBotAPI, FAKE_API_HOST, FAKE_API_PORT
+
+
+# إعدادات الاختبار
+BENCHMARK_USER_ID_BASE = 7_000_000_000
+BENCHMARK_WEBHOOK_PORT = 8091
+BENCHMARK_TIMEOUT = 30
+WARMUP_CONCURRENCY = 50
+
+DELIVERY_MODES = ("feed", "polling", "webhook")
+LANGUAGES = ("ar", "en")
+PAYMENT_PROVIDERS = ("stripe", "paypal")
+
+logger = logging.getLogger(__name__)
+
+
+class UnsafeEnvironmentError(Exception):
+    """الإعدادات لا تشير إلى بيئة اختبار"""
+    pass
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {
+        'id': user_id,
+        'is_bot': False,
+        'first_name': f"Load {user_id}",
+        'language_code': "en"
+    }
+
+
+def _chat(user_id: int) -> Dict[str, Any]:
+    return {'id': user_id, 'type': "private"}
+
+
+def message_update(update_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    """تحديث رسالة نصية (أو أمر) من مستخدم"""
+    message = {
+        'message_id': update_id,
+        'date': int(time.time()),
+        'chat': _chat(user_id),
+        'from': _user(user_id),
+        'text': text
+    }
+    if text.startswith("/"):
+        message['entities'] = [
+            {'type': "bot_command", 'offset': 0, 'length': len(text.split()[0])}
+        ]
+    return {'update_id': update_id, 'message': message}
+
+
+def callback_update(update_id: int, user_id: int, data: str) -> Dict[str, Any]:
+    """تحديث ضغط زر على رسالة البوت"""
+    return {
+        'update_id': update_id,
+        'callback_query': {
+            'id': str(update_id),
+            'from': _user(user_id),
+            'chat_instance': str(user_id),
+            'data': data,
+            'message': {
+                'message_id': 1,
+                'date': int(time.time()),
+                'chat': _chat(user_id),
+                'text': "menu"
+            }
+        }
+    }
+
+
+def user_journey(plan_ids: Sequence[int], include_payments: bool) -> List[Tuple[str, str]]:
+    """البداية، اختيار اللغة، تصفح الخطط، اختيار خطة، الدفع"""
+    steps = [
+        ("message", "/start"),
+        ("callback", f"lang_{random.choice(LANGUAGES)}"),
+        ("callback", "paid_subscriptions")
+    ]
+    if plan_ids:
+        plan_id = random.choice(plan_ids)
+        steps.append(("callback", f"select_plan_{plan_id}"))
+        if include_payments:
+            steps.append(("callback", f"pay_{random.choice(PAYMENT_PROVIDERS)}_{plan_id}"))
+    return steps
+
+
+def admin_journey() -> List[Tuple[str, str]]:
+    """البداية، اختيار اللغة، لوحة الإدارة، الإحصائيات"""
+    return [
+        ("message", "/start"),
+        ("callback", f"lang_{random.choice(LANGUAGES)}"),
+        ("callback", "admin_panel"),
+        ("callback", "admin_stats")
+    ]
+
+
+def synthetic_updates(user_ids: Sequence[int], admin_ids: Sequence[int],
+                      plan_ids: Sequence[int], include_payments: bool = False) -> Iterator[Dict[str, Any]]:
+    """رحلات متكررة؛ خطوات المستخدمين متداخلة فلا تتتابع خطوتان لنفس المحادثة"""
+    update_ids = itertools.count(1)
+    while True:
+        journeys = [(user_id, user_journey(plan_ids, include_payments)) for user_id in user_ids]
+        journeys += [(admin_id, admin_journey()) for admin_id in admin_ids]
+
+        for step in itertools.count():
+            active = [(user_id, steps[step]) for user_id, steps in journeys if step < len(steps)]
+            if not active:
+                break
+            for user_id, (kind, payload) in active:
+                build = message_update if kind == "message" else callback_update
+                yield build(next(update_ids), user_id, payload)
+
+
+def recorded_updates(path: str) -> Iterator[Dict[str, Any]]:
+    """إعادة تشغيل تحديثات مسجلة (JSON لكل سطر) بشكل دوري مع ترقيم جديد"""
+    with open(path, encoding="utf-8") as source:
+        recorded = [json.loads(line) for line in source if line.strip()]
+    if not recorded:
+        raise ValueError(f"No updates in {path}")
+
+    update_ids = itertools.count(1)
+    for update in itertools.cycle(recorded):
+        yield {**update, 'update_id': next(update_ids)}
+
+
+def percentile(values: Sequence[float], fraction: float) -> float:
+    """المئين بطريقة أقرب رتبة (القيم مرتبة)"""
+    if not values:
+        return 0.0
+    rank = math.ceil(fraction * len(values))
+    return values[min(len(values), max(rank, 1)) - 1]
+
+
+class UpdateTracker(BaseMiddleware):
+    """زمن كل تحديث من تسليمه حتى انتهاء معالجته واسم المعالج الذي نفذه"""
+
+    def __init__(self):
+        self._sent: Dict[int, float] = {}
+        self._done: Dict[int, asyncio.Future] = {}
+        self._handlers: Dict[int, str] = {}
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Counter = Counter()
+
+    def install(self, dp, routers: Iterable):
+        """خارجي على التحديثات للتوقيت وداخلي على الموجهات للتسمية"""
+        dp.update.outer_middleware(self)
+        for router in routers:
+            router.message.middleware(self)
+            router.callback_query.middleware(self)
+
+    def sent(self, update_id: int) -> asyncio.Future:
+        """تسجيل لحظة التسليم؛ المستقبل يكتمل عند انتهاء المعالجة"""
+        self._sent[update_id] = time.perf_counter()
+        future = asyncio.get_running_loop().create_future()
+        self._done[update_id] = future
+        return future
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+
+        # وسيط داخلي: تسجيل اسم المعالج للتحديث الحالي
+        if handler_object is not None:
+            update = data.get('event_update')
+            if update is not None:
+                self._handlers[update.update_id] = getattr(
+                    handler_object.callback, '__name__', 'unknown'
+                )
+            return await handler(event, data)
+
+        # وسيط خارجي: يشمل تحميل المستخدم والوسائط والمعالج
+        failed = False
+        try:
+            return await handler(event, data)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self._finish(event.update_id, failed)
+
+    def _finish(self, update_id: int, failed: bool):
+        name = self._handlers.pop(update_id, 'unhandled')
+        started = self._sent.pop(update_id, None)
+        future = self._done.pop(update_id, None)
+        if started is None:
+            return
+
+        self.samples[name].append(time.perf_counter() - started)
+        if failed:
+            self.errors[name] += 1
+        if future is not None and not future.done():
+            future.set_result(None)
+
+
+class LoadGenerator:
+    """إرسال التحديثات بمعدل ثابت دون انتظار الردود ثم انتظار انتهاء معالجتها"""
+
+    def __init__(self, deliver: Callable[[Dict[str, Any]], Awaitable[None]],
+                 tracker: UpdateTracker, rate: float, timeout: float = BENCHMARK_TIMEOUT):
+        self.deliver = deliver
+        self.tracker = tracker
+        self.rate = rate
+        self.timeout = timeout
+
+    async def run(self, updates: Iterable[Dict[str, Any]], count: int) -> Tuple[float, int]:
+        """إرجاع (المدة بالثواني، عدد التحديثات التي لم تنته)"""
+        loop = asyncio.get_running_loop()
+        pending = []
+        started = loop.time()
+
+        for index, update in enumerate(itertools.islice(updates, count)):
+            delay = started + index / self.rate - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            pending.append(self.tracker.sent(update['update_id']))
+            await self.deliver(update)
+
+        unfinished = 0
+        if pending:
+            _, not_done = await asyncio.wait(pending, timeout=self.timeout)
+            unfinished = len(not_done)
+
+        return loop.time() - started, unfinished
+
+
+class BenchmarkReport:
+    """الإنتاجية وزمن p50/p99 لكل معالج"""
+
+    def __init__(self, mode: str, duration: float, tracker: UpdateTracker,
+                 timeouts: int, fake_api: FakeBotAPI):
+        self.mode = mode
+        self.duration = duration
+        self.timeouts = timeouts
+        self.api_calls = dict(fake_api.calls)
+        self.rate_limited = dict(fake_api.rate_limited)
+
+        self.rows = []
+        for name, samples in tracker.samples.items():
+            samples = sorted(samples)
+            self.rows.append({
+                'handler': name,
+                'count': len(samples),
+                'errors': tracker.errors[name],
+                'throughput': len(samples) / duration if duration else 0.0,
+                'p50_ms': percentile(samples, 0.50) * 1000,
+                'p99_ms': percentile(samples, 0.99) * 1000,
+                'max_ms': samples[-1] * 1000
+            })
+        self.rows.sort(key=lambda row: row['count'], reverse=True)
+
+    @property
+    def completed(self) -> int:
+        return sum(row['count'] for row in self.rows)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'duration': self.duration,
+            'completed': self.completed,
+            'throughput': self.completed / self.duration if self.duration else 0.0,
+            'timeouts': self.timeouts,
+            'handlers': self.rows,
+            'api_calls': self.api_calls,
+            'rate_limited': self.rate_limited
+        }
+
+    def format(self) -> str:
+        lines = [
+            f"Mode {self.mode}: {self.completed} updates in {self.duration:.1f}s "
+            f"({self.completed / self.duration if self.duration else 0:.1f} updates/s), "
+            f"{self.timeouts} unfinished",
+            f"{'handler':<32}{'count':>8}{'errors':>8}{'rps':>9}"
+            f"{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        ]
+        for row in self.rows:
+            lines.append(
+                f"{row['handler']:<32}{row['count']:>8}{row['errors']:>8}"
+                f"{row['throughput']:>9.1f}{row['p50_ms']:>10.1f}"
+                f"{row['p99_ms']:>10.1f}{row['max_ms']:>10.1f}"
+            )
+
+        calls = ", ".join(f"{method}={count}" for method, count in sorted(self.api_calls.items()))
+        lines.append(f"Bot API calls: {calls or 'none'}")
+        if self.rate_limited:
+            limited = ", ".join(
+                f"{method}={count}" for method, count in sorted(self.rate_limited.items())
+            )
+            lines.append(f"Injected 429 responses: {limited}")
+        return "\n".join(lines)
+
+
+class Benchmark:
+    """تشغيل البوت مقابل الخادم المحلي وقياس المعالجات تحت الحمل"""
+
+    def __init__(self, mode: str = "feed", rate: float = 50, duration: float = 30,
+                 users: int = 100, admins: int = 5, include_payments: bool = False,
+                 replay: Optional[str] = None, fake_api: Optional[FakeBotAPI] = None,
+                 api_port: int = FAKE_API_PORT, webhook_port: int = BENCHMARK_WEBHOOK_PORT,
+                 timeout: float = BENCHMARK_TIMEOUT):
+        if mode not in DELIVERY_MODES:
+            raise ValueError(f"Unknown delivery mode: {mode}")
+
+        self.mode = mode
+        self.rate = rate
+        self.duration = duration
+        self.user_ids = [BENCHMARK_USER_ID_BASE + index for index in range(users)]
+        self.admin_ids = [BENCHMARK_USER_ID_BASE + users + index for index in range(admins)]
+        self.include_payments = include_payments
+        self.replay = replay
+        self.fake_api = fake_api or FakeBotAPI()
+        self.api_port = api_port
+        self.webhook_port = webhook_port
+        self.timeout = timeout
+
+    def check_environment(self):
+        """رفض التشغيل على قاعدة بيانات أو مزودي دفع غير مخصصين للاختبار"""
+        database_url = getattr(settings, 'DATABASE_URL', None)
+        benchmark_database_url = getattr(settings, 'BENCHMARK_DATABASE_URL', None)
+        if not benchmark_database_url or database_url != benchmark_database_url:
+            raise UnsafeEnvironmentError(
+                "Refusing to run: set BENCHMARK_DATABASE_URL to the same test database "
+                "as DATABASE_URL to confirm it may receive synthetic users"
+            )
+
+        if self.include_payments and not getattr(settings, 'PAYMENTS_SANDBOX', False):
+            raise UnsafeEnvironmentError(
+                "Refusing to run the payment step: set PAYMENTS_SANDBOX with test "
+                "or fake payment provider credentials"
+            )
+
+    async def run(self) -> BenchmarkReport:
+        self.check_environment()
+
+        from main import TelegramBot
+        from handlers import user_router, admin_router, payment_router
+
+        await self.fake_api.start(port=self.api_port)
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.fake_api.base_url))
+        app = TelegramBot(session=session)
+        tracker = UpdateTracker()
+
+        try:
+            await app.startup()
+            tracker.install(app.dp, (user_router, admin_router, payment_router))
+
+            updates = await self._updates(app)
+            async with self._delivery(app) as deliver:
+                generator = LoadGenerator(deliver, tracker, self.rate, self.timeout)
+                duration, unfinished = await generator.run(
+                    updates, int(self.rate * self.duration)
+                )
+
+            return BenchmarkReport(self.mode, duration, tracker, unfinished, self.fake_api)
+
+        finally:
+            await app.shutdown()
+            await self.fake_api.stop()
+
+    async def _updates(self, app) -> Iterator[Dict[str, Any]]:
+        """مصدر التحديثات: ملف مسجل أو رحلات اصطناعية بعد التهيئة"""
+        if self.replay:
+            return recorded_updates(self.replay)
+
+        from catalog import catalog
+        from user_cache import user_cache
+
+        # إنشاء المستخدمين الافتراضيين ومنح المديرين صلاحياتهم قبل القياس
+        semaphore = asyncio.Semaphore(WARMUP_CONCURRENCY)
+
+        async def warm(user_id: int):
+            async with semaphore:
+                await app.dp.feed_raw_update(app.bot, message_update(0, user_id, "/start"))
+
+        await asyncio.gather(*(warm(user_id) for user_id in self.user_ids + self.admin_ids))
+        await user_cache.set_admin_statuses(self.admin_ids, True)
+        logger.info(f"Warmed up {len(self.user_ids)} users and {len(self.admin_ids)} admins")
+
+        plan_ids = [plan.id for plan in catalog.plans()]
+        return synthetic_updates(self.user_ids, self.admin_ids, plan_ids, self.include_payments)
+
+    @asynccontextmanager
+    async def _delivery(self, app):
+        """طريقة تسليم التحديثات للموزع حسب الوضع"""
+        if self.mode == "feed":
+            # تمرير مباشر للموزع: زمن المعالج فقط
+            tasks = set()
+
+            async def deliver(update: Dict[str, Any]):
+                task = asyncio.create_task(app.dp.feed_raw_update(app.bot, update))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+
+            try:
+                yield deliver
+            finally:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+        elif self.mode == "polling":
+            polling = asyncio.create_task(
+                app.dp.start_polling(app.bot, handle_signals=False, close_bot_session=False)
+            )
+
+            async def deliver(update: Dict[str, Any]):
+                self.fake_api.push_update(update)
+
+            try:
+                yield deliver
+            finally:
+                try:
+                    await app.dp.stop_polling()
+                except RuntimeError:
+                    pass
+                await asyncio.gather(polling, return_exceptions=True)
+
+        else:
+            from webhook import WebhookIngress, TELEGRAM_WEBHOOK_PATH
+
+            # مسار webhook الحقيقي بطوابيره؛ الخادم المحلي يسلم إليه
+            ingress = WebhookIngress(app.dp, app.bot)
+            await ingress.lanes.start()
+
+            web_app = web.Application()
+            ingress.register(web_app)
+            runner = web.AppRunner(web_app)
+            await runner.setup()
+            await web.TCPSite(runner, FAKE_API_HOST, self.webhook_port).start()
+
+            await app.bot.set_webhook(
+                url=f"http://{FAKE_API_HOST}:{self.webhook_port}{TELEGRAM_WEBHOOK_PATH}",
+                secret_token=ingress.secret_token
+            )
+
+            async def deliver(update: Dict[str, Any]):
+                self.fake_api.push_update(update)
+
+            try:
+                yield deliver
+            finally:
+                await app.bot.delete_webhook()
+                await runner.cleanup()
+                await ingress.lanes.stop()
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Replay updates against the bot handlers using a local fake Bot API"
+    )
+    parser.add_argument("--mode", choices=DELIVERY_MODES, default="feed",
+                        help="feed: direct dispatch, polling: getUpdates, webhook: webhook ingress")
+    parser.add_argument("--rate", type=float, default=50, help="target updates per second")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load")
+    parser.add_argument("--users", type=int, default=100, help="synthetic users")
+    parser.add_argument("--admins", type=int, default=5, help="synthetic admins")
+    parser.add_argument("--pay", action="store_true",
+                        help="include the payment step (calls the payment providers, "
+                             "requires PAYMENTS_SANDBOX)")
+    parser.add_argument("--replay", help="JSON-lines file of recorded updates")
+    parser.add_argument("--latency-ms", type=float, default=30, help="fake Bot API latency")
+    parser.add_argument("--jitter-ms", type=float, default=10, help="extra random latency")
+    parser.add_argument("--rate-limit", type=float, default=0.0,
+                        help="fraction of Bot API calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="retry_after for injected 429s")
+    parser.add_argument("--api-port", type=int, default=FAKE_API_PORT)
+    parser.add_argument("--webhook-port", type=int, default=BENCHMARK_WEBHOOK_PORT)
+    parser.add_argument("--timeout", type=float, default=BENCHMARK_TIMEOUT,
+                        help="seconds to wait for unfinished updates")
+    parser.add_argument("--json", help="write the report as JSON to this path")
+    return parser.parse_args(argv)
+
+
+async def main(argv: Optional[Sequence[str]] = None):
+    """تشغيل الاختبار وطباعة التقرير"""
+    args = parse_args(argv)
+
+    fake_api = FakeBotAPI(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_limit_ratio=args.rate_limit,
+        retry_after=args.retry_after
+    )
+    benchmark = Benchmark(
+        mode=args.mode,
+        rate=args.rate,
+        duration=args.duration,
+        users=args.users,
+        admins=args.admins,
+        include_payments=args.pay,
+        replay=args.replay,
+        fake_api=fake_api,
+        api_port=args.api_port,
+        webhook_port=args.webhook_port,
+        timeout=args.timeout
+    )
+
+    try:
+        report = await benchmark.run()
+    except UnsafeEnvironmentError as e:
+        raise SystemExit(str(e))
+    print(report.format())
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as target:
+            json.dump(report.as_dict(), target, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
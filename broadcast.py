@@ -0,0 +1,571 @@
+"""
+محرك البث الجماعي المتزامن
+Concurrent Broadcast Engine
+"""
+
+import asyncio
+import collections
+import logging
+import time
+from datetime import datetime
+from typing import AsyncIterator, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import (
+    Column, DateTime, ForeignKey, Integer, SmallInteger, String, Text,
+    BigInteger, func, or_, select, update
+)
+
+from config import settings
+from database import Base, User, db_manager
+from leader_election import make_holder_id, utcnow
+from messages import messages, MessageId
+from rate_limiter import TelegramRateLimiter, telegram_rate_limiter
+
+
+# إعدادات البث
+BROADCAST_CONCURRENCY = getattr(settings, 'BROADCAST_CONCURRENCY', 25)
+BROADCAST_PROGRESS_INTERVAL = getattr(settings, 'BROADCAST_PROGRESS_INTERVAL', 5.0)
+BROADCAST_LEDGER_BATCH_SIZE = getattr(settings, 'BROADCAST_LEDGER_BATCH_SIZE', 500)
+RECIPIENT_PAGE_SIZE = getattr(settings, 'BROADCAST_RECIPIENT_PAGE_SIZE', 1000)
+# المهمة التي لم تحفظ نقطتها (نبضها) خلال هذه المدة تستلمها نسخة أخرى
+BROADCAST_CLAIM_TIMEOUT_SECONDS = getattr(settings, 'BROADCAST_CLAIM_TIMEOUT_SECONDS', 60)
+BROADCAST_CLAIM_POLL_SECONDS = getattr(settings, 'BROADCAST_CLAIM_POLL_SECONDS', 10)
+
+# حالات سجل التسليم (تخزين مضغوط كأعداد صغيرة)
+# المستلم الذي لا يملك سجلاً بعد نقطة الحفظ يعتبر قيد الانتظار
+DELIVERY_PENDING = 0
+DELIVERY_SENT = 1
+DELIVERY_BLOCKED = 2
+DELIVERY_FAILED = 3
+
+# حالات مهمة البث
+JOB_RUNNING = "running"
+JOB_COMPLETED = "completed"
+
+
+class BroadcastJob(Base):
+    """مهمة بث جماعي"""
+    __tablename__ = "broadcast_jobs"
+
+    id = Column(Integer, primary_key=True)
+    message_text = Column(Text, nullable=False)
+    status = Column(String(20), default=JOB_RUNNING, index=True)
+    language = Column(String(5), default="en")
+    admin_chat_id = Column(BigInteger, nullable=True)
+    status_message_id = Column(Integer, nullable=True)
+    total_count = Column(Integer, default=0)
+    sent_count = Column(Integer, default=0)
+    blocked_count = Column(Integer, default=0)
+    failed_count = Column(Integer, default=0)
+    last_user_id = Column(Integer, default=0)
+    # النسخة التي ترسل المهمة حالياً؛ updated_at هو نبضها
+    owner = Column(String(200), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
+
+
+class BroadcastDelivery(Base):
+    """سجل تسليم البث لكل مستلم"""
+    __tablename__ = "broadcast_deliveries"
+
+    job_id = Column(Integer, ForeignKey("broadcast_jobs.id", ondelete="CASCADE"),
+                    primary_key=True)
+    user_id = Column(Integer, primary_key=True)
+    status = Column(SmallInteger, default=DELIVERY_PENDING)
+
+
+class BroadcastProgress:
+    """حالة تقدم البث"""
+
+    __slots__ = ('job_id', 'total', 'sent', 'blocked', 'failed',
+                 'started_at', 'finished_at')
+
+    def __init__(self, job_id: int, total: int = 0):
+        self.job_id = job_id
+        self.total = total
+        self.sent = 0
+        self.blocked = 0
+        self.failed = 0
+        self.started_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def processed(self) -> int:
+        return self.sent + self.blocked + self.failed
+
+    @property
+    def finished(self) -> bool:
+        return self.finished_at is not None
+
+    @property
+    def rate(self) -> float:
+        """عدد الرسائل المعالجة في الثانية"""
+        end = self.finished_at or time.monotonic()
+        elapsed = max(end - self.started_at, 1e-6)
+        return self.processed / elapsed
+
+
+class DeliveryLedger:
+    """مخزن مؤقت لسجل التسليم يكتب على دفعات ويحسب نقطة الحفظ"""
+
+    def __init__(self, job_id: int, checkpoint: int = 0):
+        self.job_id = job_id
+        self.checkpoint = checkpoint
+        self._dispatched: collections.deque = collections.deque()
+        # المستلمون الذين حفظت نتائجهم فعلاً في قاعدة البيانات
+        self._persisted: Set[int] = set()
+        self._buffer: List[Tuple[int, int]] = []
+        self.lock = asyncio.Lock()
+
+    def dispatched(self, user_id: int):
+        """تسجيل إرسال مستلم إلى المرسلين"""
+        self._dispatched.append(user_id)
+
+    def settled(self, user_id: int, status: int):
+        """تسجيل نتيجة الإرسال لمستلم"""
+        self._buffer.append((user_id, status))
+
+    def checkpoint_after(self, rows: List[Tuple[int, int]]) -> int:
+        """نقطة الحفظ إذا نجحت كتابة هذه السجلات (دون تعديل الحالة)"""
+        written = self._persisted.union(user_id for user_id, _ in rows)
+        checkpoint = self.checkpoint
+        for user_id in self._dispatched:
+            if user_id not in written:
+                break
+            checkpoint = user_id
+        return checkpoint
+
+    def persisted(self, rows: List[Tuple[int, int]]) -> int:
+        """تأكيد كتابة السجلات وتقديم نقطة الحفظ"""
+        self._persisted.update(user_id for user_id, _ in rows)
+        return self.advance()
+
+    def restore(self, rows: List[Tuple[int, int]]):
+        """إعادة سجلات فشلت كتابتها إلى المخزن المؤقت"""
+        self._buffer = rows + self._buffer
+
+    def advance(self) -> int:
+        """تقديم نقطة الحفظ إلى آخر مستلم حفظ كل ما قبله"""
+        while self._dispatched and self._dispatched[0] in self._persisted:
+            user_id = self._dispatched.popleft()
+            self._persisted.discard(user_id)
+            self.checkpoint = user_id
+        return self.checkpoint
+
+    @property
+    def pending_writes(self) -> int:
+        return len(self._buffer)
+
+    def drain(self) -> List[Tuple[int, int]]:
+        """سحب السجلات المخزنة مؤقتاً للكتابة"""
+        rows, self._buffer = self._buffer, []
+        return rows
+
+
+class Recipient(NamedTuple):
+    """مستلم البث بأقل قدر من البيانات"""
+    user_id: int
+    telegram_id: int
+    language: Optional[str]
+
+
+async def iter_broadcast_recipients(after_user_id: int = 0,
+                                    page_size: int = RECIPIENT_PAGE_SIZE
+                                    ) -> AsyncIterator[Recipient]:
+    """تدفق المستخدمين النشطين بترقيم حسب المفتاح الأساسي"""
+    last_id = after_user_id
+    while True:
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                select(User.id, User.telegram_id, User.preferred_language)
+                .where(User.is_active == True, User.id > last_id)
+                .order_by(User.id)
+                .limit(page_size)
+            )
+            rows = result.all()
+
+        if not rows:
+            return
+
+        for row in rows:
+            yield Recipient(*row)
+
+        if len(rows) < page_size:
+            return
+        last_id = rows[-1][0]
+
+
+async def count_broadcast_recipients() -> int:
+    """عدد المستخدمين النشطين"""
+    async with db_manager.get_session() as session:
+        result = await session.execute(
+            select(func.count(User.id)).where(User.is_active == True)
+        )
+        return result.scalar() or 0
+
+
+class BroadcastEngine:
+    """محرك البث الجماعي"""
+
+    def __init__(self, limiter: TelegramRateLimiter = None,
+                 concurrency: int = BROADCAST_CONCURRENCY, launch_jobs: bool = True):
+        self.limiter = limiter or telegram_rate_limiter
+        self.concurrency = concurrency
+        # عمليات العمال تنشئ المهمة فقط وتتركها للعملية الرئيسية لتبقى تحت محدد معدل واحد
+        self.launch_jobs = launch_jobs
+        self.logger = logging.getLogger(__name__)
+        self.owner = make_holder_id()
+        self._tasks: Dict[int, asyncio.Task] = {}
+        self._watcher: Optional[asyncio.Task] = None
+        self.jobs: Dict[int, BroadcastProgress] = {}
+
+    async def start(self, bot, text: str, language: str = "en",
+                    admin_chat_id: int = None,
+                    status_message_id: int = None) -> BroadcastProgress:
+        """إنشاء مهمة بث جديدة وتشغيلها في الخلفية"""
+        total = await count_broadcast_recipients()
+
+        async with db_manager.get_session() as session:
+            job = BroadcastJob(
+                message_text=text,
+                language=language,
+                admin_chat_id=admin_chat_id,
+                status_message_id=status_message_id,
+                total_count=total,
+                owner=self.owner if self.launch_jobs else None,
+                updated_at=utcnow()
+            )
+            session.add(job)
+            await session.commit()
+            await session.refresh(job)
+
+        progress = BroadcastProgress(job.id, job.total_count)
+        if not self.launch_jobs:
+            # مراقب العملية الرئيسية يحجز المهمة بلا مالك ويشغلها
+            self.logger.info(f"Broadcast job {job.id} handed off to the main process")
+            return progress
+
+        self._launch(bot, job, progress, self._recipients(job.last_user_id or 0))
+        await self._edit_status(bot, job, progress)
+
+        self.logger.info(f"Broadcast job {job.id} started for {job.total_count} users")
+        return progress
+
+    async def _claim(self, job_id: int) -> bool:
+        """حجز مهمة بلا مالك أو توقف نبض مالكها؛ تحديث شرطي لا ينجح إلا لنسخة واحدة"""
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                update(BroadcastJob)
+                .where(
+                    BroadcastJob.id == job_id,
+                    BroadcastJob.status == JOB_RUNNING,
+                    or_(
+                        BroadcastJob.owner.is_(None),
+                        BroadcastJob.updated_at < utcnow(-BROADCAST_CLAIM_TIMEOUT_SECONDS)
+                    )
+                )
+                .values(owner=self.owner, updated_at=utcnow())
+            )
+            await session.commit()
+            return bool(result.rowcount)
+
+    async def resume_unfinished_jobs(self, bot):
+        """استئناف مهام البث المتروكة من آخر نقطة حفظ بعد حجزها"""
+        try:
+            async with db_manager.get_session() as session:
+                result = await session.execute(
+                    select(BroadcastJob).where(
+                        BroadcastJob.status == JOB_RUNNING,
+                        or_(
+                            BroadcastJob.owner.is_(None),
+                            BroadcastJob.updated_at < utcnow(-BROADCAST_CLAIM_TIMEOUT_SECONDS)
+                        )
+                    )
+                )
+                jobs = result.scalars().all()
+
+            for job in jobs:
+                # المهام الجارية هنا أو التي حجزتها نسخة أخرى أولاً
+                if job.id in self._tasks or not await self._claim(job.id):
+                    continue
+
+                # المستلمون المسجلون بعد نقطة الحفظ تمت معالجتهم مسبقاً
+                async with db_manager.get_session() as session:
+                    result = await session.execute(
+                        select(BroadcastDelivery.user_id).where(
+                            BroadcastDelivery.job_id == job.id,
+                            BroadcastDelivery.user_id > job.last_user_id
+                        )
+                    )
+                    already_settled = set(result.scalars().all())
+
+                progress = BroadcastProgress(job.id, job.total_count)
+                progress.sent = job.sent_count
+                progress.blocked = job.blocked_count
+                progress.failed = job.failed_count
+
+                self._launch(
+                    bot, job, progress,
+                    self._recipients(job.last_user_id or 0, already_settled)
+                )
+                self.logger.info(
+                    f"Resumed broadcast job {job.id} from user {job.last_user_id} "
+                    f"({progress.processed}/{progress.total} processed)"
+                )
+
+        except Exception as e:
+            self.logger.error(f"Error resuming broadcast jobs: {e}")
+
+    async def start_watcher(self, bot):
+        """استئناف المهام المتروكة الآن ثم فحصها دورياً"""
+        await self.resume_unfinished_jobs(bot)
+        if not self._watcher:
+            self._watcher = asyncio.create_task(self._watch(bot))
+
+    async def _watch(self, bot):
+        while True:
+            await asyncio.sleep(BROADCAST_CLAIM_POLL_SECONDS)
+            await self.resume_unfinished_jobs(bot)
+
+    async def _recipients(self, after_user_id: int,
+                          skip: Set[int] = None) -> AsyncIterator[Recipient]:
+        """تدفق المستلمين بعد نقطة الحفظ مع تجاوز من تمت معالجتهم"""
+        skip = skip or set()
+        async for recipient in iter_broadcast_recipients(after_user_id):
+            if recipient.user_id not in skip:
+                yield recipient
+
+    def _launch(self, bot, job: BroadcastJob, progress: BroadcastProgress,
+                recipients: AsyncIterator[Recipient]):
+        """تشغيل مهمة البث في الخلفية"""
+        self.jobs[job.id] = progress
+        ledger = DeliveryLedger(job.id, job.last_user_id or 0)
+
+        task = asyncio.create_task(
+            self._run(bot, job, recipients, progress, ledger)
+        )
+        self._tasks[job.id] = task
+        task.add_done_callback(lambda _: self._tasks.pop(job.id, None))
+
+    async def _run(self, bot, job: BroadcastJob,
+                   recipients: AsyncIterator[Recipient],
+                   progress: BroadcastProgress, ledger: DeliveryLedger):
+        """تشغيل البث عبر مجموعة محدودة من المرسلين"""
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+        workers = [
+            asyncio.create_task(
+                self._worker(bot, job.message_text, queue, progress, ledger)
+            )
+            for _ in range(self.concurrency)
+        ]
+        reporter = asyncio.create_task(self._report(bot, job, progress, ledger))
+        completed = False
+
+        try:
+            async for recipient in recipients:
+                ledger.dispatched(recipient.user_id)
+                await queue.put(recipient)
+
+            # إشارة انتهاء لكل مرسل
+            for _ in workers:
+                await queue.put(None)
+
+            await asyncio.gather(*workers)
+            completed = True
+
+        except asyncio.CancelledError:
+            # إيقاف التشغيل: تبقى المهمة قيد التشغيل لاستئنافها لاحقاً
+            for worker in workers:
+                worker.cancel()
+            raise
+
+        except Exception as e:
+            self.logger.error(f"Error in broadcast job {job.id}: {e}")
+            for worker in workers:
+                worker.cancel()
+
+        finally:
+            reporter.cancel()
+            if completed:
+                progress.finished_at = time.monotonic()
+            await self._checkpoint(job.id, progress, ledger, completed)
+            if completed:
+                await self._edit_status(bot, job, progress)
+                self.logger.info(
+                    f"Broadcast job {job.id} finished: "
+                    f"{progress.sent} sent, {progress.blocked} blocked, "
+                    f"{progress.failed} failed ({progress.rate:.1f} msg/s)"
+                )
+
+    async def _worker(self, bot, text: str, queue: asyncio.Queue,
+                      progress: BroadcastProgress, ledger: DeliveryLedger):
+        """مرسل واحد يسحب المستلمين من الطابور"""
+        while True:
+            item = await queue.get()
+            if item is None:
+                return
+
+            user_id, chat_id = item.user_id, item.telegram_id
+            try:
+                await self.limiter.call(chat_id, bot.send_message,
+                                        chat_id=chat_id, text=text)
+                progress.sent += 1
+                status = DELIVERY_SENT
+
+            except TelegramForbiddenError:
+                # المستخدم حظر البوت
+                progress.blocked += 1
+                status = DELIVERY_BLOCKED
+
+            except Exception as send_error:
+                self.logger.warning(f"Failed to send broadcast to user {chat_id}: {send_error}")
+                progress.failed += 1
+                status = DELIVERY_FAILED
+
+            ledger.settled(user_id, status)
+
+    async def _report(self, bot, job: BroadcastJob, progress: BroadcastProgress,
+                      ledger: DeliveryLedger):
+        """حفظ السجل وإرسال تقارير التقدم بشكل دوري"""
+        last_report = time.monotonic()
+        while True:
+            await asyncio.sleep(0.5)
+
+            # الحماية من الإلغاء حتى لا تضيع دفعة أثناء كتابتها
+            owned = True
+            if ledger.pending_writes >= BROADCAST_LEDGER_BATCH_SIZE:
+                owned = await asyncio.shield(self._checkpoint(job.id, progress, ledger))
+
+            if owned and time.monotonic() - last_report >= BROADCAST_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                owned = await asyncio.shield(self._checkpoint(job.id, progress, ledger))
+                if owned:
+                    await self._edit_status(bot, job, progress)
+
+            if not owned:
+                # استلمت نسخة أخرى المهمة: إيقاف الإرسال هنا
+                task = self._tasks.get(job.id)
+                if task:
+                    task.cancel()
+                return
+
+    async def _checkpoint(self, job_id: int, progress: BroadcastProgress,
+                          ledger: DeliveryLedger, completed: bool = False) -> bool:
+        """كتابة دفعة من سجل التسليم وتحديث نقطة الحفظ؛ False إذا لم تعد المهمة لنا"""
+        async with ledger.lock:
+            return await self._write_checkpoint(job_id, progress, ledger, completed)
+
+    async def _write_checkpoint(self, job_id: int, progress: BroadcastProgress,
+                                ledger: DeliveryLedger, completed: bool) -> bool:
+        rows = ledger.drain()
+        # نقطة الحفظ لا تتجاوز إلا السجلات المكتوبة في نفس المعاملة
+        checkpoint = ledger.checkpoint_after(rows)
+
+        try:
+            async with db_manager.get_session() as session:
+                if rows:
+                    await session.execute(
+                        BroadcastDelivery.__table__.insert(),
+                        [
+                            {'job_id': job_id, 'user_id': user_id, 'status': status}
+                            for user_id, status in rows
+                        ]
+                    )
+
+                values = {
+                    'sent_count': progress.sent,
+                    'blocked_count': progress.blocked,
+                    'failed_count': progress.failed,
+                    'last_user_id': checkpoint,
+                    'updated_at': utcnow()
+                }
+                if completed:
+                    values['status'] = JOB_COMPLETED
+                    values['finished_at'] = datetime.utcnow()
+
+                # التحديث مشروط بملكية المهمة؛ يجدد النبض ويكشف استلام نسخة أخرى لها
+                result = await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.id == job_id, BroadcastJob.owner == self.owner)
+                    .values(**values)
+                )
+                if not result.rowcount:
+                    await session.rollback()
+                    self.logger.warning(
+                        f"Broadcast job {job_id} was claimed by another instance, stopping"
+                    )
+                    return False
+
+                await session.commit()
+
+            ledger.persisted(rows)
+
+        except Exception as e:
+            # تعاد السجلات لتكتب مع نقطة الحفظ التالية
+            ledger.restore(rows)
+            self.logger.error(f"Error saving broadcast checkpoint for job {job_id}: {e}")
+
+        return True
+
+    async def _edit_status(self, bot, job: BroadcastJob, progress: BroadcastProgress):
+        """تحديث رسالة المدير بتقدم البث"""
+        if not job.admin_chat_id or not job.status_message_id:
+            return
+
+        language = job.language or "en"
+        if progress.finished:
+            text = messages.render(
+                MessageId.BROADCAST_SENT,
+                language,
+                sent_count=progress.sent,
+                total_count=progress.total
+            )
+        else:
+            text = messages.render(
+                MessageId.BROADCAST_PROGRESS,
+                language,
+                processed=progress.processed,
+                total=progress.total
+            )
+
+        try:
+            await bot.edit_message_text(
+                chat_id=job.admin_chat_id,
+                message_id=job.status_message_id,
+                text=text
+            )
+        except TelegramBadRequest:
+            # النص لم يتغير
+            pass
+        except Exception as e:
+            self.logger.warning(f"Error reporting broadcast progress: {e}")
+
+    async def stop(self):
+        """إيقاف جميع عمليات البث الجارية مع حفظ نقطة الاستئناف"""
+        if self._watcher:
+            self._watcher.cancel()
+            await asyncio.gather(self._watcher, return_exceptions=True)
+            self._watcher = None
+
+        for task in list(self._tasks.values()):
+            task.cancel()
+        if self._tasks:
+            await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+        # التخلي عن المهام لتستأنفها نسخة أخرى فوراً دون انتظار انتهاء النبض
+        try:
+            async with db_manager.get_session() as session:
+                await session.execute(
+                    update(BroadcastJob)
+                    .where(BroadcastJob.owner == self.owner, BroadcastJob.status == JOB_RUNNING)
+                    .values(owner=None)
+                )
+                await session.commit()
+        except Exception as e:
+            self.logger.warning(f"Could not release broadcast jobs: {e}")
+
+
+# إنشاء مثيل محرك البث العام
+broadcast_engine = BroadcastEngine()
@@ -0,0 +1,218 @@
+"""
+ذاكرة الخطط والقنوات
+Plans and Channels Catalog Cache
+"""
+
+import asyncio
+import logging
+import uuid
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Any, Dict, Mapping, Optional, Tuple
+
+from config import settings
+from database import channel_service, plan_service
+
+
+# إعدادات الفهرس
+CATALOG_PUBSUB_CHANNEL = getattr(settings, 'CATALOG_PUBSUB_CHANNEL', 'catalog:invalidate')
+CATALOG_CHANNEL_TYPES = ("public", "private")
+
+
+@dataclass(frozen=True, slots=True)
+class PlanRecord:
+    """نسخة ثابتة من خطة اشتراك نشطة"""
+    id: int
+    name_ar: str
+    name_en: str
+    description_ar: Optional[str]
+    description_en: Optional[str]
+    price: float
+    currency: str
+    duration_days: int
+
+    def name(self, language: str) -> str:
+        return self.name_ar if language == "ar" else self.name_en
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'name_ar': self.name_ar,
+            'name_en': self.name_en,
+            'description_ar': self.description_ar,
+            'description_en': self.description_en,
+            'price': self.price,
+            'currency': self.currency,
+            'duration_days': self.duration_days
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class ChannelRecord:
+    """نسخة ثابتة من قناة نشطة"""
+    id: int
+    telegram_channel_id: int
+    channel_title: Optional[str]
+    channel_username: Optional[str]
+    channel_type: str
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'channel_title': self.channel_title,
+            'channel_username': self.channel_username
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class CatalogSnapshot:
+    """لقطة كاملة من الفهرس تستبدل دفعة واحدة"""
+    version: int = 0
+    plans: Tuple[PlanRecord, ...] = ()
+    channels: Mapping[str, Tuple[ChannelRecord, ...]] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+    plans_by_id: Mapping[int, PlanRecord] = field(
+        default_factory=lambda: MappingProxyType({})
+    )
+
+    def plan(self, plan_id: int) -> Optional[PlanRecord]:
+        return self.plans_by_id.get(plan_id)
+
+    def channels_of_type(self, channel_type: str) -> Tuple[ChannelRecord, ...]:
+        return self.channels.get(channel_type, ())
+
+
+class Catalog:
+    """فهرس الخطط والقنوات في الذاكرة"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._snapshot = CatalogSnapshot()
+        self._lock = asyncio.Lock()
+        self._redis = None
+        self._listener: Optional[asyncio.Task] = None
+        # تجاهل الإشعارات الصادرة من هذه العملية نفسها
+        self._instance_id = uuid.uuid4().hex
+
+    @property
+    def snapshot(self) -> CatalogSnapshot:
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    def plans(self) -> Tuple[PlanRecord, ...]:
+        return self._snapshot.plans
+
+    def plan(self, plan_id: int) -> Optional[PlanRecord]:
+        return self._snapshot.plan(plan_id)
+
+    def channels_of_type(self, channel_type: str) -> Tuple[ChannelRecord, ...]:
+        return self._snapshot.channels_of_type(channel_type)
+
+    async def load(self):
+        """تحميل الفهرس من قاعدة البيانات واستبدال اللقطة الحالية"""
+        async with self._lock:
+            try:
+                plans = tuple(
+                    PlanRecord(
+                        id=plan.id,
+                        name_ar=plan.name_ar,
+                        name_en=plan.name_en,
+                        description_ar=plan.description_ar,
+                        description_en=plan.description_en,
+                        price=float(plan.price),
+                        currency=plan.currency,
+                        duration_days=plan.duration_days
+                    )
+                    for plan in await plan_service.get_active_plans()
+                )
+
+                channels = {}
+                for channel_type in CATALOG_CHANNEL_TYPES:
+                    channels[channel_type] = tuple(
+                        ChannelRecord(
+                            id=channel.id,
+                            telegram_channel_id=channel.telegram_channel_id,
+                            channel_title=channel.channel_title,
+                            channel_username=channel.channel_username,
+                            channel_type=channel_type
+                        )
+                        for channel in await channel_service.get_channels_by_type(channel_type)
+                    )
+
+                # استبدال المرجع دفعة واحدة؛ القراء يرون اللقطة القديمة أو الجديدة كاملة
+                self._snapshot = CatalogSnapshot(
+                    version=self._snapshot.version + 1,
+                    plans=plans,
+                    channels=MappingProxyType(channels),
+                    plans_by_id=MappingProxyType({plan.id: plan for plan in plans})
+                )
+                self.logger.info(
+                    f"Catalog loaded (version {self.version}, {len(plans)} plans)"
+                )
+
+            except Exception as e:
+                self.logger.error(f"Error loading catalog: {e}")
+
+    async def invalidate(self):
+        """إعادة التحميل بعد تعديل الخطط أو القنوات وإبلاغ النسخ الأخرى"""
+        await self.load()
+
+        if self._redis is not None:
+            try:
+                await self._redis.publish(CATALOG_PUBSUB_CHANNEL, self._instance_id)
+            except Exception as e:
+                self.logger.error(f"Error publishing catalog invalidation: {e}")
+
+    async def start_listener(self, redis_url: Optional[str] = None):
+        """الاستماع لإشعارات التحديث من النسخ الأخرى عبر Redis"""
+        redis_url = redis_url or getattr(settings, 'REDIS_URL', None)
+        if not redis_url or self._listener:
+            return
+
+        try:
+            from redis.asyncio import Redis
+        except ImportError:
+            self.logger.warning("redis package is not installed, catalog sync disabled")
+            return
+
+        self._redis = Redis.from_url(redis_url)
+        self._listener = asyncio.create_task(self._listen())
+
+    async def _listen(self):
+        pubsub = self._redis.pubsub()
+        await pubsub.subscribe(CATALOG_PUBSUB_CHANNEL)
+        try:
+            async for message in pubsub.listen():
+                if message.get('type') != 'message':
+                    continue
+                sender = message.get('data')
+                if isinstance(sender, bytes):
+                    sender = sender.decode()
+                if sender != self._instance_id:
+                    await self.load()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Catalog listener stopped: {e}")
+        finally:
+            await pubsub.unsubscribe(CATALOG_PUBSUB_CHANNEL)
+            await pubsub.close()
+
+    async def stop(self):
+        """إيقاف المستمع وإغلاق الاتصال"""
+        if self._listener:
+            self._listener.cancel()
+            await asyncio.gather(self._listener, return_exceptions=True)
+            self._listener = None
+
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+# إنشاء مثيل الفهرس العام
+catalog = Catalog()
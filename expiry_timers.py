@@ -0,0 +1,174 @@
+"""
+مؤقتات دقيقة لانتهاء الاشتراكات والتذكيرات
+Precise Subscription Expiry and Reminder Timers
+"""
+
+import asyncio
+import heapq
+import logging
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from database import db_manager, Subscription
+from sharding import shard_clause
+
+
+# إعدادات المؤقتات
+REMINDER_LEAD_HOURS = getattr(settings, 'REMINDER_LEAD_HOURS', 24)
+TIMER_HORIZON_HOURS = getattr(settings, 'EXPIRY_TIMER_HORIZON_HOURS', 48)
+TIMER_COALESCE_SECONDS = getattr(settings, 'EXPIRY_TIMER_COALESCE_SECONDS', 1.0)
+TIMER_REFRESH_MINUTES = getattr(settings, 'EXPIRY_TIMER_REFRESH_MINUTES', 15)
+
+# أنواع المواعيد
+DEADLINE_REMIND = 0
+DEADLINE_EXPIRE = 1
+
+BatchCallback = Callable[[List[int]], Awaitable[None]]
+
+
+class ExpiryTimers:
+    """كومة صغرى لمواعيد الانتهاء والتذكير القادمة"""
+
+    def __init__(self, on_expire: BatchCallback, on_remind: BatchCallback,
+                 reminder_lead: timedelta = timedelta(hours=REMINDER_LEAD_HOURS),
+                 horizon: timedelta = timedelta(hours=TIMER_HORIZON_HOURS),
+                 refresh_interval: timedelta = timedelta(minutes=TIMER_REFRESH_MINUTES)):
+        self.on_expire = on_expire
+        self.on_remind = on_remind
+        self.reminder_lead = reminder_lead
+        self.horizon = horizon
+        # إعادة التحميل الدورية تلتقط الاشتراكات المسجلة في نسخ أخرى
+        self.refresh_interval = min(refresh_interval, horizon / 2)
+        self.logger = logging.getLogger(__name__)
+
+        # عناصر الكومة: (الموعد، النوع، معرف الاشتراك، تاريخ الانتهاء)
+        self._heap: List[Tuple[datetime, int, int, datetime]] = []
+        self._end_dates: Dict[int, datetime] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._loaded_until: Optional[datetime] = None
+        self._loaded_at: Optional[datetime] = None
+
+    def __len__(self) -> int:
+        return len(self._end_dates)
+
+    def schedule(self, subscription_id: int, end_date: datetime):
+        """إضافة أو تحديث موعد انتهاء اشتراك"""
+        if self._end_dates.get(subscription_id) == end_date:
+            return
+
+        # الاشتراكات البعيدة تُحمّل لاحقاً عند تمديد الأفق
+        if self._loaded_until and end_date > self._loaded_until:
+            self._end_dates.pop(subscription_id, None)
+            return
+
+        self._end_dates[subscription_id] = end_date
+
+        remind_at = end_date - self.reminder_lead
+        heapq.heappush(self._heap, (remind_at, DEADLINE_REMIND, subscription_id, end_date))
+        heapq.heappush(self._heap, (end_date, DEADLINE_EXPIRE, subscription_id, end_date))
+        self._wakeup.set()
+
+    def cancel(self, subscription_id: int):
+        """إلغاء مواعيد اشتراك (تُحذف من الكومة عند وصولها)"""
+        self._end_dates.pop(subscription_id, None)
+
+    async def load(self):
+        """تحميل الاشتراكات التي تنتهي خلال الأفق الزمني"""
+        until = datetime.utcnow() + self.horizon
+
+        async with db_manager.get_session() as session:
+            from sqlalchemy import select
+
+            result = await session.execute(
+                select(Subscription.id, Subscription.end_date)
+                .where(
+                    Subscription.status == "active",
+                    Subscription.end_date <= until,
+                    shard_clause(Subscription.user_id)
+                )
+            )
+            rows = result.all()
+
+        self._loaded_until = until
+        self._loaded_at = datetime.utcnow()
+        for subscription_id, end_date in rows:
+            self.schedule(subscription_id, end_date)
+
+        self.logger.info(f"Loaded {len(rows)} subscription deadlines until {until}")
+
+    async def start(self):
+        """تحميل المواعيد وبدء حلقة المؤقتات"""
+        await self.load()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف حلقة المؤقتات"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _pop_due(self, now: datetime) -> Tuple[List[int], List[int]]:
+        """سحب المواعيد التي حلت فعلاً؛ الانتهاء يحجز فقط ما end_date <= الآن"""
+        expire_ids, remind_ids = [], []
+
+        while self._heap and self._heap[0][0] <= now:
+            _, kind, subscription_id, end_date = heapq.heappop(self._heap)
+
+            # تجاهل المواعيد القديمة بعد التجديد أو الإلغاء
+            if self._end_dates.get(subscription_id) != end_date:
+                continue
+
+            if kind == DEADLINE_EXPIRE:
+                self._end_dates.pop(subscription_id, None)
+                expire_ids.append(subscription_id)
+            else:
+                remind_ids.append(subscription_id)
+
+        return expire_ids, remind_ids
+
+    def _next_refresh(self) -> datetime:
+        """موعد إعادة تحميل المواعيد من قاعدة البيانات"""
+        return self._loaded_at + self.refresh_interval
+
+    async def _run(self):
+        """حلقة انتظار أقرب موعد"""
+        while True:
+            try:
+                now = datetime.utcnow()
+
+                # تمديد الأفق قبل نفاد المواعيد المحملة
+                if now >= self._next_refresh():
+                    await self.load()
+
+                expire_ids, remind_ids = self._pop_due(now)
+
+                if remind_ids:
+                    await self.on_remind(remind_ids)
+                if expire_ids:
+                    await self.on_expire(expire_ids)
+                if expire_ids or remind_ids:
+                    continue
+
+                # النوم حتى أقرب موعد أو تمديد الأفق أو إضافة موعد جديد؛
+                # الاستيقاظ بعد الموعد بقليل يدمج المواعيد المتقاربة في دفعة واحدة
+                next_refill = self._next_refresh()
+                if self._heap:
+                    next_deadline = self._heap[0][0] + timedelta(seconds=TIMER_COALESCE_SECONDS)
+                else:
+                    next_deadline = next_refill
+                timeout = (min(next_deadline, next_refill) - now).total_seconds()
+
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+                except asyncio.TimeoutError:
+                    pass
+
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error in expiry timers: {e}")
+                await asyncio.sleep(5)
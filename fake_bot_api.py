@@ -0,0 +1,293 @@
+"""
+خادم محلي يحاكي واجهة بوت تلجرام لاختبارات الأداء
+Local Fake Telegram Bot API Server
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+
+# إعدادات افتراضية
+FAKE_API_HOST = "127.0.0.1"
+FAKE_API_PORT = 8090
+FAKE_BOT_ID = 100000001
+WEBHOOK_RETRY_DELAY = 0.5
+WEBHOOK_MAX_CONNECTIONS = 40
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# طرق ترجع رسالة
+MESSAGE_METHODS = ("sendMessage", "editMessageText")
+
+
+class ConflictError(Exception):
+    """تعارض بين getUpdates وwebhook نشط"""
+    pass
+
+
+class FakeBotAPI:
+    """بديل محلي لواجهة البوت مع تأخير وأخطاء 429 قابلة للضبط"""
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0,
+                 rate_limit_ratio: float = 0.0, retry_after: int = 1,
+                 webhook_override: Optional[str] = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        # عنوان التسليم الفعلي بدلاً من العنوان المسجل عبر setWebhook
+        self.webhook_override = webhook_override
+        self.logger = logging.getLogger(__name__)
+
+        self.calls: Counter = Counter()
+        self.rate_limited: Counter = Counter()
+
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._arrived = asyncio.Event()
+        self._message_id = 0
+
+        self._webhook_url: Optional[str] = None
+        self._webhook_secret: Optional[str] = None
+        self._webhook_connections = WEBHOOK_MAX_CONNECTIONS
+        self._delivery: Optional[asyncio.Task] = None
+        self._http: Optional[aiohttp.ClientSession] = None
+
+        self._runner: Optional[web.AppRunner] = None
+        self.host = FAKE_API_HOST
+        self.port = FAKE_API_PORT
+
+    @property
+    def base_url(self) -> str:
+        """العنوان الذي يمرر إلى TelegramAPIServer.from_base"""
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def push_update(self, update: Dict[str, Any]):
+        """إضافة تحديث ليستلمه البوت عبر getUpdates أو webhook"""
+        self._pending.append(update)
+        self._arrived.set()
+
+    async def start(self, host: str = FAKE_API_HOST, port: int = FAKE_API_PORT):
+        """تشغيل الخادم"""
+        self.host = host
+        self.port = port
+
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.router.add_get("/bot{token}/{method}", self.handle)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+        self.logger.info(f"Fake Bot API listening on {self.base_url}")
+
+    async def stop(self):
+        """إيقاف التسليم والخادم"""
+        await self._stop_delivery()
+
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        """قراءة معاملات الطلب (نموذج أو JSON) كما يرسلها aiogram"""
+        if request.content_type == "application/json":
+            return await request.json()
+
+        params = {}
+        for key, value in (await request.post()).items():
+            if not isinstance(value, str):
+                continue
+            # القيم المركبة ترسل كنص JSON
+            try:
+                params[key] = json.loads(value)
+            except ValueError:
+                params[key] = value
+        return params
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """تنفيذ طريقة واحدة من واجهة البوت"""
+        method = request.match_info["method"]
+        params = await self._params(request)
+        self.calls[method] += 1
+
+        if method != "getUpdates":
+            delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+            if delay:
+                await asyncio.sleep(delay / 1000)
+
+            if self.rate_limit_ratio and random.random() < self.rate_limit_ratio:
+                self.rate_limited[method] += 1
+                return web.json_response({
+                    'ok': False,
+                    'error_code': 429,
+                    'description': f"Too Many Requests: retry after {self.retry_after}",
+                    'parameters': {'retry_after': self.retry_after}
+                }, status=429)
+
+        try:
+            result = await self._dispatch(method, params)
+        except ConflictError as e:
+            return web.json_response(
+                {'ok': False, 'error_code': 409, 'description': str(e)}, status=409
+            )
+
+        return web.json_response({'ok': True, 'result': result})
+
+    async def _dispatch(self, method: str, params: Dict[str, Any]) -> Any:
+        if method in MESSAGE_METHODS:
+            return self._message(params)
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "setWebhook":
+            await self._set_webhook(params)
+        elif method == "deleteWebhook":
+            await self._stop_delivery()
+        elif method == "getMe":
+            return self._bot_user()
+        elif method == "getChat":
+            return self._chat(int(params.get('chat_id', 0)))
+        elif method == "createChatInviteLink":
+            return {
+                'invite_link': f"https://t.me/+benchmark{self.calls[method]}",
+                'creator': self._bot_user(),
+                'creates_join_request': False,
+                'is_primary': False,
+                'is_revoked': False
+            }
+        # الطرق الأخرى (answerCallbackQuery, banChatMember, ...) تنجح دون نتيجة
+        return True
+
+    def _message(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        message_id = params.get('message_id')
+        if message_id is None:
+            self._message_id += 1
+            message_id = self._message_id
+
+        return {
+            'message_id': int(message_id),
+            'date': int(time.time()),
+            'chat': self._chat(int(params.get('chat_id', 0))),
+            'from': self._bot_user(),
+            'text': params.get('text', '')
+        }
+
+    def _bot_user(self) -> Dict[str, Any]:
+        return {
+            'id': FAKE_BOT_ID,
+            'is_bot': True,
+            'first_name': "Benchmark",
+            'username': "benchmark_bot"
+        }
+
+    def _chat(self, chat_id: int) -> Dict[str, Any]:
+        if chat_id < 0:
+            return {
+                'id': chat_id,
+                'type': "channel",
+                'title': f"Channel {chat_id}",
+                'accent_color_id': 0,
+                'max_reaction_count': 0
+            }
+        return {
+            'id': chat_id,
+            'type': "private",
+            'first_name': f"User {chat_id}",
+            'accent_color_id': 0,
+            'max_reaction_count': 0
+        }
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """استطلاع طويل: تأكيد ما قبل offset ثم انتظار تحديثات جديدة"""
+        if self._webhook_url:
+            raise ConflictError("Conflict: can't use getUpdates method while webhook is active")
+
+        offset = int(params.get('offset', 0) or 0)
+        limit = int(params.get('limit', 100) or 100)
+        timeout = float(params.get('timeout', 0) or 0)
+
+        while self._pending and self._pending[0]['update_id'] < offset:
+            self._pending.popleft()
+
+        if not self._pending and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+        return [self._pending[index] for index in range(min(limit, len(self._pending)))]
+
+    async def _set_webhook(self, params: Dict[str, Any]):
+        """تسجيل webhook وبدء تسليم التحديثات إليه"""
+        await self._stop_delivery()
+
+        self._webhook_url = self.webhook_override or params.get('url')
+        self._webhook_secret = params.get('secret_token')
+        self._webhook_connections = int(
+            params.get('max_connections') or WEBHOOK_MAX_CONNECTIONS
+        )
+        self._http = aiohttp.ClientSession()
+        self._delivery = asyncio.create_task(self._deliver_webhooks())
+        self.logger.info(f"Delivering updates to {self._webhook_url}")
+
+    async def _stop_delivery(self):
+        self._webhook_url = None
+        if self._delivery:
+            self._delivery.cancel()
+            await asyncio.gather(self._delivery, return_exceptions=True)
+            self._delivery = None
+        if self._http:
+            await self._http.close()
+            self._http = None
+
+    async def _deliver_webhooks(self):
+        """إرسال التحديثات المنتظرة بعدد اتصالات محدود"""
+        semaphore = asyncio.Semaphore(self._webhook_connections)
+        in_flight = set()
+
+        async def post(update: Dict[str, Any]):
+            headers = {}
+            if self._webhook_secret:
+                headers[SECRET_TOKEN_HEADER] = self._webhook_secret
+            try:
+                while True:
+                    try:
+                        async with self._http.post(
+                            self._webhook_url, json=update, headers=headers
+                        ) as response:
+                            if response.status == 200:
+                                return
+                            self.logger.debug(f"Webhook returned {response.status}, retrying")
+                    except aiohttp.ClientError as e:
+                        self.logger.debug(f"Webhook delivery failed: {e}")
+                    await asyncio.sleep(WEBHOOK_RETRY_DELAY)
+            finally:
+                semaphore.release()
+
+        try:
+            while True:
+                if not self._pending:
+                    self._arrived.clear()
+                    await self._arrived.wait()
+                    continue
+
+                await semaphore.acquire()
+                task = asyncio.create_task(post(self._pending.popleft()))
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            await asyncio.gather(*in_flight, return_exceptions=True)
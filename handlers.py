@@ -5,7 +5,6 @@ Message Handlers for Users and Administration
 
 import asyncio
 import logging
-from datetime import datetime, timedelta
 from typing import Dict, Any, Optional, List
 
 from aiogram import Router, F
@@ -16,14 +15,19 @@ from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 
 from config import settings
-from database import (
-    user_service, subscription_service, channel_service, 
-    plan_service, db_manager
-)
-from localization import translator, get_user_language, message_formatter
+from database import user_service, subscription_service
+from localization import get_user_language, message_formatter
 from keyboards import keyboard_manager
 from payments import payment_manager
-from scheduler import bot_scheduler
+from broadcast import broadcast_engine
+from user_cache import user_cache
+from middlewares import UserDataMiddleware, AdminOnlyMiddleware
+from stats_counters import stats_counters
+from rollups import rollup_manager
+from metrics import HandlerMetricsMiddleware
+from profiler import db_profiler, ProfilingMiddleware
+from render_cache import render_cache
+from messages import messages, MessageId
 
 
 # إعداد التسجيل
@@ -35,6 +39,11 @@ admin_router = Router()
 payment_router = Router()
 
 
+def error_text(user_data: Dict[str, Any], message_id: MessageId = MessageId.ERROR_GENERIC) -> str:
+    """نص الخطأ بلغة المستخدم"""
+    return messages.render(message_id, (user_data or {}).get('preferred_language') or 'en')
+
+
 # حالات المحادثة
 class UserStates(StatesGroup):
     waiting_for_language = State()
@@ -53,15 +62,7 @@ class BotHandlers:
     
     async def get_user_data(self, telegram_user) -> Dict[str, Any]:
         """الحصول على بيانات المستخدم"""
-        user = await user_service.create_or_update_user(telegram_user)
-        return {
-            'id': user.id,
-            'telegram_id': user.telegram_id,
-            'preferred_language': user.preferred_language,
-            'is_admin': user.is_admin,
-            'username': user.username,
-            'first_name': user.first_name
-        }
+        return await user_cache.get_user_data(telegram_user)
     
     async def send_main_menu(self, chat_id: int, user_data: Dict[str, Any], 
                            message_id: int = None):
@@ -69,39 +70,36 @@ class BotHandlers:
         language = user_data.get('preferred_language', 'en')
         is_admin = user_data.get('is_admin', False)
         
-        text = translator.get_text('main_menu', language)
-        keyboard = keyboard_manager.get_main_menu_keyboard(language, is_admin)
+        screen = render_cache.main_menu(language, is_admin)
         
         if message_id:
             await self.bot.edit_message_text(
                 chat_id=chat_id,
                 message_id=message_id,
-                text=text,
-                reply_markup=keyboard
+                text=screen.text,
+                reply_markup=screen.reply_markup
             )
         else:
             await self.bot.send_message(
                 chat_id=chat_id,
-                text=text,
-                reply_markup=keyboard
+                text=screen.text,
+                reply_markup=screen.reply_markup
             )
 
 
 # معالجات المستخدمين العاديين
 @user_router.message(Command("start"))
-async def start_command(message: Message, state: FSMContext):
+async def start_command(message: Message, state: FSMContext, user_data: Dict[str, Any]):
     """معالج أمر البداية"""
     try:
         handlers = BotHandlers(message.bot)
-        user_data = await handlers.get_user_data(message.from_user)
         
         # التحقق من وجود لغة محفوظة
         if not user_data.get('preferred_language'):
             # عرض اختيار اللغة
-            text = translator.get_text('start', 'en')
-            keyboard = keyboard_manager.get_language_selection_keyboard()
+            screen = render_cache.language_selection()
             
-            await message.answer(text, reply_markup=keyboard)
+            await message.answer(screen.text, reply_markup=screen.reply_markup)
             await state.set_state(UserStates.waiting_for_language)
         else:
             # عرض القائمة الرئيسية مباشرة
@@ -109,24 +107,24 @@ async def start_command(message: Message, state: FSMContext):
             
     except Exception as e:
         logger.error(f"Error in start command: {e}")
-        await message.answer("❌ حدث خطأ. يرجى المحاولة مرة أخرى.")
+        await message.answer(error_text(user_data, MessageId.ERROR_RETRY))
 
 
 @user_router.callback_query(F.data.startswith("lang_"))
-async def language_selection(callback: CallbackQuery, state: FSMContext):
+async def language_selection(callback: CallbackQuery, state: FSMContext, user_data: Dict[str, Any]):
     """معالج اختيار اللغة"""
     try:
         language = callback.data.split("_")[1]
         
         # تحديث لغة المستخدم
-        await user_service.update_user_language(callback.from_user.id, language)
+        await user_cache.update_user_language(callback.from_user.id, language)
         
         # الحصول على بيانات المستخدم المحدثة
         handlers = BotHandlers(callback.bot)
         user_data = await handlers.get_user_data(callback.from_user)
         
         # إرسال رسالة التأكيد
-        success_message = translator.get_text('success_language_changed', language)
+        success_message = messages.render(MessageId.LANGUAGE_CHANGED, language)
         await callback.message.edit_text(success_message)
         
         # إرسال القائمة الرئيسية
@@ -138,15 +136,14 @@ async def language_selection(callback: CallbackQuery, state: FSMContext):
         
     except Exception as e:
         logger.error(f"Error in language selection: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data == "main_menu")
-async def main_menu_callback(callback: CallbackQuery):
+async def main_menu_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """العودة للقائمة الرئيسية"""
     try:
         handlers = BotHandlers(callback.bot)
-        user_data = await handlers.get_user_data(callback.from_user)
         
         await handlers.send_main_menu(
             callback.message.chat.id, 
@@ -158,130 +155,73 @@ async def main_menu_callback(callback: CallbackQuery):
         
     except Exception as e:
         logger.error(f"Error in main menu callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data == "free_channels")
-async def free_channels_callback(callback: CallbackQuery):
+async def free_channels_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """عرض القنوات المجانية"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
-        # الحصول على القنوات المجانية
-        free_channels = await channel_service.get_channels_by_type("public")
-        
-        if free_channels:
-            text = translator.get_text('free_channels_list', language)
-            keyboard = keyboard_manager.get_free_channels_keyboard(
-                [
-                    {
-                        'id': ch.id,
-                        'channel_title': ch.channel_title,
-                        'channel_username': ch.channel_username
-                    }
-                    for ch in free_channels
-                ],
-                language
-            )
-        else:
-            text = "📭 لا توجد قنوات مجانية متاحة حالياً." if language == "ar" else "📭 No free channels available at the moment."
-            keyboard = keyboard_manager.get_main_menu_keyboard(language, user_data.get('is_admin', False))
+        # القنوات المجانية من الفهرس في الذاكرة
+        screen = render_cache.free_channels(language, user_data.get('is_admin', False))
         
-        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.message.edit_text(screen.text, reply_markup=screen.reply_markup)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in free channels callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data == "paid_subscriptions")
-async def paid_subscriptions_callback(callback: CallbackQuery):
+async def paid_subscriptions_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """عرض الاشتراكات المدفوعة"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
-        # الحصول على خطط الاشتراك النشطة
-        plans = await plan_service.get_active_plans()
+        # خطط الاشتراك النشطة من الفهرس في الذاكرة
+        screen = render_cache.subscription_plans(language, user_data.get('is_admin', False))
         
-        if plans:
-            text = translator.get_text('subscription_plans', language)
-            keyboard = keyboard_manager.get_subscription_plans_keyboard(
-                [
-                    {
-                        'id': plan.id,
-                        'name_ar': plan.name_ar,
-                        'name_en': plan.name_en,
-                        'price': float(plan.price),
-                        'currency': plan.currency
-                    }
-                    for plan in plans
-                ],
-                language
-            )
-        else:
-            text = "📭 لا توجد خطط اشتراك متاحة حالياً." if language == "ar" else "📭 No subscription plans available at the moment."
-            keyboard = keyboard_manager.get_main_menu_keyboard(language, user_data.get('is_admin', False))
-        
-        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.message.edit_text(screen.text, reply_markup=screen.reply_markup)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in paid subscriptions callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data.startswith("select_plan_"))
-async def select_plan_callback(callback: CallbackQuery):
+async def select_plan_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """اختيار خطة الاشتراك"""
     try:
         plan_id = int(callback.data.split("_")[2])
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
-        # الحصول على تفاصيل الخطة
-        plan = await plan_service.get_plan_by_id(plan_id)
+        # تفاصيل الخطة وطرق الدفع من الفهرس
+        screen = render_cache.plan_details(plan_id, language)
         
-        if not plan:
-            await callback.answer("❌ خطة غير صحيحة", show_alert=True)
+        if not screen:
+            await callback.answer(error_text(user_data, MessageId.INVALID_PLAN), show_alert=True)
             return
         
-        # عرض تفاصيل الخطة وطرق الدفع
-        plan_details = message_formatter.format_subscription_plan(
-            {
-                'name_ar': plan.name_ar,
-                'name_en': plan.name_en,
-                'description_ar': plan.description_ar,
-                'description_en': plan.description_en,
-                'price': float(plan.price),
-                'currency': plan.currency,
-                'duration_days': plan.duration_days
-            },
-            language
-        )
-        
-        text = f"{plan_details}\n\n{translator.get_text('payment_instructions', language)}"
-        keyboard = keyboard_manager.get_payment_methods_keyboard(plan_id, language)
-        
-        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.message.edit_text(screen.text, reply_markup=screen.reply_markup)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in select plan callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data.startswith("pay_"))
-async def payment_callback(callback: CallbackQuery):
+async def payment_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """معالج الدفع"""
     try:
         parts = callback.data.split("_")
         provider = parts[1]  # stripe أو paypal
         plan_id = int(parts[2])
         
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
         # إنشاء الدفع
@@ -292,10 +232,15 @@ async def payment_callback(callback: CallbackQuery):
         )
         
         # إرسال رابط الدفع
-        text = f"{translator.get_text('payment_processing', language)}\n\n"
-        text += f"💰 المبلغ: {payment_data['amount']} {payment_data['currency']}\n"
-        text += f"📋 الخطة: {payment_data['plan_name']}\n\n"
-        text += f"🔗 [اضغط هنا للدفع]({payment_data['payment_url']})"
+        text = f"{messages.render(MessageId.PAYMENT_PROCESSING, language)}\n\n"
+        text += messages.render(
+            MessageId.PAYMENT_DETAILS,
+            language,
+            amount=payment_data['amount'],
+            currency=payment_data['currency'],
+            plan_name=payment_data['plan_name'],
+            payment_url=payment_data['payment_url']
+        )
         
         await callback.message.edit_text(
             text,
@@ -303,25 +248,24 @@ async def payment_callback(callback: CallbackQuery):
             disable_web_page_preview=True
         )
         
-        await callback.answer("تم إنشاء رابط الدفع!" if language == "ar" else "Payment link created!")
+        await callback.answer(messages.render(MessageId.PAYMENT_LINK_CREATED, language))
         
     except Exception as e:
         logger.error(f"Error in payment callback: {e}")
-        await callback.answer("❌ فشل في إنشاء الدفع", show_alert=True)
+        await callback.answer(error_text(user_data, MessageId.PAYMENT_FAILED), show_alert=True)
 
 
 @user_router.callback_query(F.data == "my_subscriptions")
-async def my_subscriptions_callback(callback: CallbackQuery):
+async def my_subscriptions_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """عرض اشتراكات المستخدم"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
         # الحصول على اشتراكات المستخدم
         subscriptions = await subscription_service.get_user_subscriptions(user_data['id'])
         
         if subscriptions:
-            text = "📊 اشتراكاتي:\n\n" if language == "ar" else "📊 My Subscriptions:\n\n"
+            text = messages.render(MessageId.MY_SUBSCRIPTIONS_HEADER, language)
             
             for sub in subscriptions:
                 sub_details = message_formatter.format_subscription_status(
@@ -334,132 +278,94 @@ async def my_subscriptions_callback(callback: CallbackQuery):
                 )
                 text += f"{sub_details}\n\n"
         else:
-            text = translator.get_text('no_active_subscriptions', language)
+            text = messages.render(MessageId.NO_ACTIVE_SUBSCRIPTIONS, language)
         
-        keyboard = keyboard_manager.get_main_menu_keyboard(language, user_data.get('is_admin', False))
+        keyboard = render_cache.main_menu(language, user_data.get('is_admin', False)).reply_markup
         
         await callback.message.edit_text(text, reply_markup=keyboard)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in my subscriptions callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @user_router.callback_query(F.data == "settings")
-async def settings_callback(callback: CallbackQuery):
+async def settings_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """إعدادات المستخدم"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
         language = user_data.get('preferred_language', 'en')
         
-        text = translator.get_text('btn_settings', language)
-        keyboard = keyboard_manager.get_settings_keyboard(language)
+        screen = render_cache.settings(language)
         
-        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.message.edit_text(screen.text, reply_markup=screen.reply_markup)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in settings callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 # معالجات الإدارة
 @admin_router.callback_query(F.data == "admin_panel")
-async def admin_panel_callback(callback: CallbackQuery):
+async def admin_panel_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """لوحة التحكم الإدارية"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
-        
-        # التحقق من صلاحية المدير
-        if not user_data.get('is_admin', False):
-            await callback.answer(
-                translator.get_text('access_denied', user_data.get('preferred_language', 'en')),
-                show_alert=True
-            )
-            return
-        
         language = user_data.get('preferred_language', 'en')
-        text = translator.get_text('admin_welcome', language)
-        keyboard = keyboard_manager.get_admin_panel_keyboard(language)
+        screen = render_cache.admin_panel(language)
         
-        await callback.message.edit_text(text, reply_markup=keyboard)
+        await callback.message.edit_text(screen.text, reply_markup=screen.reply_markup)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in admin panel callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @admin_router.callback_query(F.data == "admin_stats")
-async def admin_stats_callback(callback: CallbackQuery):
+async def admin_stats_callback(callback: CallbackQuery, user_data: Dict[str, Any]):
     """إحصائيات البوت"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
-        
-        if not user_data.get('is_admin', False):
-            await callback.answer("❌ غير مصرح", show_alert=True)
-            return
-        
         language = user_data.get('preferred_language', 'en')
         
-        # حساب الإحصائيات
-        total_users = await user_service.get_users_count()
-        active_subscriptions = len(await subscription_service.get_active_subscriptions())
-        
-        # حساب الإيرادات اليومية
-        today = datetime.now().date()
-        async with db_manager.get_session() as session:
-            from sqlalchemy import select, func
-            from database import Payment
-            
-            revenue_result = await session.execute(
-                select(func.sum(Payment.amount))
-                .where(
-                    func.date(Payment.completed_at) == today,
-                    Payment.status == "completed"
-                )
-            )
-            daily_revenue = float(revenue_result.scalar() or 0)
-            
-            # المستخدمين الجدد اليوم
-            new_users_result = await session.execute(
-                select(func.count(User.id))
-                .where(func.date(User.registration_date) == today)
-            )
-            new_users_today = new_users_result.scalar() or 0
+        # الإحصائيات من العدادات المحدثة تدريجياً
+        stats = stats_counters.snapshot()
         
-        text = translator.get_text(
-            'admin_stats',
+        text = messages.render(
+            MessageId.ADMIN_STATS,
             language,
-            total_users=total_users,
-            active_subscriptions=active_subscriptions,
-            daily_revenue=daily_revenue,
-            new_users_today=new_users_today
+            total_users=stats['total_users'],
+            active_subscriptions=stats['active_subscriptions'],
+            daily_revenue=stats['daily_revenue'],
+            new_users_today=stats['new_users_today']
         )
         
-        keyboard = keyboard_manager.get_admin_panel_keyboard(language)
+        # الإيرادات الشهرية ومعدل التجديد من جداول التجميع
+        summary = await rollup_manager.get_summary()
+        if summary:
+            text += messages.render(
+                MessageId.ROLLUP_SUMMARY,
+                language,
+                mrr=summary['mrr'],
+                renewal_rate=summary['renewal_rate']
+            )
+        
+        keyboard = render_cache.admin_panel(language).reply_markup
         
         await callback.message.edit_text(text, reply_markup=keyboard)
         await callback.answer()
         
     except Exception as e:
         logger.error(f"Error in admin stats callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @admin_router.callback_query(F.data == "admin_broadcast")
-async def admin_broadcast_callback(callback: CallbackQuery, state: FSMContext):
+async def admin_broadcast_callback(callback: CallbackQuery, state: FSMContext, user_data: Dict[str, Any]):
     """البث الجماعي"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
-        
-        if not user_data.get('is_admin', False):
-            await callback.answer("❌ غير مصرح", show_alert=True)
-            return
-        
         language = user_data.get('preferred_language', 'en')
-        text = translator.get_text('broadcast_prompt', language)
+        text = messages.render(MessageId.BROADCAST_PROMPT, language)
         
         await callback.message.edit_text(text)
         await state.set_state(UserStates.waiting_for_broadcast_message)
@@ -467,19 +373,13 @@ async def admin_broadcast_callback(callback: CallbackQuery, state: FSMContext):
         
     except Exception as e:
         logger.error(f"Error in admin broadcast callback: {e}")
-        await callback.answer("❌ حدث خطأ", show_alert=True)
+        await callback.answer(error_text(user_data), show_alert=True)
 
 
 @admin_router.message(StateFilter(UserStates.waiting_for_broadcast_message))
-async def process_broadcast_message(message: Message, state: FSMContext):
+async def process_broadcast_message(message: Message, state: FSMContext, user_data: Dict[str, Any]):
     """معالجة رسالة البث"""
     try:
-        user_data = await BotHandlers(message.bot).get_user_data(message.from_user)
-        
-        if not user_data.get('is_admin', False):
-            await message.answer("❌ غير مصرح")
-            return
-        
         language = user_data.get('preferred_language', 'en')
         broadcast_text = message.text
         
@@ -488,8 +388,8 @@ async def process_broadcast_message(message: Message, state: FSMContext):
         
         # عرض تأكيد البث
         user_count = await user_service.get_users_count()
-        confirm_text = translator.get_text(
-            'broadcast_confirm',
+        confirm_text = messages.render(
+            MessageId.BROADCAST_CONFIRM,
             language,
             user_count=user_count
         )
@@ -497,80 +397,75 @@ async def process_broadcast_message(message: Message, state: FSMContext):
         keyboard = keyboard_manager.get_broadcast_confirmation_keyboard(language)
         
         await message.answer(
-            f"{confirm_text}\n\n📝 الرسالة:\n{broadcast_text}",
+            messages.render(
+                MessageId.BROADCAST_PREVIEW,
+                language,
+                confirm_text=confirm_text,
+                broadcast_text=broadcast_text
+            ),
             reply_markup=keyboard
         )
         
     except Exception as e:
         logger.error(f"Error processing broadcast message: {e}")
-        await message.answer("❌ حدث خطأ")
+        await message.answer(error_text(user_data))
 
 
 @admin_router.callback_query(F.data == "admin_send_broadcast")
-async def send_broadcast_callback(callback: CallbackQuery, state: FSMContext):
+async def send_broadcast_callback(callback: CallbackQuery, state: FSMContext, user_data: Dict[str, Any]):
     """إرسال البث الجماعي"""
     try:
-        user_data = await BotHandlers(callback.bot).get_user_data(callback.from_user)
-        
-        if not user_data.get('is_admin', False):
-            await callback.answer("❌ غير مصرح", show_alert=True)
-            return
-        
         # الحصول على الرسالة من الحالة
         state_data = await state.get_data()
         broadcast_message = state_data.get('broadcast_message')
         
         if not broadcast_message:
-            await callback.answer("❌ لم يتم العثور على الرسالة", show_alert=True)
+            await callback.answer(
+                error_text(user_data, MessageId.BROADCAST_MESSAGE_NOT_FOUND), show_alert=True
+            )
             return
         
         language = user_data.get('preferred_language', 'en')
         
-        # الحصول على جميع المستخدمين
-        all_users = await user_service.get_all_users(active_only=True)
-        
-        sent_count = 0
-        total_count = len(all_users)
-        
-        # إرسال الرسالة لجميع المستخدمين
-        for user in all_users:
-            try:
-                await callback.bot.send_message(
-                    chat_id=user.telegram_id,
-                    text=broadcast_message
-                )
-                sent_count += 1
-                
-                # تأخير قصير لتجنب حدود التلجرام
-                await asyncio.sleep(0.1)
-                
-            except Exception as send_error:
-                logger.warning(f"Failed to send broadcast to user {user.telegram_id}: {send_error}")
-                continue
-        
-        # إرسال تقرير النتائج
-        result_text = translator.get_text(
-            'broadcast_sent',
-            language,
-            sent_count=sent_count,
-            total_count=total_count
+        # تشغيل البث في الخلفية دون حجز المعالج
+        await broadcast_engine.start(
+            callback.bot,
+            broadcast_message,
+            language=language,
+            admin_chat_id=callback.message.chat.id,
+            status_message_id=callback.message.message_id
         )
         
-        await callback.message.edit_text(result_text)
         await state.clear()
-        await callback.answer("تم إرسال البث!" if language == "ar" else "Broadcast sent!")
+        await callback.answer(messages.render(MessageId.BROADCAST_STARTED, language))
         
     except Exception as e:
         logger.error(f"Error sending broadcast: {e}")
-        await callback.answer("❌ فشل في إرسال البث", show_alert=True)
+        await callback.answer(error_text(user_data, MessageId.BROADCAST_FAILED), show_alert=True)
 
 
 # دالة تهيئة المعالجات
 def setup_handlers(dp, bot_instance):
     """تهيئة جميع المعالجات"""
     
-    # إعداد المجدول
-    bot_scheduler.bot = bot_instance
+    # تحليل استعلامات كل تحديث عند تفعيله
+    if db_profiler.enabled:
+        dp.update.outer_middleware(ProfilingMiddleware())
+        for router in (user_router, admin_router, payment_router):
+            router.message.middleware(ProfilingMiddleware())
+            router.callback_query.middleware(ProfilingMiddleware())
+    
+    # تحميل بيانات المستخدم مرة واحدة لكل تحديث
+    dp.update.outer_middleware(UserDataMiddleware())
+    
+    # قياس زمن كل معالج
+    for router in (user_router, admin_router, payment_router):
+        router.message.middleware(HandlerMetricsMiddleware())
+        router.callback_query.middleware(HandlerMetricsMiddleware())
+    
+    # منع غير المديرين قبل تنفيذ معالجات الإدارة
+    admin_router.message.middleware(AdminOnlyMiddleware())
+    admin_router.callback_query.middleware(AdminOnlyMiddleware())
     
     # تسجيل الموجهات
     dp.include_router(user_router)
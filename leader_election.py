@@ -0,0 +1,253 @@
+"""
+انتخاب القائد بين نسخ البوت المتعددة
+Leader Election Between Bot Replicas
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, String, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from config import settings
+from database import Base, db_manager
+
+
+# إعدادات الانتخاب
+LEADER_LEASE_SECONDS = getattr(settings, 'LEADER_LEASE_SECONDS', 30)
+LEADER_ELECTION_BACKEND = getattr(settings, 'LEADER_ELECTION_BACKEND', 'database')
+
+
+class SchedulerLease(Base):
+    """صف القفل الذي يحدد القائد الحالي"""
+    __tablename__ = "scheduler_leases"
+
+    name = Column(String(100), primary_key=True)
+    holder = Column(String(200), nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+
+class utcnow(FunctionElement):
+    """الوقت الحالي بتوقيت UTC من ساعة قاعدة البيانات (مع إزاحة اختيارية بالثواني)
+
+    كل النسخ تقارن بنفس الساعة فلا يؤدي اختلاف ساعات الخوادم إلى قائدين
+    """
+    type = DateTime()
+    # الإزاحة تكتب في نص الاستعلام فلا يعاد استخدام نسخة مخزنة بإزاحة أخرى
+    inherit_cache = False
+
+    def __init__(self, offset: float = 0):
+        self.offset = float(offset)
+        super().__init__()
+
+
+@compiles(utcnow)
+def _utcnow_default(element, compiler, **kw):
+    if not element.offset:
+        return "CURRENT_TIMESTAMP"
+    return f"(CURRENT_TIMESTAMP + INTERVAL '{element.offset:g}' SECOND)"
+
+
+@compiles(utcnow, "postgresql")
+def _utcnow_postgresql(element, compiler, **kw):
+    now = "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+    if not element.offset:
+        return now
+    return f"({now} + INTERVAL '{element.offset:g} seconds')"
+
+
+@compiles(utcnow, "sqlite")
+def _utcnow_sqlite(element, compiler, **kw):
+    # نفس صيغة النص التي يخزن بها SQLAlchemy التواريخ في SQLite
+    return f"STRFTIME('%Y-%m-%d %H:%M:%f', 'now', '{element.offset:+g} seconds')"
+
+
+@compiles(utcnow, "mysql")
+def _utcnow_mysql(element, compiler, **kw):
+    return f"(UTC_TIMESTAMP(6) + INTERVAL {element.offset:g} SECOND)"
+
+
+def make_holder_id() -> str:
+    """معرف فريد لهذه النسخة"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class DatabaseLease:
+    """عقد إيجار محفوظ كصف في قاعدة البيانات"""
+
+    def __init__(self, name: str, holder: str = None,
+                 ttl: float = LEADER_LEASE_SECONDS):
+        self.name = name
+        self.holder = holder or make_holder_id()
+        self.ttl = timedelta(seconds=ttl)
+
+    async def acquire(self) -> bool:
+        """الحصول على العقد أو تجديده (بساعة قاعدة البيانات)"""
+        expires_at = utcnow(self.ttl.total_seconds())
+
+        async with db_manager.get_session() as session:
+            # تجديد عقدنا أو الاستيلاء على عقد منتهي
+            result = await session.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    or_(
+                        SchedulerLease.holder == self.holder,
+                        SchedulerLease.expires_at < utcnow()
+                    )
+                )
+                .values(holder=self.holder, expires_at=expires_at)
+            )
+            if result.rowcount:
+                await session.commit()
+                return True
+
+            # إنشاء العقد إذا لم يكن موجوداً
+            try:
+                session.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.holder,
+                    expires_at=expires_at
+                ))
+                await session.commit()
+                return True
+            except IntegrityError:
+                await session.rollback()
+                return False
+
+    async def release(self):
+        """التخلي عن العقد ليستلمه غيرنا فوراً"""
+        async with db_manager.get_session() as session:
+            await session.execute(
+                update(SchedulerLease)
+                .where(
+                    SchedulerLease.name == self.name,
+                    SchedulerLease.holder == self.holder
+                )
+                .values(expires_at=utcnow())
+            )
+            await session.commit()
+
+
+class LocalLease:
+    """عقد إيجار داخل العملية للاختبارات والتشغيل المنفرد"""
+
+    _leases: Dict[str, Tuple[str, datetime]] = {}
+
+    def __init__(self, name: str, holder: str = None,
+                 ttl: float = LEADER_LEASE_SECONDS):
+        self.name = name
+        self.holder = holder or make_holder_id()
+        self.ttl = timedelta(seconds=ttl)
+
+    async def acquire(self) -> bool:
+        now = datetime.utcnow()
+        current = self._leases.get(self.name)
+        if current and current[0] != self.holder and current[1] >= now:
+            return False
+        self._leases[self.name] = (self.holder, now + self.ttl)
+        return True
+
+    async def release(self):
+        current = self._leases.get(self.name)
+        if current and current[0] == self.holder:
+            del self._leases[self.name]
+
+
+def create_lease(name: str):
+    """إنشاء العقد حسب الإعدادات"""
+    if LEADER_ELECTION_BACKEND == 'local':
+        return LocalLease(name)
+    return DatabaseLease(name)
+
+
+LeadershipCallback = Callable[[], Awaitable[None]]
+
+
+class LeaderElector:
+    """حلقة تجديد العقد وتنبيه المجدول عند تغير القيادة"""
+
+    def __init__(self, lease, on_elected: LeadershipCallback = None,
+                 on_demoted: LeadershipCallback = None):
+        self.lease = lease
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self.logger = logging.getLogger(__name__)
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def renew_interval(self) -> float:
+        return self.lease.ttl.total_seconds() / 3
+
+    async def start(self):
+        """محاولة أولى فورية ثم تجديد دوري"""
+        await self._tick()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """إيقاف الحلقة والتخلي عن القيادة"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+        if self.is_leader:
+            await self._set_leader(False)
+            try:
+                await self.lease.release()
+            except Exception as e:
+                self.logger.warning(f"Could not release leader lease: {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.renew_interval)
+            await self._tick()
+
+    async def _tick(self):
+        """تجديد العقد وتحديث الحالة"""
+        try:
+            acquired = await self.lease.acquire()
+        except Exception as e:
+            self.logger.error(f"Error renewing leader lease: {e}")
+            acquired = False
+
+        if acquired != self.is_leader:
+            await self._set_leader(acquired)
+
+    async def _set_leader(self, is_leader: bool):
+        if not is_leader:
+            self.is_leader = False
+            self.logger.info(f"Lost scheduler leadership ({self.lease.holder})")
+            await self._notify(self.on_demoted)
+            return
+
+        # القيادة تعلن فقط بعد اكتمال التولي؛ الفشل يعيد العقد لنسخة أخرى
+        self.logger.info(f"Became scheduler leader ({self.lease.holder})")
+        if not await self._notify(self.on_elected):
+            await self._notify(self.on_demoted)
+            try:
+                await self.lease.release()
+            except Exception as e:
+                self.logger.warning(f"Could not release leader lease: {e}")
+            return
+
+        self.is_leader = True
+
+    async def _notify(self, callback: Optional[LeadershipCallback]) -> bool:
+        """تنفيذ رد نداء تغير القيادة؛ يعيد False عند فشله"""
+        if not callback:
+            return True
+        try:
+            await callback()
+            return True
+        except Exception as e:
+            self.logger.error(f"Error handling leadership change: {e}")
+            return False
@@ -6,78 +6,177 @@ Main Bot Application File
 import asyncio
 import logging
 import sys
+import time
 from contextlib import asynccontextmanager
 
-from aiogram import Bot, Dispatcher
-from aiogram.client.default import DefaultBotProperties
-from aiogram.enums import ParseMode
-from aiogram.fsm.storage.memory import MemoryStorage
-
 from config import settings, LOGGING_CONFIG
-from database import init_database, db_manager
-from handlers import setup_handlers, error_handler
-from scheduler import bot_scheduler
-from payments import start_webhook_server
+
+# لا تستورد هنا إلا الإعدادات: عمليات العمال تعيد استيراد هذا الملف،
+# وaiogram وباقي الوحدات تستورد عند إنشاء البوت أو داخل مرحلة بدء التشغيل التي تحتاجها
 
 
 # إعداد التسجيل
 logging.config.dictConfig(LOGGING_CONFIG)
 logger = logging.getLogger(__name__)
 
+# أوصاف القنوات الافتراضية: (العربية، الإنجليزية)
+DEFAULT_CHANNEL_DESCRIPTIONS = {
+    'public': ('القناة العامة المجانية', 'Free public channel'),
+    'private': ('القناة الخاصة المدفوعة', 'Paid private channel')
+}
+
 
 class TelegramBot:
     """فئة البوت الرئيسية"""
     
-    def __init__(self):
-        # إنشاء البوت
+    def __init__(self, session=None):
+        from aiogram import Bot, Dispatcher
+        from aiogram.client.default import DefaultBotProperties
+        from aiogram.enums import ParseMode
+        from storage import create_fsm_storage
+        from metrics import instrument_bot
+        
+        # إنشاء البوت (جلسة مخصصة لخادم واجهة محلي عند الحاجة)
         self.bot = Bot(
             token=settings.BOT_TOKEN,
+            session=session,
             default=DefaultBotProperties(parse_mode=ParseMode.HTML)
         )
+        instrument_bot(self.bot)
         
-        # إنشاء الموزع مع تخزين الذاكرة
-        self.dp = Dispatcher(storage=MemoryStorage())
+        # إنشاء الموزع مع تخزين الحالات المشترك بين النسخ
+        self.dp = Dispatcher(storage=create_fsm_storage())
         
-        # تسجيل معالج الأخطاء
-        self.dp.errors.register(error_handler)
+        # أزمنة مراحل بدء التشغيل بالثواني
+        self.startup_timings = {}
         
         logger.info("Bot initialized successfully")
     
+    @asynccontextmanager
+    async def phase(self, name: str):
+        """قياس زمن مرحلة من مراحل بدء التشغيل"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.startup_timings[name] = time.perf_counter() - started
+    
+    async def timed(self, name: str, awaitable):
+        """تنفيذ خطوة مستقلة مع قياس زمنها"""
+        async with self.phase(name):
+            return await awaitable
+    
     async def startup(self):
         """إجراءات بدء التشغيل"""
+        started = time.perf_counter()
+        self.startup_timings = {}
+        chats = None
         try:
-            # تهيئة قاعدة البيانات
-            logger.info("Initializing database...")
-            await init_database()
+            # معلومات القنوات من تيليجرام لا تحتاج قاعدة البيانات
+            chats = asyncio.create_task(self.timed("get_chat", self.fetch_default_channels()))
             
-            # إعداد المعالجات
-            logger.info("Setting up handlers...")
-            setup_handlers(self.dp, self.bot)
+            # تهيئة قاعدة البيانات
+            async with self.phase("database"):
+                from database import init_database, db_manager
+                from metrics import instrument_engine
+                from profiler import db_profiler
+                from stats_counters import stats_counters
+                from migrations import register_models, run_migrations
+                
+                # تسجيل جداول الوحدات الأخرى قبل إنشاء الجداول
+                register_models()
+                
+                logger.info("Initializing database...")
+                await init_database()
+                instrument_engine(db_manager.engine)
+                db_profiler.instrument(db_manager.engine)
+                stats_counters.instrument()
+                
+                # تطبيق الفهارس على قواعد البيانات الموجودة
+                await run_migrations()
             
-            # بدء المجدول
-            logger.info("Starting scheduler...")
-            await bot_scheduler.start()
+            # تحليل قوالب الرسائل وإعداد المعالجات
+            async with self.phase("handlers"):
+                from messages import messages
+                from handlers import setup_handlers, error_handler
+                
+                messages.compile()
+                
+                logger.info("Setting up handlers...")
+                self.dp.errors.register(error_handler)
+                setup_handlers(self.dp, self.bot)
             
-            # إعداد المديرين الافتراضيين
-            await self.setup_default_admins()
+            # الخطوات المستقلة تعمل بالتوازي
+            async with self.phase("services"):
+                await asyncio.gather(
+                    self.timed("scheduler", self.start_scheduler()),
+                    self.timed("admins", self.setup_default_admins()),
+                    self.timed("channels", self.setup_channels_and_catalog(chats))
+                )
             
-            # إعداد القنوات الافتراضية
-            await self.setup_default_channels()
+            # استئناف عمليات البث المتروكة ثم مراقبتها دورياً
+            async with self.phase("broadcasts"):
+                from broadcast import broadcast_engine
+                await broadcast_engine.start_watcher(self.bot)
             
-            logger.info("Bot startup completed successfully")
+            self.report_startup(time.perf_counter() - started)
             
         except Exception as e:
+            if chats is not None:
+                chats.cancel()
             logger.error(f"Error during startup: {e}")
             raise
     
+    def report_startup(self, total: float):
+        """تسجيل أزمنة مراحل بدء التشغيل"""
+        breakdown = ", ".join(
+            f"{name} {duration * 1000:.0f}ms"
+            for name, duration in self.startup_timings.items()
+        )
+        logger.info(f"Bot startup completed in {total * 1000:.0f}ms ({breakdown})")
+    
+    async def start_scheduler(self):
+        """بدء المجدول"""
+        from scheduler import bot_scheduler
+        
+        logger.info("Starting scheduler...")
+        bot_scheduler.bot = self.bot
+        await bot_scheduler.start()
+    
+    async def setup_channels_and_catalog(self, chats):
+        """إعداد القنوات ثم تحميل فهرس الخطط والقنوات والاستماع لتحديثاته"""
+        from catalog import catalog
+        
+        await self.setup_default_channels(await chats)
+        await catalog.load()
+        await catalog.start_listener()
+    
     async def shutdown(self):
         """إجراءات إيقاف التشغيل"""
         try:
+            from database import db_manager
+            from scheduler import bot_scheduler
+            from broadcast import broadcast_engine
+            from profiler import db_profiler
+            from catalog import catalog
+            
             logger.info("Shutting down bot...")
             
+            # إيقاف عمليات البث الجارية
+            await broadcast_engine.stop()
+            
             # إيقاف المجدول
             await bot_scheduler.stop()
             
+            # إيقاف مستمع الفهرس
+            await catalog.stop()
+            
+            # إغلاق تخزين الحالات
+            await self.dp.storage.close()
+            
+            # ملخص تحليل الاستعلامات
+            db_profiler.report()
+            
             # إغلاق قاعدة البيانات
             await db_manager.close()
             
@@ -90,72 +189,123 @@ class TelegramBot:
             logger.error(f"Error during shutdown: {e}")
     
     async def setup_default_admins(self):
-        """إعداد المديرين الافتراضيين"""
+        """إعداد المديرين الافتراضيين باستعلام واحد"""
         try:
-            from database import user_service
+            from user_cache import user_cache
             
-            for admin_id in settings.ADMIN_USER_IDS:
-                await user_service.set_admin_status(admin_id, True)
-                logger.info(f"Set admin status for user {admin_id}")
+            admin_ids = list(settings.ADMIN_USER_IDS)
+            if admin_ids:
+                updated = await user_cache.set_admin_statuses(admin_ids, True)
+                logger.info(f"Set admin status for {updated}/{len(admin_ids)} users")
                 
         except Exception as e:
             logger.error(f"Error setting up default admins: {e}")
     
-    async def setup_default_channels(self):
+    async def fetch_default_channels(self):
+        """جلب معلومات القنوات الافتراضية من تيليجرام بالتوازي"""
+        channels = [
+            (channel_type, channel_id)
+            for channel_type, channel_id in (
+                ('public', settings.PUBLIC_CHANNEL_ID),
+                ('private', settings.PRIVATE_CHANNEL_ID)
+            )
+            if channel_id
+        ]
+        
+        results = await asyncio.gather(
+            *(self.bot.get_chat(channel_id) for _, channel_id in channels),
+            return_exceptions=True
+        )
+        return [
+            (channel_type, channel_id, chat_info)
+            for (channel_type, channel_id), chat_info in zip(channels, results)
+        ]
+    
+    async def setup_default_channels(self, chats=None):
         """إعداد القنوات الافتراضية"""
         try:
             from database import channel_service
             
-            # إعداد القناة العامة
-            if settings.PUBLIC_CHANNEL_ID:
-                try:
-                    chat_info = await self.bot.get_chat(settings.PUBLIC_CHANNEL_ID)
-                    await channel_service.create_or_update_channel(
-                        telegram_channel_id=settings.PUBLIC_CHANNEL_ID,
-                        channel_data={
-                            'channel_username': chat_info.username,
-                            'channel_title': chat_info.title,
-                            'channel_type': 'public',
-                            'description_ar': 'القناة العامة المجانية',
-                            'description_en': 'Free public channel',
-                            'is_active': True
-                        }
-                    )
-                    logger.info(f"Setup public channel: {chat_info.title}")
-                except Exception as e:
-                    logger.warning(f"Could not setup public channel: {e}")
+            if chats is None:
+                chats = await self.fetch_default_channels()
             
-            # إعداد القناة الخاصة
-            if settings.PRIVATE_CHANNEL_ID:
+            for channel_type, channel_id, chat_info in chats:
                 try:
-                    chat_info = await self.bot.get_chat(settings.PRIVATE_CHANNEL_ID)
+                    if isinstance(chat_info, Exception):
+                        raise chat_info
+                    
+                    description_ar, description_en = DEFAULT_CHANNEL_DESCRIPTIONS[channel_type]
                     await channel_service.create_or_update_channel(
-                        telegram_channel_id=settings.PRIVATE_CHANNEL_ID,
+                        telegram_channel_id=channel_id,
                         channel_data={
                             'channel_username': chat_info.username,
                             'channel_title': chat_info.title,
-                            'channel_type': 'private',
-                            'description_ar': 'القناة الخاصة المدفوعة',
-                            'description_en': 'Paid private channel',
+                            'channel_type': channel_type,
+                            'description_ar': description_ar,
+                            'description_en': description_en,
                             'is_active': True
                         }
                     )
-                    logger.info(f"Setup private channel: {chat_info.title}")
+                    logger.info(f"Setup {channel_type} channel: {chat_info.title}")
                 except Exception as e:
-                    logger.warning(f"Could not setup private channel: {e}")
+                    logger.warning(f"Could not setup {channel_type} channel: {e}")
                     
         except Exception as e:
             logger.error(f"Error setting up default channels: {e}")
     
+    async def run_webhook(self, router=None):
+        """استقبال التحديثات عبر webhook بدلاً من الاستطلاع"""
+        from webhook import WebhookIngress
+        
+        ingress = WebhookIngress(self.dp, self.bot, router=router)
+        
+        await self.dp.emit_startup(bot=self.bot)
+        try:
+            logger.info("Starting bot webhook...")
+            await ingress.serve()
+            await asyncio.Event().wait()
+        finally:
+            await ingress.stop()
+            await self.dp.emit_shutdown(bot=self.bot)
+    
+    async def run_processes(self):
+        """استقبال التحديثات هنا ومعالجتها في عمليات العمال"""
+        from webhook import UPDATE_MODE
+        from workers import ProcessRouter
+        
+        router = ProcessRouter()
+        router.start()
+        try:
+            if UPDATE_MODE == "webhook":
+                await self.run_webhook(router=router.offer)
+            else:
+                logger.info("Starting bot polling for worker processes...")
+                await router.poll(self.bot, self.dp.resolve_used_update_types())
+        finally:
+            await router.stop()
+    
     async def run(self):
         """تشغيل البوت"""
+        from webhook import UPDATE_MODE
+        from workers import PROCESS_WORKERS
+        from metrics import serve_metrics
+        
         try:
             # إجراءات بدء التشغيل
             await self.startup()
             
             # بدء تشغيل البوت
-            logger.info("Starting bot polling...")
-            await self.dp.start_polling(self.bot)
+            # خادم مستقل للمقاييس في وضع الاستطلاع
+            if UPDATE_MODE != "webhook":
+                await serve_metrics()
+            
+            if PROCESS_WORKERS > 0:
+                await self.run_processes()
+            elif UPDATE_MODE == "webhook":
+                await self.run_webhook()
+            else:
+                logger.info("Starting bot polling...")
+                await self.dp.start_polling(self.bot)
             
         except KeyboardInterrupt:
             logger.info("Bot stopped by user")
@@ -171,6 +321,8 @@ async def run_webhook_server():
     """تشغيل خادم webhook في الخلفية"""
     try:
         if settings.WEBHOOK_HOST and settings.WEBHOOK_PORT:
+            from payments import start_webhook_server
+            
             logger.info("Starting webhook server...")
             await start_webhook_server()
     except Exception as e:
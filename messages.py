@@ -0,0 +1,260 @@
+"""
+فهرس الرسائل المترجمة المجهز مسبقاً
+Precompiled Localized Message Catalog
+"""
+
+import logging
+from enum import IntEnum
+from string import Formatter
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from localization import translator
+
+
+# اللغات المدعومة؛ الإنجليزية عند عدم التطابق
+LANGUAGES = ("ar", "en")
+DEFAULT_LANGUAGE = "en"
+_LANGUAGE_INDEX = {language: index for index, language in enumerate(LANGUAGES)}
+
+
+class MessageId(IntEnum):
+    """معرفات الرسائل"""
+    START = 0
+    MAIN_MENU = 1
+    LANGUAGE_CHANGED = 2
+    FREE_CHANNELS_LIST = 3
+    SUBSCRIPTION_PLANS = 4
+    PAYMENT_INSTRUCTIONS = 5
+    PAYMENT_PROCESSING = 6
+    NO_ACTIVE_SUBSCRIPTIONS = 7
+    SETTINGS = 8
+    ADMIN_WELCOME = 9
+    ADMIN_STATS = 10
+    BROADCAST_PROMPT = 11
+    BROADCAST_CONFIRM = 12
+    BROADCAST_SENT = 13
+    ACCESS_DENIED = 14
+    SUBSCRIPTION_EXPIRING = 15
+    SUBSCRIPTION_EXPIRED = 16
+    NO_FREE_CHANNELS = 17
+    NO_PLANS = 18
+    MY_SUBSCRIPTIONS_HEADER = 19
+    PAYMENT_DETAILS = 20
+    PAYMENT_LINK_CREATED = 21
+    PAYMENT_FAILED = 22
+    INVALID_PLAN = 23
+    ERROR_GENERIC = 24
+    ERROR_RETRY = 25
+    BROADCAST_MESSAGE_NOT_FOUND = 26
+    BROADCAST_STARTED = 27
+    BROADCAST_FAILED = 28
+    BROADCAST_PROGRESS = 29
+    ROLLUP_SUMMARY = 30
+    BROADCAST_PREVIEW = 31
+
+
+# رسائل ملف الترجمة: (المفتاح، أسماء المتغيرات)
+TRANSLATED_MESSAGES: Dict[MessageId, Tuple[str, Tuple[str, ...]]] = {
+    MessageId.START: ('start', ()),
+    MessageId.MAIN_MENU: ('main_menu', ()),
+    MessageId.LANGUAGE_CHANGED: ('success_language_changed', ()),
+    MessageId.FREE_CHANNELS_LIST: ('free_channels_list', ()),
+    MessageId.SUBSCRIPTION_PLANS: ('subscription_plans', ()),
+    MessageId.PAYMENT_INSTRUCTIONS: ('payment_instructions', ()),
+    MessageId.PAYMENT_PROCESSING: ('payment_processing', ()),
+    MessageId.NO_ACTIVE_SUBSCRIPTIONS: ('no_active_subscriptions', ()),
+    MessageId.SETTINGS: ('btn_settings', ()),
+    MessageId.ADMIN_WELCOME: ('admin_welcome', ()),
+    MessageId.ADMIN_STATS: (
+        'admin_stats',
+        ('total_users', 'active_subscriptions', 'daily_revenue', 'new_users_today')
+    ),
+    MessageId.BROADCAST_PROMPT: ('broadcast_prompt', ()),
+    MessageId.BROADCAST_CONFIRM: ('broadcast_confirm', ('user_count',)),
+    MessageId.BROADCAST_SENT: ('broadcast_sent', ('sent_count', 'total_count')),
+    MessageId.ACCESS_DENIED: ('access_denied', ()),
+    MessageId.SUBSCRIPTION_EXPIRING: (
+        'warning_subscription_expiring', ('plan_name', 'hours', 'end_date')
+    ),
+    MessageId.SUBSCRIPTION_EXPIRED: ('info_subscription_expired', ('plan_name',)),
+}
+
+# رسائل كانت مكتوبة داخل المعالجات مباشرة
+INLINE_MESSAGES: Dict[MessageId, Dict[str, str]] = {
+    MessageId.NO_FREE_CHANNELS: {
+        'ar': "📭 لا توجد قنوات مجانية متاحة حالياً.",
+        'en': "📭 No free channels available at the moment."
+    },
+    MessageId.NO_PLANS: {
+        'ar': "📭 لا توجد خطط اشتراك متاحة حالياً.",
+        'en': "📭 No subscription plans available at the moment."
+    },
+    MessageId.MY_SUBSCRIPTIONS_HEADER: {
+        'ar': "📊 اشتراكاتي:\n\n",
+        'en': "📊 My Subscriptions:\n\n"
+    },
+    MessageId.PAYMENT_DETAILS: {
+        'ar': "💰 المبلغ: {amount} {currency}\n📋 الخطة: {plan_name}\n\n🔗 [اضغط هنا للدفع]({payment_url})",
+        'en': "💰 Amount: {amount} {currency}\n📋 Plan: {plan_name}\n\n🔗 [Click here to pay]({payment_url})"
+    },
+    MessageId.PAYMENT_LINK_CREATED: {
+        'ar': "تم إنشاء رابط الدفع!",
+        'en': "Payment link created!"
+    },
+    MessageId.PAYMENT_FAILED: {
+        'ar': "❌ فشل في إنشاء الدفع",
+        'en': "❌ Failed to create the payment"
+    },
+    MessageId.INVALID_PLAN: {
+        'ar': "❌ خطة غير صحيحة",
+        'en': "❌ Invalid plan"
+    },
+    MessageId.ERROR_GENERIC: {
+        'ar': "❌ حدث خطأ",
+        'en': "❌ An error occurred"
+    },
+    MessageId.ERROR_RETRY: {
+        'ar': "❌ حدث خطأ. يرجى المحاولة مرة أخرى.",
+        'en': "❌ An error occurred. Please try again."
+    },
+    MessageId.BROADCAST_MESSAGE_NOT_FOUND: {
+        'ar': "❌ لم يتم العثور على الرسالة",
+        'en': "❌ Message not found"
+    },
+    MessageId.BROADCAST_STARTED: {
+        'ar': "بدأ إرسال البث!",
+        'en': "Broadcast started!"
+    },
+    MessageId.BROADCAST_FAILED: {
+        'ar': "❌ فشل في إرسال البث",
+        'en': "❌ Failed to send the broadcast"
+    },
+    MessageId.BROADCAST_PROGRESS: {
+        'ar': "📤 جاري البث: {processed}/{total}",
+        'en': "📤 Broadcasting: {processed}/{total}"
+    },
+    MessageId.ROLLUP_SUMMARY: {
+        'ar': "\n\n📈 الإيرادات الشهرية المتكررة: {mrr:.2f}\n🔁 معدل التجديد: {renewal_rate:.1f}%",
+        'en': "\n\n📈 Monthly recurring revenue: {mrr:.2f}\n🔁 Renewal rate: {renewal_rate:.1f}%"
+    },
+    MessageId.BROADCAST_PREVIEW: {
+        'ar': "{confirm_text}\n\n📝 الرسالة:\n{broadcast_text}",
+        'en': "{confirm_text}\n\n📝 Message:\n{broadcast_text}"
+    },
+}
+
+
+class CompiledTemplate:
+    """قالب محلل مسبقاً: أجزاء نصية ثابتة ومتغيرات بتنسيقها"""
+
+    __slots__ = ('_parts', '_static')
+
+    def __init__(self, template: str):
+        self._parts: List[Tuple[str, Optional[str], str, Optional[str]]] = list(
+            Formatter().parse(template)
+        )
+        # القوالب دون متغيرات تعاد كما هي
+        self._static: Optional[str] = None
+        if all(field is None for _, field, _, _ in self._parts):
+            self._static = "".join(literal for literal, _, _, _ in self._parts)
+
+    @classmethod
+    def literal(cls, text: str) -> "CompiledTemplate":
+        """نص ثابت لا يحلل (قد يحتوي أقواساً عادية)"""
+        template = cls.__new__(cls)
+        template._parts = []
+        template._static = text
+        return template
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        if self._static is not None:
+            return self._static
+
+        pieces = []
+        for literal, field, spec, conversion in self._parts:
+            if literal:
+                pieces.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "s":
+                value = str(value)
+            pieces.append(format(value, spec) if spec else str(value))
+        return "".join(pieces)
+
+
+class TranslatorTemplate:
+    """احتياطي للقوالب التي لا يمكن تحليلها: التنسيق عبر المترجم"""
+
+    __slots__ = ('_key', '_language')
+
+    def __init__(self, key: str, language: str):
+        self._key = key
+        self._language = language
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        return translator.get_text(self._key, self._language, **values)
+
+
+class MessageCatalog:
+    """قوالب كل الرسائل مفهرسة بمعرف الرسالة × اللغة"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._templates: List[Any] = []
+
+    def _source(self, message_id: MessageId, language: str):
+        inline = INLINE_MESSAGES.get(message_id)
+        if inline is not None:
+            return CompiledTemplate(inline.get(language, inline[DEFAULT_LANGUAGE]))
+
+        key, params = TRANSLATED_MESSAGES[message_id]
+        if not params:
+            return CompiledTemplate.literal(translator.get_text(key, language))
+
+        try:
+            # استرجاع النص الأصلي بتمرير كل متغير كعلامته نفسها
+            template = translator.get_text(
+                key, language, **{param: "{" + param + "}" for param in params}
+            )
+            return CompiledTemplate(template)
+        except Exception as e:
+            self.logger.warning(f"Template {key}/{language} kept dynamic: {e}")
+            return TranslatorTemplate(key, language)
+
+    def compile(self):
+        """تحليل كل القوالب مرة واحدة"""
+        templates = []
+        for message_id in MessageId:
+            for language in LANGUAGES:
+                templates.append(self._source(message_id, language))
+        self._templates = templates
+        self.logger.info(f"Compiled {len(templates)} message templates")
+
+    def _template(self, message_id: MessageId, language: str):
+        if not self._templates:
+            self.compile()
+        index = _LANGUAGE_INDEX.get(language, _LANGUAGE_INDEX[DEFAULT_LANGUAGE])
+        return self._templates[message_id * len(LANGUAGES) + index]
+
+    def render(self, message_id: MessageId, language: str, **values) -> str:
+        """تنسيق رسالة واحدة"""
+        return self._template(message_id, language).render(values)
+
+    def render_many(self, message_id: MessageId,
+                    items: Iterable[Tuple[str, Mapping[str, Any]]]) -> List[str]:
+        """تنسيق رسالة لعدد كبير من المستلمين: (اللغة، القيم) لكل مستلم"""
+        by_language: Dict[str, Any] = {}
+        rendered = []
+        for language, values in items:
+            template = by_language.get(language)
+            if template is None:
+                template = by_language[language] = self._template(message_id, language)
+            rendered.append(template.render(values))
+        return rendered
+
+
+# إنشاء مثيل فهرس الرسائل العام
+messages = MessageCatalog()
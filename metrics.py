@@ -0,0 +1,341 @@
+"""
+مقاييس الأداء بصيغة Prometheus
+Prometheus-Style Performance Metrics
+"""
+
+import functools
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from aiogram import BaseMiddleware
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.exceptions import TelegramAPIError, TelegramRetryAfter
+from aiogram.types import TelegramObject
+from aiohttp import web
+
+from config import settings
+from profiler import db_profiler
+
+
+logger = logging.getLogger(__name__)
+
+# إعدادات المقاييس
+METRICS_PATH = getattr(settings, 'METRICS_PATH', '/metrics')
+METRICS_PORT = getattr(settings, 'METRICS_PORT', None)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Metric:
+    """أساس المقاييس ذات التسميات"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}"
+        ]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """عداد متزايد"""
+
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values]
+
+
+class Gauge(Metric):
+    """قيمة لحظية؛ يمكن ربطها بدالة تقرأ عند الجمع"""
+
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+        self._functions: Dict[LabelValues, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float], **labels):
+        with self._lock:
+            self._functions[self._key(labels)] = function
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = list(self._functions.items())
+
+        for key, function in functions:
+            try:
+                values[key] = function()
+            except Exception as e:
+                logger.debug(f"Gauge {self.name} callback failed: {e}")
+        return [f"{self.name}{_format_labels(self.labels, key)} {value}" for key, value in values.items()]
+
+
+class Histogram(Metric):
+    """توزيع القيم على فترات تراكمية"""
+
+    kind = "histogram"
+
+    def __init__(self, *args, buckets: Sequence[float] = DEFAULT_BUCKETS, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.buckets = tuple(sorted(buckets))
+        # لكل تسمية: عدد القيم في كل فترة، المجموع، العدد الكلي
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            counts, totals = self._values.setdefault(
+                key, ([0] * (len(self.buckets) + 1), [0.0, 0])
+            )
+            counts[index] += 1
+            totals[0] += value
+            totals[1] += 1
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(counts), list(totals)) for key, (counts, totals) in self._values.items()]
+
+        lines = []
+        for key, counts, (total, count) in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labels, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labels, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {int(count)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {int(count)}")
+        return lines
+
+
+class MetricsRegistry:
+    """سجل المقاييس وتصديرها بصيغة نصية"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+
+    def _register(self, metric: Metric) -> Metric:
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def gauge(self, name: str, documentation: str, labels: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets=buckets))
+
+    def render(self) -> str:
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+
+# إنشاء سجل المقاييس العام
+registry = MetricsRegistry()
+
+handler_latency = registry.histogram(
+    "bot_handler_latency_seconds", "Handler execution time", ("handler",)
+)
+handler_errors = registry.counter(
+    "bot_handler_errors_total", "Handler exceptions", ("handler",)
+)
+job_duration = registry.histogram(
+    "bot_job_duration_seconds", "Scheduler job execution time", ("job",)
+)
+job_items = registry.counter(
+    "bot_job_items_total", "Items processed by scheduler jobs", ("job",)
+)
+job_errors = registry.counter(
+    "bot_job_errors_total", "Scheduler job exceptions", ("job",)
+)
+telegram_latency = registry.histogram(
+    "bot_telegram_request_seconds", "Telegram Bot API request time", ("method",)
+)
+telegram_errors = registry.counter(
+    "bot_telegram_errors_total", "Telegram Bot API errors", ("method", "error")
+)
+telegram_retry_after = registry.counter(
+    "bot_telegram_retry_after_total", "Telegram flood control responses", ("method",)
+)
+db_query_duration = registry.histogram(
+    "bot_db_query_seconds", "Database statement execution time", ("operation",),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+db_connection_hold = registry.histogram(
+    "bot_db_connection_hold_seconds", "Time a pooled connection is checked out"
+)
+queue_depth = registry.gauge(
+    "bot_queue_depth", "Items waiting in internal queues", ("queue",)
+)
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """قياس زمن تنفيذ كل معالج (وسيط داخلي على الموجهات)"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+        name = getattr(getattr(handler_object, 'callback', None), '__name__', 'unknown')
+
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(handler=name)
+            raise
+        finally:
+            handler_latency.observe(time.perf_counter() - started, handler=name)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """قياس طلبات Bot API وأخطائها"""
+
+    async def __call__(self, make_request, bot, method):
+        name = type(method).__name__
+
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except TelegramRetryAfter:
+            telegram_retry_after.inc(method=name)
+            raise
+        except TelegramAPIError as e:
+            telegram_errors.inc(method=name, error=type(e).__name__)
+            raise
+        finally:
+            telegram_latency.observe(time.perf_counter() - started, method=name)
+
+
+def instrument_bot(bot):
+    """إضافة قياس الطلبات لجلسة البوت"""
+    bot.session.middleware(TelegramMetricsMiddleware())
+
+
+def instrument_engine(engine):
+    """قياس زمن الاستعلامات ومدة حجز الاتصالات"""
+    from sqlalchemy import event
+
+    sync_engine = getattr(engine, 'sync_engine', engine)
+
+    # وقت البدء على سياق التنفيذ نفسه: الاستعلام الفاشل لا يترك قيمة تخص غيره
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        context._metrics_query_started = time.perf_counter()
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, '_metrics_query_started', None)
+        if started is None:
+            return
+        operation = statement.lstrip().split(None, 1)[0].upper() if statement else "UNKNOWN"
+        db_query_duration.observe(time.perf_counter() - started, operation=operation)
+
+    @event.listens_for(sync_engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info['metrics_checked_out'] = time.perf_counter()
+
+    @event.listens_for(sync_engine, "checkin")
+    def _checkin(dbapi_connection, connection_record):
+        started = connection_record.info.pop('metrics_checked_out', None)
+        if started is not None:
+            db_connection_hold.observe(time.perf_counter() - started)
+
+
+def track_job(name: str):
+    """تغليف مهمة مجدولة لقياس مدتها وعدد العناصر المعالجة"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                async with db_profiler.scope(f"job:{name}"):
+                    result = await func(*args, **kwargs)
+            except Exception:
+                job_errors.inc(job=name)
+                raise
+            finally:
+                job_duration.observe(time.perf_counter() - started, job=name)
+
+            if isinstance(result, int) and not isinstance(result, bool):
+                job_items.inc(result, job=name)
+            return result
+        return wrapper
+    return decorator
+
+
+async def metrics_handler(request: web.Request) -> web.Response:
+    """مسار عرض المقاييس"""
+    return web.Response(
+        text=registry.render(),
+        content_type="text/plain",
+        charset="utf-8",
+        headers={"X-Content-Type-Options": "nosniff"}
+    )
+
+
+def register_metrics_route(app: web.Application, path: str = METRICS_PATH):
+    """إضافة مسار المقاييس إلى تطبيق aiohttp"""
+    app.router.add_get(path, metrics_handler)
+
+
+async def serve_metrics(host: str = "0.0.0.0", port: Optional[int] = METRICS_PORT):
+    """تشغيل خادم مستقل للمقاييس عندما لا يعمل خادم webhook"""
+    if not port:
+        return None
+
+    app = web.Application()
+    register_metrics_route(app)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Metrics listening on port {port}")
+    return runner
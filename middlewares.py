@@ -0,0 +1,58 @@
+"""
+الوسائط البرمجية للموزع
+Dispatcher Middlewares
+"""
+
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery, Message, TelegramObject
+
+from messages import messages, MessageId
+from user_cache import user_cache
+
+
+logger = logging.getLogger(__name__)
+
+Handler = Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]]
+
+
+class UserDataMiddleware(BaseMiddleware):
+    """تحميل بيانات المستخدم مرة واحدة لكل تحديث وتمريرها للمعالجات"""
+
+    async def __call__(self, handler: Handler, event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        telegram_user = data.get('event_from_user')
+
+        if telegram_user is not None:
+            started = time.perf_counter()
+            data['user_data'] = await user_cache.get_user_data(telegram_user)
+            logger.debug(
+                f"Loaded user context for {telegram_user.id} in "
+                f"{(time.perf_counter() - started) * 1000:.2f}ms"
+            )
+
+        return await handler(event, data)
+
+
+class AdminOnlyMiddleware(BaseMiddleware):
+    """رفض غير المديرين قبل تنفيذ معالجات الإدارة"""
+
+    async def __call__(self, handler: Handler, event: TelegramObject,
+                       data: Dict[str, Any]) -> Any:
+        user_data = data.get('user_data') or {}
+
+        if user_data.get('is_admin', False):
+            return await handler(event, data)
+
+        language = user_data.get('preferred_language') or 'en'
+        text = messages.render(MessageId.ACCESS_DENIED, language)
+
+        if isinstance(event, CallbackQuery):
+            await event.answer(text, show_alert=True)
+        elif isinstance(event, Message):
+            await event.answer(text)
+
+        return None
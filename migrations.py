@@ -0,0 +1,98 @@
+"""
+ترحيلات قاعدة البيانات والفهارس
+Database Migrations and Indexes
+"""
+
+import importlib
+import logging
+
+from sqlalchemy import Index, delete, func, inspect, select, text
+
+from database import db_manager, Base, Analytics, Payment, Subscription, User
+
+
+logger = logging.getLogger(__name__)
+
+# وحدات تعرف جداول إضافية على Base خارج database.py
+MODEL_MODULES = ("broadcast", "leader_election", "stats_counters", "rollups")
+
+# أعمدة أضيفت لاحقاً إلى جداول قد تكون موجودة: (الجدول، العمود)
+ADDED_COLUMNS = [
+    ("broadcast_jobs", "owner"),
+]
+
+
+# فهارس مركبة تناسب استعلامات النطاقات الزمنية
+PERFORMANCE_INDEXES = [
+    Index('ix_payments_status_completed_at', Payment.status, Payment.completed_at),
+    Index('ix_users_registration_date', User.registration_date),
+    Index('ix_subscriptions_created_at', Subscription.created_at),
+    Index('ix_subscriptions_status_end_date', Subscription.status, Subscription.end_date),
+]
+
+# فهرس فريد يسمح بتحديث المقاييس بدلاً من تكرارها
+ANALYTICS_UNIQUE_INDEX = Index(
+    'uq_analytics_metric_name_date',
+    Analytics.metric_name, Analytics.metric_date,
+    unique=True
+)
+
+
+def register_models():
+    """استيراد كل الوحدات المعرفة لجداول حتى تسجل في البيانات الوصفية قبل create_all"""
+    for module in MODEL_MODULES:
+        importlib.import_module(module)
+
+
+def _deduplicate_analytics(connection):
+    """حذف المقاييس المكررة مع إبقاء أحدثها قبل إنشاء الفهرس الفريد"""
+    existing = {
+        index['name'] for index in inspect(connection).get_indexes(Analytics.__tablename__)
+    }
+    if ANALYTICS_UNIQUE_INDEX.name in existing:
+        return
+
+    latest_ids = (
+        select(func.max(Analytics.id))
+        .group_by(Analytics.metric_name, Analytics.metric_date)
+    )
+    connection.execute(delete(Analytics).where(Analytics.id.notin_(latest_ids)))
+
+
+def _add_columns(connection):
+    """إضافة الأعمدة الجديدة إلى الجداول المنشأة قبلها"""
+    inspector = inspect(connection)
+    for table_name, column_name in ADDED_COLUMNS:
+        existing = {column['name'] for column in inspector.get_columns(table_name)}
+        if column_name in existing:
+            continue
+
+        column = Base.metadata.tables[table_name].c[column_name]
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_type}"))
+        logger.info(f"Added column {table_name}.{column_name}")
+
+
+def _create_indexes(connection):
+    """إنشاء الفهارس غير الموجودة"""
+    for index in PERFORMANCE_INDEXES:
+        index.create(connection, checkfirst=True)
+
+    _deduplicate_analytics(connection)
+    ANALYTICS_UNIQUE_INDEX.create(connection, checkfirst=True)
+
+
+async def run_migrations():
+    """تطبيق الترحيلات على قاعدة بيانات موجودة"""
+    try:
+        register_models()
+        async with db_manager.engine.begin() as connection:
+            # الجداول الإضافية إن لم تكن موجودة
+            await connection.run_sync(Base.metadata.create_all)
+            await connection.run_sync(_add_columns)
+            await connection.run_sync(_create_indexes)
+        logger.info("Database migrations applied")
+
+    except Exception as e:
+        logger.error(f"Error applying database migrations: {e}")
+        raise
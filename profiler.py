@@ -0,0 +1,192 @@
+"""
+تحليل استعلامات قاعدة البيانات
+Database Query Profiler
+"""
+
+import logging
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject
+
+from config import settings
+
+
+# إعدادات التحليل (معطل افتراضياً)
+DB_PROFILING = getattr(settings, 'DB_PROFILING', False)
+SLOW_QUERY_MS = getattr(settings, 'SLOW_QUERY_MS', 200)
+N_PLUS_ONE_THRESHOLD = getattr(settings, 'N_PLUS_ONE_THRESHOLD', 5)
+PROFILE_SUMMARY_LIMIT = getattr(settings, 'PROFILE_SUMMARY_LIMIT', 20)
+
+
+class ProfileScope:
+    """الاستعلامات المنفذة ضمن تحديث أو مهمة واحدة"""
+
+    __slots__ = ('name', 'statements', 'duration', 'repeats')
+
+    def __init__(self, name: str):
+        self.name = name
+        self.statements = 0
+        self.duration = 0.0
+        self.repeats: Counter = Counter()
+
+    def record(self, statement: str, duration: float):
+        self.statements += 1
+        self.duration += duration
+        self.repeats[statement] += 1
+
+
+class ScopeSummary:
+    """إجماليات نطاق عبر كل تنفيذاته"""
+
+    __slots__ = ('calls', 'statements', 'max_statements', 'duration', 'n_plus_one')
+
+    def __init__(self):
+        self.calls = 0
+        self.statements = 0
+        self.max_statements = 0
+        self.duration = 0.0
+        self.n_plus_one = 0
+
+
+_current_scope: ContextVar[Optional[ProfileScope]] = ContextVar('db_profile_scope', default=None)
+
+
+class DBProfiler:
+    """عد الاستعلامات لكل معالج ومهمة واكتشاف البطيء والمتكرر منها"""
+
+    def __init__(self, enabled: bool = DB_PROFILING):
+        self.enabled = enabled
+        self.logger = logging.getLogger(__name__)
+        self._summaries: Dict[str, ScopeSummary] = {}
+        self._instrumented = False
+
+    def instrument(self, engine):
+        """ربط مستمعي الأحداث بمحرك قاعدة البيانات"""
+        if not self.enabled or self._instrumented:
+            return
+
+        from sqlalchemy import event
+
+        sync_engine = getattr(engine, 'sync_engine', engine)
+
+        # وقت البدء على سياق التنفيذ نفسه: الاستعلام الفاشل لا يترك قيمة تخص غيره
+        @event.listens_for(sync_engine, "before_cursor_execute")
+        def _before_execute(conn, cursor, statement, parameters, context, executemany):
+            context._profile_query_started = time.perf_counter()
+
+        @event.listens_for(sync_engine, "after_cursor_execute")
+        def _after_execute(conn, cursor, statement, parameters, context, executemany):
+            started = getattr(context, '_profile_query_started', None)
+            if started is not None:
+                self._record(statement, parameters, time.perf_counter() - started)
+
+        self._instrumented = True
+        self.logger.info("Database profiling enabled")
+
+    def _record(self, statement: str, parameters: Any, duration: float):
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.record(statement, duration)
+
+        if duration * 1000 >= SLOW_QUERY_MS:
+            self.logger.warning(
+                f"Slow query ({duration * 1000:.1f}ms) in "
+                f"{scope.name if scope else 'unscoped'}: {statement} "
+                f"params={repr(parameters)[:500]}"
+            )
+
+    @asynccontextmanager
+    async def scope(self, name: str):
+        """تجميع استعلامات كتلة برمجية تحت اسم واحد"""
+        if not self.enabled or _current_scope.get() is not None:
+            yield
+            return
+
+        scope = ProfileScope(name)
+        token = _current_scope.set(scope)
+        try:
+            yield
+        finally:
+            _current_scope.reset(token)
+            self._finish(scope)
+
+    def rename(self, name: str):
+        """تسمية النطاق الحالي بعد معرفة المعالج"""
+        scope = _current_scope.get()
+        if scope is not None:
+            scope.name = name
+
+    def _finish(self, scope: ProfileScope):
+        summary = self._summaries.setdefault(scope.name, ScopeSummary())
+        summary.calls += 1
+        summary.statements += scope.statements
+        summary.max_statements = max(summary.max_statements, scope.statements)
+        summary.duration += scope.duration
+
+        # نفس الاستعلام يتكرر داخل تحديث واحد: غالباً تحميل داخل حلقة
+        for statement, count in scope.repeats.items():
+            if count >= N_PLUS_ONE_THRESHOLD:
+                summary.n_plus_one += 1
+                self.logger.warning(
+                    f"Possible N+1 in {scope.name}: statement ran {count} times: "
+                    f"{statement[:300]}"
+                )
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """الإجماليات مرتبة حسب زمن قاعدة البيانات"""
+        rows = [
+            {
+                'name': name,
+                'calls': summary.calls,
+                'statements': summary.statements,
+                'avg_statements': summary.statements / summary.calls if summary.calls else 0,
+                'max_statements': summary.max_statements,
+                'db_time_ms': summary.duration * 1000,
+                'n_plus_one': summary.n_plus_one
+            }
+            for name, summary in self._summaries.items()
+        ]
+        rows.sort(key=lambda row: row['db_time_ms'], reverse=True)
+        return rows
+
+    def report(self):
+        """طباعة الملخص عند إيقاف التشغيل"""
+        if not self.enabled or not self._summaries:
+            return
+
+        lines = ["Database profile summary (by total DB time):"]
+        for row in self.summary()[:PROFILE_SUMMARY_LIMIT]:
+            lines.append(
+                f"  {row['name']}: {row['calls']} calls, "
+                f"{row['avg_statements']:.1f} avg / {row['max_statements']} max statements, "
+                f"{row['db_time_ms']:.1f}ms total"
+                + (f", {row['n_plus_one']} N+1 warnings" if row['n_plus_one'] else "")
+            )
+        self.logger.info("\n".join(lines))
+
+
+class ProfilingMiddleware(BaseMiddleware):
+    """نطاق تحليل لكل تحديث، يسمى باسم المعالج عند الوصول إليه"""
+
+    async def __call__(self, handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+                       event: TelegramObject, data: Dict[str, Any]) -> Any:
+        handler_object = data.get('handler')
+
+        # وسيط داخلي على الموجهات: المعالج معروف والنطاق مفتوح مسبقاً
+        if handler_object is not None:
+            name = getattr(handler_object.callback, '__name__', 'unknown')
+            db_profiler.rename(f"handler:{name}")
+            return await handler(event, data)
+
+        # وسيط خارجي على التحديثات: يشمل استعلامات تحميل المستخدم
+        async with db_profiler.scope(f"update:{getattr(event, 'event_type', 'unknown')}"):
+            return await handler(event, data)
+
+
+# إنشاء مثيل المحلل العام
+db_profiler = DBProfiler()
@@ -0,0 +1,125 @@
+"""
+محدد معدل الطلبات لواجهة تلجرام
+Telegram API Rate Limiter
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from aiogram.exceptions import TelegramRetryAfter
+
+
+# حدود تلجرام الرسمية
+GLOBAL_MESSAGES_PER_SECOND = 30
+PRIVATE_CHAT_INTERVAL = 1.0
+GROUP_CHAT_INTERVAL = 3.0
+MAX_RETRY_AFTER_ATTEMPTS = 3
+
+
+class TokenBucket:
+    """دلو رموز لتحديد معدل الطلبات مع دعم الإيقاف المؤقت"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self, now: float):
+        """إعادة ملء الرموز حسب الوقت المنقضي"""
+        elapsed = now - self.updated_at
+        self.updated_at = now
+        self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+
+    async def acquire(self, tokens: float = 1.0):
+        """انتظار توفر الرموز ثم استهلاكها"""
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+
+                # احترام الإيقاف المؤقت الناتج عن RetryAfter
+                if self.paused_until > now:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+
+                self._refill(now)
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+
+                await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def pause(self, seconds: float):
+        """إيقاف الدلو بالكامل لعدد من الثواني"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class TelegramRateLimiter:
+    """محدد معدل يجمع الحد العام وحد كل محادثة"""
+
+    def __init__(self, global_rate: float = GLOBAL_MESSAGES_PER_SECOND,
+                 private_interval: float = PRIVATE_CHAT_INTERVAL,
+                 group_interval: float = GROUP_CHAT_INTERVAL,
+                 max_tracked_chats: int = 10000):
+        self.bucket = TokenBucket(global_rate)
+        self.private_interval = private_interval
+        self.group_interval = group_interval
+        self.max_tracked_chats = max_tracked_chats
+        self._chat_next_send: Dict[int, float] = {}
+        self.logger = logging.getLogger(__name__)
+
+    def _prune(self, now: float):
+        """حذف المحادثات التي انتهت فترة انتظارها"""
+        if len(self._chat_next_send) <= self.max_tracked_chats:
+            return
+        self._chat_next_send = {
+            chat_id: next_send
+            for chat_id, next_send in self._chat_next_send.items()
+            if next_send > now
+        }
+
+    async def acquire(self, chat_id: Optional[int] = None):
+        """انتظار السماح بإرسال رسالة لمحادثة معينة"""
+        if chat_id is None:
+            # طلبات لا ترسل رسائل تخضع للحد العام فقط
+            await self.bucket.acquire()
+            return
+
+        interval = self.group_interval if chat_id < 0 else self.private_interval
+        now = time.monotonic()
+
+        # حجز الفترة الزمنية التالية لهذه المحادثة
+        next_send = self._chat_next_send.get(chat_id, 0.0)
+        self._chat_next_send[chat_id] = max(now, next_send) + interval
+        self._prune(now)
+
+        if next_send > now:
+            await asyncio.sleep(next_send - now)
+
+        await self.bucket.acquire()
+
+    def pause(self, seconds: float):
+        """إيقاف جميع الإرسالات مؤقتاً"""
+        self.bucket.pause(seconds)
+
+    async def call(self, chat_id: Optional[int], func: Callable[..., Awaitable[Any]],
+                   *args, **kwargs) -> Any:
+        """تنفيذ طلب لتلجرام مع احترام الحدود وإعادة المحاولة عند RetryAfter"""
+        for attempt in range(MAX_RETRY_AFTER_ATTEMPTS + 1):
+            await self.acquire(chat_id)
+            try:
+                return await func(*args, **kwargs)
+            except TelegramRetryAfter as e:
+                if attempt >= MAX_RETRY_AFTER_ATTEMPTS:
+                    raise
+                self.logger.warning(f"Flood control hit, pausing for {e.retry_after}s")
+                self.pause(e.retry_after)
+
+
+# إنشاء مثيل محدد المعدل العام
+telegram_rate_limiter = TelegramRateLimiter()
@@ -0,0 +1,205 @@
+"""
+خط إرسال تذكيرات انتهاء الاشتراك
+Subscription Expiry Reminder Pipeline
+"""
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import List, NamedTuple, Optional, Sequence
+
+from aiogram.exceptions import TelegramBadRequest, TelegramForbiddenError
+from sqlalchemy import and_, exists, insert, select
+
+from config import settings
+from database import db_manager, Plan, ScheduledTask, Subscription, User
+from messages import messages, MessageId
+from rate_limiter import telegram_rate_limiter
+from sharding import shard_clause
+
+
+# إعدادات التذكيرات
+REMINDER_LEAD_HOURS = getattr(settings, 'REMINDER_LEAD_HOURS', 24)
+REMINDER_CONCURRENCY = getattr(settings, 'REMINDER_CONCURRENCY', 20)
+
+# سجل التذكيرات المرسلة (صف لكل اشتراك وتاريخ انتهاء)
+TASK_REMINDER_SENT = "expiry_reminder_sent"
+
+
+class DueReminder(NamedTuple):
+    """بيانات تذكير واحد مستحق"""
+    subscription_id: int
+    user_id: int
+    telegram_id: int
+    language: str
+    plan_id: int
+    plan_name: str
+    end_date: datetime
+
+
+class ReminderPipeline:
+    """تحميل التذكيرات المستحقة باستعلام واحد وإرسالها بالتوازي"""
+
+    def __init__(self, concurrency: int = REMINDER_CONCURRENCY):
+        self.concurrency = concurrency
+        self.logger = logging.getLogger(__name__)
+
+    async def load_due(self, subscription_ids: Optional[Sequence[int]] = None
+                       ) -> List[DueReminder]:
+        """الاشتراكات النشطة التي تستحق تذكيراً ولم يرسل لها بعد"""
+        now = datetime.utcnow()
+
+        already_sent = exists().where(and_(
+            ScheduledTask.task_type == TASK_REMINDER_SENT,
+            ScheduledTask.subscription_id == Subscription.id,
+            ScheduledTask.scheduled_time == Subscription.end_date
+        ))
+
+        query = (
+            select(
+                Subscription.id, Subscription.user_id, Subscription.end_date,
+                User.telegram_id, User.preferred_language,
+                Plan.id, Plan.name_ar, Plan.name_en
+            )
+            .join(User, User.id == Subscription.user_id)
+            .join(Plan, Plan.id == Subscription.plan_id)
+            .where(
+                Subscription.status == "active",
+                Subscription.end_date > now,
+                ~already_sent
+            )
+        )
+
+        if subscription_ids is not None:
+            if not subscription_ids:
+                return []
+            query = query.where(Subscription.id.in_(list(subscription_ids)))
+        else:
+            query = query.where(
+                Subscription.end_date <= now + timedelta(hours=REMINDER_LEAD_HOURS),
+                shard_clause(Subscription.user_id)
+            )
+
+        async with db_manager.get_session() as session:
+            result = await session.execute(query)
+            rows = result.all()
+
+        reminders = []
+        for (subscription_id, user_id, end_date, telegram_id, language,
+             plan_id, name_ar, name_en) in rows:
+            language = language or "en"
+            reminders.append(DueReminder(
+                subscription_id=subscription_id,
+                user_id=user_id,
+                telegram_id=telegram_id,
+                language=language,
+                plan_id=plan_id,
+                plan_name=name_ar if language == "ar" else name_en,
+                end_date=end_date
+            ))
+        return reminders
+
+    async def _deliver(self, bot, reminder: DueReminder, text: str) -> bool:
+        """إرسال تذكير واحد؛ يعيد True إذا لم يعد بحاجة لإعادة المحاولة"""
+        from keyboards import keyboard_manager
+
+        keyboard = keyboard_manager.get_renewal_reminder_keyboard(
+            reminder.subscription_id, reminder.language
+        )
+
+        try:
+            await telegram_rate_limiter.call(
+                reminder.telegram_id,
+                bot.send_message,
+                chat_id=reminder.telegram_id,
+                text=text,
+                reply_markup=keyboard
+            )
+            return True
+
+        except TelegramForbiddenError:
+            # المستخدم حظر البوت، لا فائدة من إعادة المحاولة
+            self.logger.info(f"User {reminder.telegram_id} blocked the bot, reminder skipped")
+            return True
+
+        except TelegramBadRequest as e:
+            self.logger.warning(f"Reminder to user {reminder.telegram_id} rejected: {e}")
+            return True
+
+        except Exception as e:
+            self.logger.error(f"Error sending expiry reminder to {reminder.telegram_id}: {e}")
+            return False
+
+    async def _record_sent(self, reminders: List[DueReminder]):
+        """حفظ التذكيرات المرسلة حتى لا تتكرر في الفحص التالي"""
+        if not reminders:
+            return
+
+        now = datetime.utcnow()
+        async with db_manager.get_session() as session:
+            await session.execute(
+                insert(ScheduledTask),
+                [
+                    {
+                        'task_type': TASK_REMINDER_SENT,
+                        'user_id': reminder.user_id,
+                        'subscription_id': reminder.subscription_id,
+                        'scheduled_time': reminder.end_date,
+                        'task_data': {},
+                        'status': "completed",
+                        'executed_at': now
+                    }
+                    for reminder in reminders
+                ]
+            )
+            await session.commit()
+
+    async def send(self, bot, reminders: List[DueReminder]) -> int:
+        """إرسال التذكيرات بالتوازي ضمن حدود تلجرام"""
+        if not reminders or not bot:
+            return 0
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        now = datetime.utcnow()
+
+        # تنسيق كل الرسائل دفعة واحدة من القالب المحلل مسبقاً
+        texts = messages.render_many(
+            MessageId.SUBSCRIPTION_EXPIRING,
+            (
+                (reminder.language, {
+                    'plan_name': reminder.plan_name,
+                    'hours': int((reminder.end_date - now).total_seconds() / 3600),
+                    'end_date': reminder.end_date.strftime("%Y-%m-%d %H:%M")
+                })
+                for reminder in reminders
+            )
+        )
+
+        async def deliver(reminder: DueReminder, text: str) -> bool:
+            async with semaphore:
+                return await self._deliver(bot, reminder, text)
+
+        results = await asyncio.gather(
+            *(deliver(reminder, text) for reminder, text in zip(reminders, texts))
+        )
+
+        done = [reminder for reminder, ok in zip(reminders, results) if ok]
+        await self._record_sent(done)
+        return len(done)
+
+    async def run(self, bot, subscription_ids: Optional[Sequence[int]] = None) -> int:
+        """تحميل التذكيرات المستحقة وإرسالها"""
+        try:
+            reminders = await self.load_due(subscription_ids)
+            sent = await self.send(bot, reminders)
+            if reminders:
+                self.logger.info(f"Sent {sent}/{len(reminders)} expiry reminders")
+            return sent
+
+        except Exception as e:
+            self.logger.error(f"Error running expiry reminders: {e}")
+            return 0
+
+
+# إنشاء مثيل خط التذكيرات العام
+reminder_pipeline = ReminderPipeline()
@@ -0,0 +1,144 @@
+"""
+ذاكرة الشاشات الجاهزة
+Rendered Screen Cache
+"""
+
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, Hashable, Optional
+
+from aiogram.types import InlineKeyboardMarkup
+
+from catalog import catalog
+from keyboards import keyboard_manager
+from localization import message_formatter
+from messages import messages, MessageId
+
+
+@dataclass(frozen=True, slots=True)
+class Screen:
+    """نص الشاشة ولوحة أزرارها (كائنات aiogram ثابتة ويعاد استخدامها)"""
+    text: str
+    reply_markup: Optional[InlineKeyboardMarkup]
+
+
+class RenderCache:
+    """بناء كل شاشة مرة واحدة لكل (شاشة، لغة، دور، نسخة الفهرس)"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._screens: Dict[Hashable, Screen] = {}
+        self._catalog_version = catalog.version
+
+    def __len__(self) -> int:
+        return len(self._screens)
+
+    def _get(self, key: Hashable, build: Callable[[], Screen]) -> Screen:
+        # تغير الفهرس يبطل كل الشاشات؛ إعادة بنائها رخيصة
+        if self._catalog_version != catalog.version:
+            self._screens.clear()
+            self._catalog_version = catalog.version
+
+        screen = self._screens.get(key)
+        if screen is None:
+            screen = build()
+            self._screens[key] = screen
+        return screen
+
+    def clear(self):
+        self._screens.clear()
+
+    def main_menu(self, language: str, is_admin: bool) -> Screen:
+        return self._get(
+            ('main_menu', language, is_admin),
+            lambda: Screen(
+                messages.render(MessageId.MAIN_MENU, language),
+                keyboard_manager.get_main_menu_keyboard(language, is_admin)
+            )
+        )
+
+    def language_selection(self) -> Screen:
+        return self._get(
+            ('language_selection',),
+            lambda: Screen(
+                messages.render(MessageId.START, 'en'),
+                keyboard_manager.get_language_selection_keyboard()
+            )
+        )
+
+    def settings(self, language: str) -> Screen:
+        return self._get(
+            ('settings', language),
+            lambda: Screen(
+                messages.render(MessageId.SETTINGS, language),
+                keyboard_manager.get_settings_keyboard(language)
+            )
+        )
+
+    def admin_panel(self, language: str) -> Screen:
+        return self._get(
+            ('admin_panel', language),
+            lambda: Screen(
+                messages.render(MessageId.ADMIN_WELCOME, language),
+                keyboard_manager.get_admin_panel_keyboard(language)
+            )
+        )
+
+    def free_channels(self, language: str, is_admin: bool) -> Screen:
+        def build() -> Screen:
+            channels = catalog.channels_of_type("public")
+            if not channels:
+                return Screen(
+                    messages.render(MessageId.NO_FREE_CHANNELS, language),
+                    self.main_menu(language, is_admin).reply_markup
+                )
+
+            return Screen(
+                messages.render(MessageId.FREE_CHANNELS_LIST, language),
+                keyboard_manager.get_free_channels_keyboard(
+                    [channel.as_dict() for channel in channels],
+                    language
+                )
+            )
+
+        # القائمة غير الفارغة لا تعتمد على الدور
+        role = is_admin if not catalog.channels_of_type("public") else None
+        return self._get(('free_channels', language, role), build)
+
+    def subscription_plans(self, language: str, is_admin: bool) -> Screen:
+        def build() -> Screen:
+            plans = catalog.plans()
+            if not plans:
+                return Screen(
+                    messages.render(MessageId.NO_PLANS, language),
+                    self.main_menu(language, is_admin).reply_markup
+                )
+
+            return Screen(
+                messages.render(MessageId.SUBSCRIPTION_PLANS, language),
+                keyboard_manager.get_subscription_plans_keyboard(
+                    [plan.as_dict() for plan in plans],
+                    language
+                )
+            )
+
+        role = is_admin if not catalog.plans() else None
+        return self._get(('subscription_plans', language, role), build)
+
+    def plan_details(self, plan_id: int, language: str) -> Optional[Screen]:
+        plan = catalog.plan(plan_id)
+        if plan is None:
+            return None
+
+        def build() -> Screen:
+            plan_details = message_formatter.format_subscription_plan(plan.as_dict(), language)
+            return Screen(
+                f"{plan_details}\n\n{messages.render(MessageId.PAYMENT_INSTRUCTIONS, language)}",
+                keyboard_manager.get_payment_methods_keyboard(plan_id, language)
+            )
+
+        return self._get(('plan_details', plan_id, language), build)
+
+
+# إنشاء مثيل ذاكرة الشاشات العامة
+render_cache = RenderCache()
@@ -0,0 +1,178 @@
+"""
+التقارير اليومية وتخزين المقاييس
+Daily Reports and Metric Storage
+"""
+
+import logging
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, func, literal, select, union_all
+
+from database import db_manager, Analytics, Payment, Subscription, User
+from stats_counters import day_range
+
+
+logger = logging.getLogger(__name__)
+
+# أسماء المقاييس اليومية
+METRIC_NEW_USERS = "daily_new_users"
+METRIC_NEW_SUBSCRIPTIONS = "daily_new_subscriptions"
+METRIC_REVENUE = "daily_revenue"
+DAILY_METRICS = (METRIC_NEW_USERS, METRIC_NEW_SUBSCRIPTIONS, METRIC_REVENUE)
+
+
+def _as_date(value) -> date:
+    """تحويل ناتج func.date إلى تاريخ (SQLite يعيده نصاً)"""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value)[:10])
+
+
+async def upsert_analytics(session, rows: List[Dict[str, Any]]):
+    """إدراج المقاييس أو تحديثها حسب (metric_name, metric_date)"""
+    if not rows:
+        return
+
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        statement = insert(Analytics).values(rows)
+        statement = statement.on_conflict_do_update(
+            index_elements=[Analytics.metric_name, Analytics.metric_date],
+            set_={'metric_value': statement.excluded.metric_value}
+        )
+        await session.execute(statement)
+        return
+
+    # قواعد أخرى: حذف ثم إدراج داخل نفس المعاملة
+    for row in rows:
+        await session.execute(
+            delete(Analytics).where(
+                Analytics.metric_name == row['metric_name'],
+                Analytics.metric_date == row['metric_date']
+            )
+        )
+    await session.execute(Analytics.__table__.insert(), rows)
+
+
+async def compute_daily_metrics(session, day: date) -> Dict[str, float]:
+    """حساب مقاييس يوم واحد في رحلة واحدة لقاعدة البيانات"""
+    start, end = day_range(day)
+
+    result = await session.execute(
+        select(
+            select(func.count(User.id))
+            .where(User.registration_date >= start, User.registration_date < end)
+            .scalar_subquery(),
+            select(func.count(Subscription.id))
+            .where(Subscription.created_at >= start, Subscription.created_at < end)
+            .scalar_subquery(),
+            select(func.coalesce(func.sum(Payment.amount), 0))
+            .where(
+                Payment.status == "completed",
+                Payment.completed_at >= start,
+                Payment.completed_at < end
+            )
+            .scalar_subquery()
+        )
+    )
+    new_users, new_subscriptions, revenue = result.one()
+
+    return {
+        METRIC_NEW_USERS: new_users or 0,
+        METRIC_NEW_SUBSCRIPTIONS: new_subscriptions or 0,
+        METRIC_REVENUE: float(revenue or 0)
+    }
+
+
+async def generate_daily_report(day: date) -> Dict[str, float]:
+    """حساب مقاييس اليوم وحفظها بشكل متكرر الأمان"""
+    async with db_manager.get_session() as session:
+        metrics = await compute_daily_metrics(session, day)
+
+        await upsert_analytics(session, [
+            {'metric_name': name, 'metric_value': value, 'metric_date': day}
+            for name, value in metrics.items()
+        ])
+        await session.commit()
+
+    return metrics
+
+
+async def backfill_daily_reports(start: date, end: date) -> int:
+    """حساب المقاييس لنطاق أيام [start, end) باستعلام واحد"""
+    if start >= end:
+        return 0
+
+    range_start, _ = day_range(start)
+    range_end, _ = day_range(end)
+
+    users_day = func.date(User.registration_date)
+    subs_day = func.date(Subscription.created_at)
+    payments_day = func.date(Payment.completed_at)
+
+    query = union_all(
+        select(literal(METRIC_NEW_USERS), users_day, func.count(User.id))
+        .where(User.registration_date >= range_start, User.registration_date < range_end)
+        .group_by(users_day),
+        select(literal(METRIC_NEW_SUBSCRIPTIONS), subs_day, func.count(Subscription.id))
+        .where(Subscription.created_at >= range_start, Subscription.created_at < range_end)
+        .group_by(subs_day),
+        select(literal(METRIC_REVENUE), payments_day, func.sum(Payment.amount))
+        .where(
+            Payment.status == "completed",
+            Payment.completed_at >= range_start,
+            Payment.completed_at < range_end
+        )
+        .group_by(payments_day)
+    )
+
+    async with db_manager.get_session() as session:
+        result = await session.execute(query)
+
+        # الأيام التي لا نشاط فيها تحفظ بقيمة صفر
+        values: Dict[Tuple[str, date], float] = {}
+        day = start
+        while day < end:
+            for name in DAILY_METRICS:
+                values[(name, day)] = 0
+            day += timedelta(days=1)
+
+        for name, day_value, value in result.all():
+            values[(name, _as_date(day_value))] = float(value or 0)
+
+        rows = [
+            {'metric_name': name, 'metric_value': value, 'metric_date': day}
+            for (name, day), value in values.items()
+        ]
+        await upsert_analytics(session, rows)
+        await session.commit()
+
+    logger.info(f"Backfilled daily reports from {start} to {end}")
+    return len(rows)
+
+
+async def find_missing_report_range(today: date) -> Optional[Tuple[date, date]]:
+    """الأيام السابقة التي لم تحسب تقاريرها بعد"""
+    async with db_manager.get_session() as session:
+        result = await session.execute(
+            select(func.max(Analytics.metric_date))
+            .where(Analytics.metric_name.in_(DAILY_METRICS))
+        )
+        last_day = result.scalar()
+
+    if last_day is None:
+        return None
+
+    start = _as_date(last_day) + timedelta(days=1)
+    if start >= today:
+        return None
+    return start, today
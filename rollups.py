@@ -0,0 +1,416 @@
+"""
+جداول التجميع للإيرادات والاشتراكات
+Revenue and Subscription Rollup Tables
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    Column, DateTime, Float, Index, Integer, String, and_, delete, exists, select, update
+)
+from sqlalchemy.orm import aliased
+
+from config import settings
+from database import Base, db_manager, Payment, Subscription
+
+
+# إعدادات التجميع
+ROLLUP_INTERVAL_MINUTES = getattr(settings, 'ROLLUP_INTERVAL_MINUTES', 5)
+ROLLUP_LAG_SECONDS = getattr(settings, 'ROLLUP_LAG_SECONDS', 60)
+ROLLUP_HOURLY_RETENTION_DAYS = getattr(settings, 'ROLLUP_HOURLY_RETENTION_DAYS', 7)
+# 8 معاملات لكل صف: 100 صف تبقى تحت حد SQLite القديم (999) وحد asyncpg (32767)
+ROLLUP_INSERT_BATCH_SIZE = getattr(settings, 'ROLLUP_INSERT_BATCH_SIZE', 100)
+
+# مستويات التجميع
+GRANULARITY_HOUR = "hour"
+GRANULARITY_DAY = "day"
+GRANULARITY_MONTH = "month"
+
+# المقاييس
+METRIC_REVENUE = "revenue"
+METRIC_PAYMENTS = "payments"
+METRIC_SUBSCRIPTIONS_NEW = "subscriptions_new"
+METRIC_SUBSCRIPTIONS_RENEWED = "subscriptions_renewed"
+METRIC_SUBSCRIPTIONS_EXPIRED = "subscriptions_expired"
+
+# علامات التقدم
+WATERMARK_PAYMENTS = "payments"
+WATERMARK_SUBSCRIPTIONS_CREATED = "subscriptions_created"
+WATERMARK_SUBSCRIPTIONS_EXPIRED = "subscriptions_expired"
+WATERMARK_COMPACTION = "compaction"
+
+RollupKey = Tuple[datetime, str, int, str, str]
+
+
+class MetricRollup(Base):
+    """قيمة مقياس مجمعة لفترة زمنية وأبعاد محددة"""
+    __tablename__ = "metric_rollups"
+
+    id = Column(Integer, primary_key=True)
+    granularity = Column(String(10), nullable=False)
+    bucket_start = Column(DateTime, nullable=False)
+    metric = Column(String(50), nullable=False)
+    plan_id = Column(Integer, nullable=False, default=0)
+    currency = Column(String(10), nullable=False, default="")
+    provider = Column(String(20), nullable=False, default="")
+    value = Column(Float, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        Index(
+            'uq_metric_rollups_bucket',
+            'granularity', 'bucket_start', 'metric', 'plan_id', 'currency', 'provider',
+            unique=True
+        ),
+    )
+
+
+class RollupWatermark(Base):
+    """آخر نقطة زمنية تم تجميعها لكل مصدر"""
+    __tablename__ = "rollup_watermarks"
+
+    name = Column(String(50), primary_key=True)
+    position = Column(DateTime, nullable=False)
+
+
+def hour_bucket(moment: datetime) -> datetime:
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def day_bucket(moment: datetime) -> datetime:
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def month_bucket(moment: datetime) -> datetime:
+    return day_bucket(moment).replace(day=1)
+
+
+async def _upsert_rollups(session, granularity: str,
+                          values: Dict[RollupKey, List[float]], additive: bool):
+    """حفظ قيم التجميع؛ الجمع مع القيم الحالية أو استبدالها"""
+    if not values:
+        return
+
+    rows = [
+        {
+            'granularity': granularity,
+            'bucket_start': bucket,
+            'metric': metric,
+            'plan_id': plan_id,
+            'currency': currency,
+            'provider': provider,
+            'value': total[0],
+            'count': int(total[1])
+        }
+        for (bucket, metric, plan_id, currency, provider), total in values.items()
+    ]
+
+    dialect = session.get_bind().dialect.name
+
+    if dialect in ("postgresql", "sqlite"):
+        if dialect == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        # دفعات صغيرة حتى لا يتجاوز عدد المعاملات حد قاعدة البيانات
+        for start in range(0, len(rows), ROLLUP_INSERT_BATCH_SIZE):
+            statement = insert(MetricRollup).values(rows[start:start + ROLLUP_INSERT_BATCH_SIZE])
+            if additive:
+                updates = {
+                    'value': MetricRollup.value + statement.excluded.value,
+                    'count': MetricRollup.count + statement.excluded.count
+                }
+            else:
+                updates = {
+                    'value': statement.excluded.value,
+                    'count': statement.excluded.count
+                }
+
+            await session.execute(
+                statement.on_conflict_do_update(
+                    index_elements=[
+                        MetricRollup.granularity, MetricRollup.bucket_start, MetricRollup.metric,
+                        MetricRollup.plan_id, MetricRollup.currency, MetricRollup.provider
+                    ],
+                    set_=updates
+                )
+            )
+        return
+
+    # قواعد أخرى: تحديث الصف الموجود أو إدراجه داخل نفس المعاملة
+    for row in rows:
+        key = and_(
+            MetricRollup.granularity == row['granularity'],
+            MetricRollup.bucket_start == row['bucket_start'],
+            MetricRollup.metric == row['metric'],
+            MetricRollup.plan_id == row['plan_id'],
+            MetricRollup.currency == row['currency'],
+            MetricRollup.provider == row['provider']
+        )
+        if additive:
+            values = {
+                'value': MetricRollup.value + row['value'],
+                'count': MetricRollup.count + row['count']
+            }
+        else:
+            values = {'value': row['value'], 'count': row['count']}
+
+        result = await session.execute(update(MetricRollup).where(key).values(**values))
+        if result.rowcount == 0:
+            await session.execute(MetricRollup.__table__.insert(), [row])
+
+
+class RollupManager:
+    """تجميع تدريجي للمدفوعات والاشتراكات في جداول صغيرة"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self.summary: Dict[str, Any] = {}
+
+    async def _get_watermark(self, session, name: str) -> Optional[datetime]:
+        result = await session.execute(
+            select(RollupWatermark.position).where(RollupWatermark.name == name)
+        )
+        return result.scalar()
+
+    async def _set_watermark(self, session, name: str, position: datetime):
+        await session.merge(RollupWatermark(name=name, position=position))
+
+    async def _since(self, session, name: str, column, *criteria) -> datetime:
+        """علامة التقدم المحفوظة؛ في التشغيل الأول فقط أقدم سجل في المصدر"""
+        since = await self._get_watermark(session, name)
+        if since is not None:
+            return since
+
+        from sqlalchemy import func
+
+        result = await session.execute(select(func.min(column)).where(*criteria))
+        return result.scalar() or datetime.utcnow()
+
+    async def fold(self, until: Optional[datetime] = None):
+        """تجميع الأحداث الجديدة منذ آخر تشغيل في فترات ساعية"""
+        until = until or datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+
+        async with db_manager.get_session() as session:
+            hourly: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+
+            # المدفوعات المكتملة
+            since = await self._since(
+                session, WATERMARK_PAYMENTS, Payment.completed_at, Payment.status == "completed"
+            )
+            result = await session.execute(
+                select(
+                    Payment.completed_at, Payment.plan_id,
+                    Payment.currency, Payment.provider, Payment.amount
+                )
+                .where(
+                    Payment.status == "completed",
+                    Payment.completed_at >= since,
+                    Payment.completed_at < until
+                )
+            )
+            for completed_at, plan_id, currency, provider, amount in result.all():
+                dims = (plan_id or 0, currency or "", provider or "")
+                revenue = hourly[(hour_bucket(completed_at), METRIC_REVENUE, *dims)]
+                revenue[0] += float(amount or 0)
+                revenue[1] += 1
+                payments = hourly[(hour_bucket(completed_at), METRIC_PAYMENTS, *dims)]
+                payments[0] += 1
+                payments[1] += 1
+            await self._set_watermark(session, WATERMARK_PAYMENTS, until)
+
+            # الاشتراكات الجديدة والمجددة
+            since = await self._since(
+                session, WATERMARK_SUBSCRIPTIONS_CREATED, Subscription.created_at
+            )
+            previous = aliased(Subscription)
+            is_renewal = exists().where(and_(
+                previous.user_id == Subscription.user_id,
+                previous.id != Subscription.id,
+                previous.created_at < Subscription.created_at
+            ))
+            result = await session.execute(
+                select(Subscription.created_at, Subscription.plan_id, is_renewal)
+                .where(
+                    Subscription.created_at >= since,
+                    Subscription.created_at < until
+                )
+            )
+            for created_at, plan_id, renewed in result.all():
+                metric = METRIC_SUBSCRIPTIONS_RENEWED if renewed else METRIC_SUBSCRIPTIONS_NEW
+                bucket = hourly[(hour_bucket(created_at), metric, plan_id or 0, "", "")]
+                bucket[0] += 1
+                bucket[1] += 1
+            await self._set_watermark(session, WATERMARK_SUBSCRIPTIONS_CREATED, until)
+
+            # الاشتراكات المنتهية
+            since = await self._since(
+                session, WATERMARK_SUBSCRIPTIONS_EXPIRED, Subscription.updated_at,
+                Subscription.status == "expired"
+            )
+            result = await session.execute(
+                select(Subscription.updated_at, Subscription.plan_id)
+                .where(
+                    Subscription.status == "expired",
+                    Subscription.updated_at >= since,
+                    Subscription.updated_at < until
+                )
+            )
+            for updated_at, plan_id in result.all():
+                bucket = hourly[(hour_bucket(updated_at), METRIC_SUBSCRIPTIONS_EXPIRED,
+                                 plan_id or 0, "", "")]
+                bucket[0] += 1
+                bucket[1] += 1
+            await self._set_watermark(session, WATERMARK_SUBSCRIPTIONS_EXPIRED, until)
+
+            # حفظ القيم وعلامات التقدم في نفس المعاملة
+            await _upsert_rollups(session, GRANULARITY_HOUR, hourly, additive=True)
+            await session.commit()
+
+        return len(hourly)
+
+    async def compact(self, until: Optional[datetime] = None):
+        """ضغط الفترات الساعية إلى يومية ثم شهرية وحذف الساعية القديمة"""
+        # اليوم المفتوح هو يوم آخر نقطة جمعها fold وليس يوم الساعة الحالية
+        until = until or datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+        today = day_bucket(until)
+
+        async with db_manager.get_session() as session:
+            # أول يوم لم يكتمل ضغطه؛ في التشغيل الأول أقدم فترة ساعية مجمعة
+            start_day = await self._get_watermark(session, WATERMARK_COMPACTION)
+            if start_day is None:
+                from sqlalchemy import func
+
+                result = await session.execute(
+                    select(func.min(MetricRollup.bucket_start))
+                    .where(MetricRollup.granularity == GRANULARITY_HOUR)
+                )
+                start_day = day_bucket(result.scalar() or today)
+
+            result = await session.execute(
+                select(
+                    MetricRollup.bucket_start, MetricRollup.metric, MetricRollup.plan_id,
+                    MetricRollup.currency, MetricRollup.provider,
+                    MetricRollup.value, MetricRollup.count
+                )
+                .where(
+                    MetricRollup.granularity == GRANULARITY_HOUR,
+                    MetricRollup.bucket_start >= start_day
+                )
+            )
+            daily: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+            for bucket, metric, plan_id, currency, provider, value, count in result.all():
+                total = daily[(day_bucket(bucket), metric, plan_id, currency, provider)]
+                total[0] += value
+                total[1] += count
+            await _upsert_rollups(session, GRANULARITY_DAY, daily, additive=False)
+
+            # إعادة حساب الأشهر المتأثرة من الفترات اليومية
+            start_month = month_bucket(start_day)
+            result = await session.execute(
+                select(
+                    MetricRollup.bucket_start, MetricRollup.metric, MetricRollup.plan_id,
+                    MetricRollup.currency, MetricRollup.provider,
+                    MetricRollup.value, MetricRollup.count
+                )
+                .where(
+                    MetricRollup.granularity == GRANULARITY_DAY,
+                    MetricRollup.bucket_start >= start_month
+                )
+            )
+            monthly: Dict[RollupKey, List[float]] = defaultdict(lambda: [0.0, 0])
+            for bucket, metric, plan_id, currency, provider, value, count in result.all():
+                total = monthly[(month_bucket(bucket), metric, plan_id, currency, provider)]
+                total[0] += value
+                total[1] += count
+            await _upsert_rollups(session, GRANULARITY_MONTH, monthly, additive=False)
+
+            # اليوم الحالي يبقى مفتوحاً حتى ينتهي
+            await self._set_watermark(session, WATERMARK_COMPACTION, today)
+
+            retention = today - timedelta(days=ROLLUP_HOURLY_RETENTION_DAYS)
+            await session.execute(
+                delete(MetricRollup).where(
+                    MetricRollup.granularity == GRANULARITY_HOUR,
+                    MetricRollup.bucket_start < min(retention, start_day)
+                )
+            )
+            await session.commit()
+
+    async def refresh(self):
+        """دورة كاملة: تجميع ثم ضغط ثم تحديث الملخص"""
+        try:
+            until = datetime.utcnow() - timedelta(seconds=ROLLUP_LAG_SECONDS)
+            folded = await self.fold(until)
+            await self.compact(until)
+            self.summary = await self.build_summary()
+            self.logger.info(f"Rollups refreshed ({folded} hourly buckets updated)")
+        except Exception as e:
+            self.logger.error(f"Error refreshing rollups: {e}")
+
+    async def get_summary(self) -> Dict[str, Any]:
+        """الملخص المحفوظ، أو حسابه من الجداول الصغيرة إذا كان قديماً"""
+        updated_at = self.summary.get('updated_at')
+        if updated_at is None or datetime.utcnow() - updated_at > timedelta(minutes=ROLLUP_INTERVAL_MINUTES):
+            try:
+                self.summary = await self.build_summary()
+            except Exception as e:
+                self.logger.error(f"Error building rollup summary: {e}")
+        return self.summary
+
+    async def series(self, granularity: str, metric: str, start: datetime,
+                     end: datetime, plan_id: Optional[int] = None
+                     ) -> List[Tuple[datetime, float, int]]:
+        """سلسلة زمنية لمقياس من جداول التجميع"""
+        from sqlalchemy import func
+
+        query = (
+            select(
+                MetricRollup.bucket_start,
+                func.sum(MetricRollup.value),
+                func.sum(MetricRollup.count)
+            )
+            .where(
+                MetricRollup.granularity == granularity,
+                MetricRollup.metric == metric,
+                MetricRollup.bucket_start >= start,
+                MetricRollup.bucket_start < end
+            )
+            .group_by(MetricRollup.bucket_start)
+            .order_by(MetricRollup.bucket_start)
+        )
+        if plan_id is not None:
+            query = query.where(MetricRollup.plan_id == plan_id)
+
+        async with db_manager.get_session() as session:
+            result = await session.execute(query)
+            return [(bucket, float(value or 0), int(count or 0)) for bucket, value, count in result.all()]
+
+    async def build_summary(self) -> Dict[str, Any]:
+        """الإيرادات الشهرية المتكررة ومعدل التجديد لآخر 30 يوماً"""
+        end = day_bucket(datetime.utcnow()) + timedelta(days=1)
+        start = end - timedelta(days=30)
+
+        revenue = await self.series(GRANULARITY_DAY, METRIC_REVENUE, start, end)
+        renewed = await self.series(GRANULARITY_DAY, METRIC_SUBSCRIPTIONS_RENEWED, start, end)
+        expired = await self.series(GRANULARITY_DAY, METRIC_SUBSCRIPTIONS_EXPIRED, start, end)
+
+        renewed_count = sum(value for _, value, _ in renewed)
+        expired_count = sum(value for _, value, _ in expired)
+        due_count = renewed_count + expired_count
+
+        return {
+            'mrr': sum(value for _, value, _ in revenue),
+            'renewal_rate': (renewed_count / due_count * 100) if due_count else 0.0,
+            'renewed': int(renewed_count),
+            'expired': int(expired_count),
+            'updated_at': datetime.utcnow()
+        }
+
+
+# إنشاء مثيل مدير التجميع العام
+rollup_manager = RollupManager()
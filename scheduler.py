@@ -4,22 +4,40 @@ Scheduler for Notifications and Automated Tasks
 """
 
 import asyncio
+import functools
 import logging
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.jobstores.memory import MemoryJobStore
 from apscheduler.executors.asyncio import AsyncIOExecutor
-from apscheduler.triggers.date import DateTrigger
 from apscheduler.triggers.interval import IntervalTrigger
 from apscheduler.triggers.cron import CronTrigger
 
 from config import settings
-from database import (
-    db_manager, subscription_service, user_service, 
-    ScheduledTask, Subscription, User, Analytics
-)
-from localization import translator, get_user_language
+from database import db_manager, user_service, ScheduledTask, Subscription
+from rate_limiter import telegram_rate_limiter
+from expiry_timers import ExpiryTimers
+from task_store import ScheduledTaskStore, TaskRecord
+from leader_election import LeaderElector, create_lease
+from sharding import owns_global_jobs, owns_user, shard_clause, shard_lease_name
+from stats_counters import stats_counters, STATS_RECONCILE_MINUTES
+from reports import backfill_daily_reports, find_missing_report_range, generate_daily_report
+from rollups import rollup_manager, ROLLUP_INTERVAL_MINUTES
+from reminders import reminder_pipeline
+from messages import messages, MessageId
+from metrics import queue_depth, track_job
+
+
+# إعدادات معالجة الاشتراكات المنتهية
+EXPIRY_BATCH_SIZE = getattr(settings, 'EXPIRY_BATCH_SIZE', 500)
+EXPIRY_CONCURRENCY = getattr(settings, 'EXPIRY_CONCURRENCY', 20)
+EXPIRY_CLAIM_TIMEOUT_MINUTES = getattr(settings, 'EXPIRY_CLAIM_TIMEOUT_MINUTES', 10)
+# فحص احتياطي متباعد فقط؛ المؤقتات وإعادة تحميلها تعالج الانتهاء في الأحوال العادية
+EXPIRY_SWEEP_MINUTES = getattr(settings, 'EXPIRY_SWEEP_MINUTES', 60)
+
+# حالة مؤقتة للاشتراك المحجوز لدى إحدى النسخ أثناء إنهائه
+STATUS_EXPIRING = "expiring"
 
 
 class BotScheduler:
@@ -47,6 +65,42 @@ class BotScheduler:
             job_defaults=job_defaults,
             timezone=settings.SCHEDULER_TIMEZONE
         )
+        
+        # مؤقتات دقيقة لانتهاء الاشتراكات والتذكيرات
+        self.expiry_timers = ExpiryTimers(
+            on_expire=self.expire_subscription_ids,
+            on_remind=self.send_expiry_reminders
+        )
+        
+        queue_depth.set_function(lambda: len(self.expiry_timers), queue="expiry_timers")
+        
+        # المهام المجدولة المحفوظة في قاعدة البيانات
+        self.task_store = ScheduledTaskStore(self.scheduler, gate=self.is_leader)
+        self.task_store.register("expiry_reminder", self._run_reminder_tasks)
+        self.task_store.register("auto_kick", self._run_kick_tasks)
+        
+        # استعادة المهام بعد تولي القيادة (تعمل في الخلفية)
+        self._takeover: Optional[asyncio.Task] = None
+        
+        # نسخة واحدة فقط (القائد) تنفذ المهام الدورية
+        self.elector = LeaderElector(
+            create_lease(shard_lease_name("bot_scheduler")),
+            on_elected=self._on_elected,
+            on_demoted=self._on_demoted
+        )
+    
+    def is_leader(self) -> bool:
+        """هل هذه النسخة هي القائد الحالي"""
+        return self.elector.is_leader
+    
+    def _leader_only(self, func, global_job: bool = True):
+        """تغليف مهمة دورية لتعمل في نسخة القائد (للقسم الأول فقط إن كانت عامة)"""
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not self.is_leader() or (global_job and not owns_global_jobs()):
+                return
+            return await func(*args, **kwargs)
+        return wrapper
     
     async def start(self):
         """بدء المجدول"""
@@ -55,34 +109,125 @@ class BotScheduler:
         
         # جدولة المهام الدورية
         await self.schedule_recurring_tasks()
+        
+        # متابعة الاشتراكات الجديدة والمجددة فور كتابتها
+        self._watch_subscriptions(True)
+        
+        # تحميل آخر قيم العدادات ثم مطابقتها في الخلفية كمهمة في المجدول
+        await stats_counters.load()
+        self.scheduler.add_job(
+            func=track_job("reconcile_stat_counters")(stats_counters.reconcile),
+            id='reconcile_stat_counters_startup',
+            replace_existing=True
+        )
+        
+        # بدء انتخاب القائد
+        await self.elector.start()
     
     async def stop(self):
         """إيقاف المجدول"""
+        self._watch_subscriptions(False)
+        await self.elector.stop()
+        await self.expiry_timers.stop()
+        await self.task_store.flush()
         self.scheduler.shutdown()
         self.logger.info("Scheduler stopped")
     
+    async def _on_elected(self):
+        """تولي القيادة: تحميل المواعيد واستعادة المهام في الخلفية"""
+        await self.expiry_timers.start()
+        
+        # تنفيذ المهام المتأخرة قد يطول؛ لا يجوز أن يؤخر تجديد عقد القيادة
+        self._takeover = asyncio.create_task(self._restore_tasks())
+    
+    async def _restore_tasks(self):
+        try:
+            await self.task_store.start()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.logger.error(f"Error restoring scheduled tasks: {e}")
+    
+    async def _on_demoted(self):
+        """فقدان القيادة: إيقاف المؤقتات واستعادة المهام الجارية"""
+        if self._takeover:
+            self._takeover.cancel()
+            await asyncio.gather(self._takeover, return_exceptions=True)
+            self._takeover = None
+        await self.expiry_timers.stop()
+    
+    def track_subscription(self, subscription_id: int, end_date: datetime):
+        """تسجيل موعد انتهاء اشتراك جديد أو مجدد"""
+        self.expiry_timers.schedule(subscription_id, end_date)
+    
+    def untrack_subscription(self, subscription_id: int):
+        """إلغاء مواعيد اشتراك ملغي"""
+        self.expiry_timers.cancel(subscription_id)
+    
+    def _watch_subscriptions(self, enabled: bool):
+        """تسجيل أو إزالة مستمعي كتابة الاشتراكات"""
+        from sqlalchemy import event
+        
+        for name in ("after_insert", "after_update"):
+            listening = event.contains(Subscription, name, self._subscription_written)
+            if enabled and not listening:
+                event.listen(Subscription, name, self._subscription_written)
+            elif not enabled and listening:
+                event.remove(Subscription, name, self._subscription_written)
+    
+    def _subscription_written(self, mapper, connection, target):
+        """تحديث مؤقت الاشتراك عند إنشائه أو تجديده أو إلغائه في هذه النسخة"""
+        if not self.is_leader() or target.user_id is None or not owns_user(target.user_id):
+            return
+        
+        if target.status == "active" and target.end_date:
+            self.track_subscription(target.id, target.end_date)
+        else:
+            self.untrack_subscription(target.id)
+    
+    async def _run_reminder_tasks(self, tasks: List[TaskRecord]):
+        """تنفيذ مهام التذكير المحفوظة"""
+        await self.send_expiry_reminders(
+            [task.subscription_id for task in tasks if task.subscription_id]
+        )
+    
+    async def _run_kick_tasks(self, tasks: List[TaskRecord]):
+        """تنفيذ مهام الطرد المحفوظة"""
+        await self.expire_subscription_ids(
+            [task.subscription_id for task in tasks if task.subscription_id]
+        )
+    
     async def schedule_recurring_tasks(self):
         """جدولة المهام الدورية"""
         
-        # فحص الاشتراكات المنتهية كل ساعة
+        # الانتهاء والتذكير يتمان عبر المؤقتات الدقيقة؛ فحص احتياطي كل ساعة لكل قسم
+        # يلتقط ما فات المؤقتات والحجوزات العالقة لدى نسخة توقفت أثناء الطرد
         self.scheduler.add_job(
-            func=self.check_expired_subscriptions,
-            trigger=IntervalTrigger(hours=1),
-            id='check_expired_subscriptions',
+            func=self._leader_only(self.check_expired_subscriptions, global_job=False),
+            trigger=IntervalTrigger(minutes=EXPIRY_SWEEP_MINUTES),
+            id='expiry_sweep',
             replace_existing=True
         )
         
-        # فحص الاشتراكات التي ستنتهي قريباً كل 6 ساعات
+        # مطابقة عدادات الإحصائيات في كل نسخة
         self.scheduler.add_job(
-            func=self.check_expiring_subscriptions,
-            trigger=IntervalTrigger(hours=6),
-            id='check_expiring_subscriptions',
+            func=track_job("reconcile_stat_counters")(stats_counters.reconcile),
+            trigger=IntervalTrigger(minutes=STATS_RECONCILE_MINUTES),
+            id='reconcile_stat_counters',
+            replace_existing=True
+        )
+        
+        # تجميع الإيرادات والاشتراكات في جداول التجميع
+        self.scheduler.add_job(
+            func=self._leader_only(track_job("refresh_rollups")(rollup_manager.refresh)),
+            trigger=IntervalTrigger(minutes=ROLLUP_INTERVAL_MINUTES),
+            id='refresh_rollups',
             replace_existing=True
         )
         
         # تنظيف البيانات المؤقتة يومياً في الساعة 2 صباحاً
         self.scheduler.add_job(
-            func=self.cleanup_temporary_data,
+            func=self._leader_only(self.cleanup_temporary_data),
             trigger=CronTrigger(hour=2, minute=0),
             id='daily_cleanup',
             replace_existing=True
@@ -90,7 +235,7 @@ class BotScheduler:
         
         # إنشاء تقارير يومية في الساعة 9 صباحاً
         self.scheduler.add_job(
-            func=self.generate_daily_reports,
+            func=self._leader_only(self.generate_daily_reports),
             trigger=CronTrigger(hour=9, minute=0),
             id='daily_reports',
             replace_existing=True
@@ -100,159 +245,259 @@ class BotScheduler:
     
     async def send_expiry_reminder(self, subscription_id: int):
         """إرسال تذكير انتهاء الاشتراك"""
-        try:
-            async with db_manager.get_session() as session:
-                from sqlalchemy import select
-                from sqlalchemy.orm import selectinload
-                
-                # الحصول على تفاصيل الاشتراك
-                result = await session.execute(
-                    select(Subscription)
-                    .options(selectinload(Subscription.user))
-                    .options(selectinload(Subscription.plan))
-                    .where(Subscription.id == subscription_id)
-                )
-                subscription = result.scalar_one_or_none()
-                
-                if not subscription or subscription.status != "active":
-                    return
-                
-                user = subscription.user
-                plan = subscription.plan
-                language = user.preferred_language or "en"
-                
-                # حساب الساعات المتبقية
-                time_left = subscription.end_date - datetime.utcnow()
-                hours_left = int(time_left.total_seconds() / 3600)
-                
-                # إنشاء الرسالة
-                message = translator.get_text(
-                    "warning_subscription_expiring",
-                    language,
-                    plan_name=plan.name_ar if language == "ar" else plan.name_en,
-                    hours=hours_left,
-                    end_date=subscription.end_date.strftime("%Y-%m-%d %H:%M")
-                )
-                
-                # إرسال الرسالة
-                if self.bot:
-                    from keyboards import keyboard_manager
-                    keyboard = keyboard_manager.get_renewal_reminder_keyboard(
-                        subscription_id, language
-                    )
-                    
-                    await self.bot.send_message(
-                        chat_id=user.telegram_id,
-                        text=message,
-                        reply_markup=keyboard
-                    )
-                
-                self.logger.info(f"Sent expiry reminder to user {user.telegram_id}")
-                
-        except Exception as e:
-            self.logger.error(f"Error sending expiry reminder: {e}")
+        await self.send_expiry_reminders([subscription_id])
+    
+    @track_job("expiry_reminders")
+    async def send_expiry_reminders(self, subscription_ids: List[int]) -> int:
+        """إرسال تذكيرات الانتهاء لمجموعة اشتراكات بالتوازي"""
+        return await reminder_pipeline.run(self.bot, subscription_ids)
     
     async def auto_kick_user(self, subscription_id: int):
         """طرد المستخدم تلقائياً عند انتهاء الاشتراك"""
         try:
             async with db_manager.get_session() as session:
-                from sqlalchemy import select, update
-                from sqlalchemy.orm import selectinload
+                from sqlalchemy import select
+                from sqlalchemy.orm import joinedload
                 
                 # الحصول على تفاصيل الاشتراك
                 result = await session.execute(
                     select(Subscription)
-                    .options(selectinload(Subscription.user))
-                    .options(selectinload(Subscription.plan))
-                    .options(selectinload(Subscription.channel))
+                    .options(joinedload(Subscription.user))
+                    .options(joinedload(Subscription.plan))
+                    .options(joinedload(Subscription.channel))
                     .where(Subscription.id == subscription_id)
                 )
                 subscription = result.scalar_one_or_none()
+            
+            if not subscription:
+                return
+            
+            # التحقق من انتهاء الاشتراك
+            if subscription.end_date > datetime.utcnow():
+                return
+            
+            await self.expire_subscriptions([subscription])
                 
-                if not subscription:
-                    return
-                
-                user = subscription.user
-                channel = subscription.channel
-                plan = subscription.plan
-                
-                # التحقق من انتهاء الاشتراك
-                if subscription.end_date > datetime.utcnow():
-                    return
-                
-                try:
-                    # طرد المستخدم من القناة
-                    if self.bot and channel:
-                        await self.bot.ban_chat_member(
-                            chat_id=channel.telegram_channel_id,
-                            user_id=user.telegram_id
-                        )
-                        
-                        # إلغاء الحظر فوراً للسماح بالعودة لاحقاً
-                        await self.bot.unban_chat_member(
-                            chat_id=channel.telegram_channel_id,
-                            user_id=user.telegram_id
-                        )
-                    
-                    # تحديث حالة الاشتراك
+        except Exception as e:
+            self.logger.error(f"Error in auto kick: {e}")
+    
+    async def expire_subscriptions(self, subscriptions: List[Subscription]) -> int:
+        """إنهاء مجموعة من الاشتراكات على دفعات"""
+        from sqlalchemy import update
+        
+        expired_count = 0
+        semaphore = asyncio.Semaphore(EXPIRY_CONCURRENCY)
+        
+        for start in range(0, len(subscriptions), EXPIRY_BATCH_SIZE):
+            chunk = subscriptions[start:start + EXPIRY_BATCH_SIZE]
+            
+            # طرد المستخدمين بشكل متزامن مع احترام حدود تلجرام
+            results = await asyncio.gather(*[
+                self._kick_subscriber(subscription, semaphore)
+                for subscription in chunk
+            ])
+            kicked = [
+                subscription for subscription, ok in zip(chunk, results) if ok
+            ]
+            failed = [
+                subscription for subscription, ok in zip(chunk, results) if not ok
+            ]
+            
+            # إعادة الاشتراكات التي فشل طردها لتعاد محاولتها لاحقاً
+            if failed:
+                await self._release_claims([s.id for s in failed])
+            
+            if not kicked:
+                continue
+            
+            # تحديث حالة الاشتراكات باستعلام واحد لكل دفعة
+            try:
+                async with db_manager.get_session() as session:
                     await session.execute(
                         update(Subscription)
-                        .where(Subscription.id == subscription_id)
+                        .where(Subscription.id.in_([s.id for s in kicked]))
                         .values(
                             status="expired",
                             updated_at=datetime.utcnow()
                         )
                     )
-                    
-                    # إرسال رسالة وداع
-                    language = user.preferred_language or "en"
-                    farewell_message = translator.get_text(
-                        "info_subscription_expired",
-                        language,
-                        plan_name=plan.name_ar if language == "ar" else plan.name_en
-                    )
-                    
-                    if self.bot:
-                        await self.bot.send_message(
-                            chat_id=user.telegram_id,
-                            text=farewell_message
-                        )
-                    
                     await session.commit()
-                    self.logger.info(f"Auto kicked user {user.telegram_id}")
-                    
-                except Exception as kick_error:
-                    self.logger.error(f"Error kicking user: {kick_error}")
+            except Exception as e:
+                self.logger.error(f"Error updating expired subscriptions: {e}")
+                continue
+            
+            expired_count += len(kicked)
+            stats_counters.record_subscription_expired(len(kicked))
+            
+            # إرسال رسائل الوداع
+            await asyncio.gather(*[
+                self._send_farewell(subscription, semaphore)
+                for subscription in kicked
+            ])
+        
+        return expired_count
+    
+    async def _kick_subscriber(self, subscription: Subscription,
+                               semaphore: asyncio.Semaphore) -> bool:
+        """طرد مشترك واحد من القناة"""
+        user = subscription.user
+        channel = subscription.channel
+        
+        if not self.bot or not channel:
+            return True
+        
+        async with semaphore:
+            try:
+                await telegram_rate_limiter.call(
+                    None, self.bot.ban_chat_member,
+                    chat_id=channel.telegram_channel_id,
+                    user_id=user.telegram_id
+                )
                 
-        except Exception as e:
-            self.logger.error(f"Error in auto kick: {e}")
+                # إلغاء الحظر فوراً للسماح بالعودة لاحقاً
+                await telegram_rate_limiter.call(
+                    None, self.bot.unban_chat_member,
+                    chat_id=channel.telegram_channel_id,
+                    user_id=user.telegram_id
+                )
+                return True
+                
+            except Exception as kick_error:
+                self.logger.error(f"Error kicking user {user.telegram_id}: {kick_error}")
+                return False
     
-    async def check_expired_subscriptions(self):
-        """فحص الاشتراكات المنتهية"""
-        try:
-            expired_subscriptions = await subscription_service.get_expired_subscriptions()
+    async def _send_farewell(self, subscription: Subscription,
+                             semaphore: asyncio.Semaphore):
+        """إرسال رسالة وداع بعد انتهاء الاشتراك"""
+        if not self.bot:
+            return
+        
+        user = subscription.user
+        plan = subscription.plan
+        language = user.preferred_language or "en"
+        
+        farewell_message = messages.render(
+            MessageId.SUBSCRIPTION_EXPIRED,
+            language,
+            plan_name=plan.name_ar if language == "ar" else plan.name_en
+        )
+        
+        async with semaphore:
+            try:
+                await telegram_rate_limiter.call(
+                    user.telegram_id, self.bot.send_message,
+                    chat_id=user.telegram_id,
+                    text=farewell_message
+                )
+                self.logger.info(f"Auto kicked user {user.telegram_id}")
+            except Exception as e:
+                self.logger.warning(f"Could not send farewell to user {user.telegram_id}: {e}")
+    
+    async def _claim_due_subscriptions(self, subscription_ids: List[int] = None
+                                       ) -> List[Subscription]:
+        """حجز الاشتراكات المستحقة في قسم هذه النسخة ثم تحميلها مع بياناتها"""
+        from sqlalchemy import select, update, and_, or_
+        from sqlalchemy.orm import joinedload
+        
+        now = datetime.utcnow()
+        stale_before = now - timedelta(minutes=EXPIRY_CLAIM_TIMEOUT_MINUTES)
+        
+        # المستحقة أو المحجوزة لدى نسخة توقفت قبل إكمالها
+        claimable = or_(
+            and_(Subscription.status == "active", Subscription.end_date <= now),
+            and_(Subscription.status == STATUS_EXPIRING, Subscription.updated_at < stale_before)
+        )
+        
+        async with db_manager.get_session() as session:
+            query = (
+                select(Subscription.id)
+                .where(claimable, shard_clause(Subscription.user_id))
+                .with_for_update(skip_locked=True)
+            )
+            if subscription_ids is not None:
+                query = query.where(Subscription.id.in_(subscription_ids))
             
-            for subscription in expired_subscriptions:
-                await self.auto_kick_user(subscription.id)
+            candidate_ids = (await session.execute(query)).scalars().all()
+            if not candidate_ids:
+                return []
             
-            self.logger.info(f"Processed {len(expired_subscriptions)} expired subscriptions")
+            # التحديث الشرطي يضمن أن كل اشتراك تحجزه نسخة واحدة فقط
+            claimed_ids = []
+            for start in range(0, len(candidate_ids), EXPIRY_BATCH_SIZE):
+                result = await session.execute(
+                    update(Subscription)
+                    .where(
+                        Subscription.id.in_(candidate_ids[start:start + EXPIRY_BATCH_SIZE]),
+                        claimable
+                    )
+                    .values(status=STATUS_EXPIRING, updated_at=now)
+                    .returning(Subscription.id)
+                )
+                claimed_ids.extend(result.scalars().all())
+            
+            await session.commit()
             
+            subscriptions = []
+            for start in range(0, len(claimed_ids), EXPIRY_BATCH_SIZE):
+                result = await session.execute(
+                    select(Subscription)
+                    .options(joinedload(Subscription.user))
+                    .options(joinedload(Subscription.plan))
+                    .options(joinedload(Subscription.channel))
+                    .where(Subscription.id.in_(claimed_ids[start:start + EXPIRY_BATCH_SIZE]))
+                )
+                subscriptions.extend(result.scalars().unique().all())
+            
+            return subscriptions
+    
+    async def _release_claims(self, subscription_ids: List[int]):
+        """إعادة الاشتراكات المحجوزة إلى الحالة النشطة"""
+        from sqlalchemy import update
+        
+        try:
+            async with db_manager.get_session() as session:
+                await session.execute(
+                    update(Subscription)
+                    .where(
+                        Subscription.id.in_(subscription_ids),
+                        Subscription.status == STATUS_EXPIRING
+                    )
+                    .values(status="active", updated_at=datetime.utcnow())
+                )
+                await session.commit()
         except Exception as e:
-            self.logger.error(f"Error checking expired subscriptions: {e}")
+            self.logger.error(f"Error releasing subscription claims: {e}")
     
-    async def check_expiring_subscriptions(self):
-        """فحص الاشتراكات التي ستنتهي قريباً"""
+    @track_job("expire_subscriptions")
+    async def expire_subscription_ids(self, subscription_ids: List[int]) -> int:
+        """إنهاء الاشتراكات التي حان موعد انتهائها"""
         try:
-            expiring_subscriptions = await subscription_service.get_expiring_subscriptions(24)
+            subscriptions = await self._claim_due_subscriptions(subscription_ids)
+            expired_count = await self.expire_subscriptions(subscriptions)
             
-            for subscription in expiring_subscriptions:
-                await self.send_expiry_reminder(subscription.id)
+            self.logger.info(f"Expired {expired_count} subscriptions on schedule")
+            return expired_count
             
-            self.logger.info(f"Processed {len(expiring_subscriptions)} expiring subscriptions")
+        except Exception as e:
+            self.logger.error(f"Error expiring subscriptions: {e}")
+            return 0
+    
+    @track_job("check_expired_subscriptions")
+    async def check_expired_subscriptions(self):
+        """فحص الاشتراكات المنتهية واستعادة الحجوزات العالقة"""
+        try:
+            expired_subscriptions = await self._claim_due_subscriptions()
+            expired_count = await self.expire_subscriptions(expired_subscriptions)
+            
+            self.logger.info(
+                f"Processed {len(expired_subscriptions)} expired subscriptions "
+                f"({expired_count} expired)"
+            )
             
         except Exception as e:
-            self.logger.error(f"Error checking expiring subscriptions: {e}")
+            self.logger.error(f"Error checking expired subscriptions: {e}")
     
+    @track_job("daily_cleanup")
     async def cleanup_temporary_data(self):
         """تنظيف البيانات المؤقتة"""
         try:
@@ -277,61 +522,19 @@ class BotScheduler:
         except Exception as e:
             self.logger.error(f"Error in cleanup: {e}")
     
+    @track_job("daily_reports")
     async def generate_daily_reports(self):
         """إنشاء التقارير اليومية"""
         try:
             today = datetime.now().date()
             
-            # حساب الإحصائيات اليومية
-            async with db_manager.get_session() as session:
-                from sqlalchemy import select, func
-                from database import Payment
-                
-                # المستخدمين الجدد
-                new_users_result = await session.execute(
-                    select(func.count(User.id))
-                    .where(func.date(User.registration_date) == today)
-                )
-                new_users = new_users_result.scalar() or 0
-                
-                # الاشتراكات الجديدة
-                new_subs_result = await session.execute(
-                    select(func.count(Subscription.id))
-                    .where(func.date(Subscription.created_at) == today)
-                )
-                new_subscriptions = new_subs_result.scalar() or 0
-                
-                # الإيرادات اليومية
-                revenue_result = await session.execute(
-                    select(func.sum(Payment.amount))
-                    .where(
-                        func.date(Payment.completed_at) == today,
-                        Payment.status == "completed"
-                    )
-                )
-                revenue = float(revenue_result.scalar() or 0)
-                
-                # حفظ الإحصائيات
-                analytics_entries = [
-                    Analytics(
-                        metric_name="daily_new_users",
-                        metric_value=new_users,
-                        metric_date=today
-                    ),
-                    Analytics(
-                        metric_name="daily_new_subscriptions",
-                        metric_value=new_subscriptions,
-                        metric_date=today
-                    ),
-                    Analytics(
-                        metric_name="daily_revenue",
-                        metric_value=revenue,
-                        metric_date=today
-                    )
-                ]
-                
-                session.add_all(analytics_entries)
-                await session.commit()
+            # حساب الأيام الفائتة أثناء التوقف باستعلام واحد
+            missing = await find_missing_report_range(today)
+            if missing:
+                await backfill_daily_reports(*missing)
+            
+            # حساب إحصائيات اليوم وحفظها دون تكرار عند إعادة التشغيل
+            await generate_daily_report(today)
             
             self.logger.info(f"Daily report generated")
             
@@ -343,17 +546,13 @@ class BotScheduler:
                                 task_data: Dict = None):
         """حفظ المهمة المجدولة في قاعدة البيانات"""
         try:
-            async with db_manager.get_session() as session:
-                task = ScheduledTask(
-                    task_type=task_type,
-                    user_id=user_id,
-                    subscription_id=subscription_id,
-                    scheduled_time=scheduled_time,
-                    task_data=task_data or {}
-                )
-                
-                session.add(task)
-                await session.commit()
+            return await self.task_store.save(
+                task_type=task_type,
+                scheduled_time=scheduled_time,
+                subscription_id=subscription_id,
+                user_id=user_id,
+                task_data=task_data
+            )
                 
         except Exception as e:
             self.logger.error(f"Error saving scheduled task: {e}")
@@ -0,0 +1,48 @@
+"""
+تقسيم أعمال المجدول بين عدة نسخ
+Sweep Sharding Across Scheduler Replicas
+"""
+
+import os
+
+from sqlalchemy import true
+
+from config import settings
+
+
+# كل نسخة تحدد رقم قسمها عبر متغيرات البيئة
+SWEEP_SHARD_COUNT = int(os.getenv('SWEEP_SHARD_COUNT', getattr(settings, 'SWEEP_SHARD_COUNT', 1)))
+SWEEP_SHARD_INDEX = int(os.getenv('SWEEP_SHARD_INDEX', getattr(settings, 'SWEEP_SHARD_INDEX', 0)))
+
+
+def is_sharded() -> bool:
+    return SWEEP_SHARD_COUNT > 1
+
+
+def shard_of(user_id: int) -> int:
+    """القسم الثابت لمستخدم معين"""
+    return user_id % SWEEP_SHARD_COUNT
+
+
+def owns_user(user_id: int) -> bool:
+    """هل ينتمي المستخدم لقسم هذه النسخة"""
+    return shard_of(user_id) == SWEEP_SHARD_INDEX
+
+
+def shard_clause(user_id_column):
+    """شرط SQL يقصر الاستعلام على قسم هذه النسخة"""
+    if not is_sharded():
+        return true()
+    return user_id_column % SWEEP_SHARD_COUNT == SWEEP_SHARD_INDEX
+
+
+def shard_lease_name(base: str) -> str:
+    """اسم عقد القيادة الخاص بالقسم"""
+    if not is_sharded():
+        return base
+    return f"{base}:shard:{SWEEP_SHARD_INDEX}"
+
+
+def owns_global_jobs() -> bool:
+    """المهام غير المقسمة (التقارير والتنظيف) تعمل في القسم الأول فقط"""
+    return SWEEP_SHARD_INDEX == 0
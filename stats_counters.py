@@ -0,0 +1,230 @@
+"""
+عدادات الإحصائيات المحدثة تدريجياً
+Incrementally Maintained Statistics Counters
+"""
+
+import logging
+from datetime import date, datetime, time, timedelta
+from typing import Dict, List, Tuple
+
+from sqlalchemy import Column, DateTime, Float, String, func, select
+
+from config import settings
+from database import Base, db_manager, Payment, Subscription, User
+
+
+# إعدادات المطابقة
+STATS_RECONCILE_MINUTES = getattr(settings, 'STATS_RECONCILE_MINUTES', 5)
+
+# أسماء العدادات
+COUNTER_TOTAL_USERS = "total_users"
+COUNTER_ACTIVE_SUBSCRIPTIONS = "active_subscriptions"
+COUNTER_DAILY_REVENUE = "daily_revenue"
+COUNTER_NEW_USERS_TODAY = "new_users_today"
+
+
+class StatCounter(Base):
+    """آخر قيمة مطابقة لكل عداد"""
+    __tablename__ = "stat_counters"
+
+    name = Column(String(100), primary_key=True)
+    value = Column(Float, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+
+def utc_today() -> date:
+    """اليوم الحالي بتوقيت UTC مثل registration_date وcompleted_at"""
+    return datetime.utcnow().date()
+
+
+def day_range(day: date):
+    """بداية ونهاية اليوم كنطاق نصف مفتوح"""
+    start = datetime.combine(day, time.min)
+    return start, start + timedelta(days=1)
+
+
+class StatsCounters:
+    """عدادات في الذاكرة تحدث مع الأحداث وتطابق دورياً مع قاعدة البيانات"""
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._values: Dict[str, float] = {}
+        self._day = utc_today()
+        self._instrumented = False
+
+    def _roll_day(self):
+        """تصفير العدادات اليومية عند بداية يوم جديد"""
+        today = utc_today()
+        if today != self._day:
+            self._day = today
+            self._values[COUNTER_DAILY_REVENUE] = 0
+            self._values[COUNTER_NEW_USERS_TODAY] = 0
+
+    def get(self, name: str) -> float:
+        self._roll_day()
+        return self._values.get(name, 0)
+
+    def increment(self, name: str, amount: float = 1):
+        self._roll_day()
+        self._values[name] = self._values.get(name, 0) + amount
+
+    def record_registration(self):
+        """تسجيل مستخدم جديد"""
+        self.increment(COUNTER_TOTAL_USERS)
+        self.increment(COUNTER_NEW_USERS_TODAY)
+
+    def record_subscription_activated(self, count: int = 1):
+        """تسجيل تفعيل اشتراكات"""
+        self.increment(COUNTER_ACTIVE_SUBSCRIPTIONS, count)
+
+    def record_subscription_expired(self, count: int = 1):
+        """تسجيل انتهاء اشتراكات"""
+        self.increment(COUNTER_ACTIVE_SUBSCRIPTIONS, -count)
+
+    def record_payment_completed(self, amount: float, completed_at: datetime = None):
+        """تسجيل دفعة مكتملة (إيرادات اليوم فقط)"""
+        if completed_at is not None and completed_at.date() != utc_today():
+            return
+        self.increment(COUNTER_DAILY_REVENUE, float(amount or 0))
+
+    def instrument(self):
+        """تحديث العدادات من تغيرات الاشتراكات والمدفوعات عند تأكيد المعاملات"""
+        if self._instrumented:
+            return
+
+        from sqlalchemy import event
+        from sqlalchemy.orm import Session
+
+        event.listen(Session, "after_flush", self._collect)
+        event.listen(Session, "after_commit", self._apply)
+        event.listen(Session, "after_soft_rollback", self._discard)
+        self._instrumented = True
+
+    def _collect(self, session, flush_context):
+        """جمع أحداث الدفعة المكتوبة حتى تأكيد المعاملة"""
+        events: List[Tuple[str, float, datetime]] = session.info.setdefault('stat_events', [])
+
+        # السجلات الجديدة بحالتها بعد تطبيق القيم الافتراضية
+        for obj in session.new:
+            if isinstance(obj, Subscription) and obj.status == "active":
+                events.append((COUNTER_ACTIVE_SUBSCRIPTIONS, 1, None))
+            elif isinstance(obj, Payment) and obj.status == "completed":
+                events.append((COUNTER_DAILY_REVENUE, obj.amount, obj.completed_at))
+
+        # السجلات المعدلة حسب انتقال حالتها
+        for obj in session.dirty:
+            if isinstance(obj, Subscription):
+                change = _status_change(obj, "active")
+                if change:
+                    events.append((COUNTER_ACTIVE_SUBSCRIPTIONS, change, None))
+            elif isinstance(obj, Payment) and _status_change(obj, "completed") > 0:
+                events.append((COUNTER_DAILY_REVENUE, obj.amount, obj.completed_at))
+
+    def _apply(self, session):
+        for name, value, moment in session.info.pop('stat_events', ()):
+            if name == COUNTER_DAILY_REVENUE:
+                self.record_payment_completed(value, moment)
+            elif value > 0:
+                self.record_subscription_activated()
+            else:
+                self.record_subscription_expired()
+
+    def _discard(self, session, previous_transaction):
+        session.info.pop('stat_events', None)
+
+    def snapshot(self) -> Dict[str, float]:
+        """القيم الحالية لشاشة الإحصائيات"""
+        return {
+            'total_users': int(self.get(COUNTER_TOTAL_USERS)),
+            'active_subscriptions': int(self.get(COUNTER_ACTIVE_SUBSCRIPTIONS)),
+            'daily_revenue': float(self.get(COUNTER_DAILY_REVENUE)),
+            'new_users_today': int(self.get(COUNTER_NEW_USERS_TODAY))
+        }
+
+    async def load(self):
+        """تحميل آخر قيم محفوظة عند بدء التشغيل"""
+        try:
+            async with db_manager.get_session() as session:
+                result = await session.execute(select(StatCounter))
+                counters = result.scalars().all()
+
+            today_start, _ = day_range(utc_today())
+            for counter in counters:
+                # القيم اليومية المحفوظة من يوم سابق لا تصلح
+                if (counter.name in (COUNTER_DAILY_REVENUE, COUNTER_NEW_USERS_TODAY)
+                        and counter.updated_at and counter.updated_at < today_start):
+                    continue
+                self._values[counter.name] = counter.value or 0
+
+        except Exception as e:
+            self.logger.error(f"Error loading stat counters: {e}")
+
+    async def reconcile(self):
+        """مطابقة العدادات مع قاعدة البيانات وحفظها"""
+        try:
+            today = utc_today()
+            start, end = day_range(today)
+
+            async with db_manager.get_session() as session:
+                result = await session.execute(
+                    select(
+                        select(func.count(User.id)).scalar_subquery(),
+                        select(func.count(Subscription.id))
+                        .where(Subscription.status == "active")
+                        .scalar_subquery(),
+                        select(func.coalesce(func.sum(Payment.amount), 0))
+                        .where(
+                            Payment.status == "completed",
+                            Payment.completed_at >= start,
+                            Payment.completed_at < end
+                        )
+                        .scalar_subquery(),
+                        select(func.count(User.id))
+                        .where(
+                            User.registration_date >= start,
+                            User.registration_date < end
+                        )
+                        .scalar_subquery()
+                    )
+                )
+                total_users, active_subscriptions, daily_revenue, new_users = result.one()
+
+                values = {
+                    COUNTER_TOTAL_USERS: total_users or 0,
+                    COUNTER_ACTIVE_SUBSCRIPTIONS: active_subscriptions or 0,
+                    COUNTER_DAILY_REVENUE: float(daily_revenue or 0),
+                    COUNTER_NEW_USERS_TODAY: new_users or 0
+                }
+
+                now = datetime.utcnow()
+                for name, value in values.items():
+                    await session.merge(StatCounter(name=name, value=value, updated_at=now))
+                await session.commit()
+
+            self._day = today
+            self._values.update(values)
+            self.logger.info("Stat counters reconciled")
+
+        except Exception as e:
+            self.logger.error(f"Error reconciling stat counters: {e}")
+
+
+def _status_change(obj, status: str) -> int:
+    """+1 إذا دخل السجل الحالة، -1 إذا خرج منها، 0 دون تغيير"""
+    from sqlalchemy import inspect
+
+    history = inspect(obj).attrs.status.history
+    if not history.has_changes():
+        return 0
+
+    before = history.deleted[0] if history.deleted else None
+    after = history.added[0] if history.added else None
+    if after == status and before != status:
+        return 1
+    if before == status and after != status:
+        return -1
+    return 0
+
+
+# إنشاء مثيل العدادات العام
+stats_counters = StatsCounters()
@@ -0,0 +1,58 @@
+"""
+تخزين حالات المحادثة
+FSM State Storage
+"""
+
+import logging
+from typing import Optional
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+from config import settings
+
+
+logger = logging.getLogger(__name__)
+
+# إعدادات التخزين
+FSM_STORAGE_BACKEND = getattr(settings, 'FSM_STORAGE', 'redis')
+FSM_STATE_TTL = getattr(settings, 'FSM_STATE_TTL', 86400)
+FSM_DATA_TTL = getattr(settings, 'FSM_DATA_TTL', 86400)
+REDIS_MAX_CONNECTIONS = getattr(settings, 'REDIS_MAX_CONNECTIONS', 50)
+
+
+def create_redis_pool(redis_url: str):
+    """إنشاء مجمع اتصالات Redis مشترك"""
+    from redis.asyncio import ConnectionPool
+
+    return ConnectionPool.from_url(
+        redis_url,
+        max_connections=REDIS_MAX_CONNECTIONS,
+        health_check_interval=30
+    )
+
+
+def create_fsm_storage(redis_url: Optional[str] = None) -> BaseStorage:
+    """إنشاء تخزين الحالات: Redis إن توفر وإلا الذاكرة"""
+    redis_url = redis_url or getattr(settings, 'REDIS_URL', None)
+
+    if FSM_STORAGE_BACKEND == 'memory' or not redis_url:
+        logger.info("Using in-memory FSM storage")
+        return MemoryStorage()
+
+    try:
+        from redis.asyncio import Redis
+        from aiogram.fsm.storage.redis import DefaultKeyBuilder, RedisStorage
+    except ImportError:
+        logger.warning("redis package is not installed, using in-memory FSM storage")
+        return MemoryStorage()
+
+    redis = Redis(connection_pool=create_redis_pool(redis_url))
+
+    logger.info("Using Redis FSM storage")
+    return RedisStorage(
+        redis=redis,
+        key_builder=DefaultKeyBuilder(with_bot_id=True),
+        state_ttl=FSM_STATE_TTL,
+        data_ttl=FSM_DATA_TTL
+    )
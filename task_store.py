@@ -0,0 +1,307 @@
+"""
+مخزن المهام المجدولة الدائم
+Persistent Scheduled Task Store
+"""
+
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Set
+
+from apscheduler.triggers.date import DateTrigger
+
+from config import settings
+from database import db_manager, ScheduledTask, Subscription
+from sharding import is_sharded, owns_global_jobs, owns_user, shard_clause
+
+
+# إعدادات المخزن
+TASK_COMPLETION_BATCH_SIZE = getattr(settings, 'TASK_COMPLETION_BATCH_SIZE', 200)
+TASK_COMPLETION_FLUSH_SECONDS = getattr(settings, 'TASK_COMPLETION_FLUSH_SECONDS', 30)
+TASK_RELOAD_SECONDS = getattr(settings, 'TASK_RELOAD_SECONDS', 60)
+TASK_CLAIM_TIMEOUT_MINUTES = getattr(settings, 'TASK_CLAIM_TIMEOUT_MINUTES', 10)
+TASK_MAX_ATTEMPTS = getattr(settings, 'TASK_MAX_ATTEMPTS', 3)
+TASK_RETRY_BASE_SECONDS = getattr(settings, 'TASK_RETRY_BASE_SECONDS', 60)
+
+# حالات المهام
+TASK_PENDING = "pending"
+TASK_RUNNING = "running"
+TASK_COMPLETED = "completed"
+TASK_FAILED = "failed"
+
+
+def _claimable(now: datetime):
+    """المهام المعلقة أو المحجوزة لدى نسخة توقفت قبل إكمالها"""
+    from sqlalchemy import and_, or_
+
+    stale_before = now - timedelta(minutes=TASK_CLAIM_TIMEOUT_MINUTES)
+    return or_(
+        ScheduledTask.status == TASK_PENDING,
+        and_(ScheduledTask.status == TASK_RUNNING, ScheduledTask.executed_at < stale_before)
+    )
+
+
+class TaskRecord(NamedTuple):
+    """نسخة خفيفة من صف مهمة مجدولة"""
+    id: int
+    task_type: str
+    subscription_id: Optional[int]
+    user_id: Optional[int]
+    task_data: Dict[str, Any]
+
+
+TaskHandler = Callable[[List[TaskRecord]], Awaitable[None]]
+
+
+class ScheduledTaskStore:
+    """ربط جدول ScheduledTask بمجدول APScheduler"""
+
+    def __init__(self, scheduler, gate: Callable[[], bool] = None):
+        self.scheduler = scheduler
+        # المهام تنفذ فقط عندما تسمح البوابة (أي في نسخة القائد)
+        self.gate = gate or (lambda: True)
+        self.logger = logging.getLogger(__name__)
+        self._handlers: Dict[str, TaskHandler] = {}
+        self._finished: Dict[str, List[int]] = defaultdict(list)
+        self._running: Set[int] = set()
+
+    def register(self, task_type: str, handler: TaskHandler):
+        """تسجيل معالج لنوع من المهام"""
+        self._handlers[task_type] = handler
+
+    async def save(self, task_type: str, scheduled_time: datetime,
+                   subscription_id: int = None, user_id: int = None,
+                   task_data: Dict = None) -> Optional[int]:
+        """حفظ المهمة في قاعدة البيانات وجدولتها"""
+        async with db_manager.get_session() as session:
+            task = ScheduledTask(
+                task_type=task_type,
+                user_id=user_id,
+                subscription_id=subscription_id,
+                scheduled_time=scheduled_time,
+                task_data=task_data or {}
+            )
+
+            session.add(task)
+            await session.commit()
+            await session.refresh(task)
+
+        # النسخ الأخرى (أو الأقسام الأخرى) تترك المهمة لقائدها ليلتقطها عند إعادة التحميل
+        if self.gate() and (not is_sharded() or (user_id is not None and owns_user(user_id))):
+            self._add_job(self._record(task), scheduled_time)
+        return task.id
+
+    async def start(self):
+        """تحميل المهام المعلقة وجدولة الحفظ وإعادة التحميل الدورية"""
+        await self.load_pending()
+
+        self.scheduler.add_job(
+            func=self.flush,
+            trigger='interval',
+            seconds=TASK_COMPLETION_FLUSH_SECONDS,
+            id='flush_scheduled_tasks',
+            replace_existing=True
+        )
+        self.scheduler.add_job(
+            func=self.load_pending,
+            trigger='interval',
+            seconds=TASK_RELOAD_SECONDS,
+            id='reload_scheduled_tasks',
+            replace_existing=True
+        )
+
+    async def load_pending(self):
+        """تحميل المهام المعلقة دفعة واحدة وتنفيذ المتأخر منها مجمعاً"""
+        if not self.gate():
+            return
+
+        async with db_manager.get_session() as session:
+            from sqlalchemy import func, or_, select
+
+            # مالك المهمة: مستخدمها أو مستخدم اشتراكها؛ المهام دون مالك للقسم الأول
+            owner = func.coalesce(ScheduledTask.user_id, Subscription.user_id)
+            owned = shard_clause(owner)
+            if owns_global_jobs():
+                owned = or_(owned, owner.is_(None))
+
+            now = datetime.utcnow()
+            result = await session.execute(
+                select(ScheduledTask)
+                .outerjoin(Subscription, Subscription.id == ScheduledTask.subscription_id)
+                .where(_claimable(now), owned)
+            )
+            tasks = result.scalars().all()
+
+        overdue: Dict[str, List[TaskRecord]] = defaultdict(list)
+        upcoming = 0
+
+        # تجاهل المهام المنفذة التي لم تحفظ حالتها بعد
+        skip = self._running.union(*self._finished.values())
+
+        for task in tasks:
+            if task.id in skip:
+                continue
+            record = self._record(task)
+            if task.scheduled_time <= now:
+                overdue[task.task_type].append(record)
+            else:
+                self._add_job(record, task.scheduled_time)
+                upcoming += 1
+
+        # تنفيذ المهام المتأخرة كدفعة واحدة لكل نوع
+        for task_type, records in overdue.items():
+            await self._execute(task_type, records)
+
+        await self.flush()
+
+        self.logger.info(
+            f"Loaded {upcoming} pending tasks, ran "
+            f"{sum(len(r) for r in overdue.values())} overdue tasks"
+        )
+
+    def _record(self, task: ScheduledTask) -> TaskRecord:
+        return TaskRecord(
+            id=task.id,
+            task_type=task.task_type,
+            subscription_id=task.subscription_id,
+            user_id=task.user_id,
+            task_data=task.task_data or {}
+        )
+
+    def _add_job(self, record: TaskRecord, scheduled_time: datetime):
+        """جدولة مهمة واحدة في المجدول"""
+        self.scheduler.add_job(
+            func=self._execute,
+            trigger=DateTrigger(run_date=scheduled_time),
+            args=[record.task_type, [record]],
+            id=f"scheduled_task_{record.id}",
+            replace_existing=True,
+            coalesce=True,
+            misfire_grace_time=None
+        )
+
+    async def _claim(self, task_ids: List[int]) -> Set[int]:
+        """حجز المهام بتحديث شرطي؛ وظيفة المجدول وإعادة التحميل لا تنفذان نفس المهمة مرتين"""
+        from sqlalchemy import update
+
+        now = datetime.utcnow()
+        claimed: Set[int] = set()
+
+        async with db_manager.get_session() as session:
+            for start in range(0, len(task_ids), TASK_COMPLETION_BATCH_SIZE):
+                result = await session.execute(
+                    update(ScheduledTask)
+                    .where(
+                        ScheduledTask.id.in_(task_ids[start:start + TASK_COMPLETION_BATCH_SIZE]),
+                        _claimable(now)
+                    )
+                    .values(status=TASK_RUNNING, executed_at=now)
+                    .returning(ScheduledTask.id)
+                )
+                claimed.update(result.scalars().all())
+            await session.commit()
+
+        return claimed
+
+    async def _execute(self, task_type: str, records: List[TaskRecord]):
+        """تنفيذ مجموعة مهام من نفس النوع"""
+        if not self.gate():
+            return
+
+        handler = self._handlers.get(task_type)
+        if not handler:
+            self.logger.warning(f"No handler registered for task type {task_type}")
+            return
+
+        try:
+            claimed = await self._claim([record.id for record in records])
+        except Exception as e:
+            self.logger.error(f"Error claiming {task_type} tasks: {e}")
+            return
+
+        records = [record for record in records if record.id in claimed]
+        if not records:
+            return
+
+        task_ids = [record.id for record in records]
+        self._running.update(task_ids)
+        try:
+            await handler(records)
+            failed = False
+        except Exception as e:
+            self.logger.error(f"Error executing {task_type} tasks: {e}")
+            failed = True
+        finally:
+            self._running.difference_update(task_ids)
+
+        if failed:
+            await self._retry(records)
+        else:
+            self._finished[TASK_COMPLETED].extend(task_ids)
+
+        if sum(len(ids) for ids in self._finished.values()) >= TASK_COMPLETION_BATCH_SIZE:
+            await self.flush()
+
+    async def _retry(self, records: List[TaskRecord]):
+        """إعادة جدولة المهام الفاشلة بتأخير متضاعف حتى الحد الأقصى للمحاولات"""
+        now = datetime.utcnow()
+        retries = []
+
+        for record in records:
+            attempts = int(record.task_data.get('attempts', 0)) + 1
+            if attempts >= TASK_MAX_ATTEMPTS:
+                self._finished[TASK_FAILED].append(record.id)
+                continue
+
+            retry_at = now + timedelta(seconds=TASK_RETRY_BASE_SECONDS * 2 ** (attempts - 1))
+            retries.append((record._replace(task_data={**record.task_data, 'attempts': attempts}), retry_at))
+
+        if not retries:
+            return
+
+        try:
+            async with db_manager.get_session() as session:
+                from sqlalchemy import update
+
+                for record, retry_at in retries:
+                    await session.execute(
+                        update(ScheduledTask)
+                        .where(ScheduledTask.id == record.id)
+                        .values(status=TASK_PENDING, scheduled_time=retry_at,
+                                task_data=record.task_data)
+                    )
+                await session.commit()
+
+        except Exception as e:
+            # تبقى محجوزة وتستعاد بعد انتهاء مهلة الحجز
+            self.logger.error(f"Error rescheduling failed tasks: {e}")
+            return
+
+        for record, retry_at in retries:
+            self._add_job(record, retry_at)
+        self.logger.warning(f"Retrying {len(retries)} failed tasks")
+
+    async def flush(self):
+        """تحديث حالات المهام المنفذة على دفعات"""
+        if not any(self._finished.values()):
+            return
+
+        finished, self._finished = self._finished, defaultdict(list)
+        try:
+            async with db_manager.get_session() as session:
+                from sqlalchemy import update
+
+                for status, task_ids in finished.items():
+                    for start in range(0, len(task_ids), TASK_COMPLETION_BATCH_SIZE):
+                        await session.execute(
+                            update(ScheduledTask)
+                            .where(ScheduledTask.id.in_(
+                                task_ids[start:start + TASK_COMPLETION_BATCH_SIZE]
+                            ))
+                            .values(status=status, executed_at=datetime.utcnow())
+                        )
+
+                await session.commit()
+
+        except Exception as e:
+            self.logger.error(f"Error saving scheduled task states: {e}")
@@ -0,0 +1,224 @@
+"""
+بدائل مصغرة للوحدات غير الموجودة في المستودع أثناء الاختبار
+Minimal Stand-ins for Out-of-Tree Modules in Tests
+
+config وdatabase وlocalization تأتي من بيئة النشر؛ عند غيابها تسجل هنا نسخ
+صغيرة تكفي الوحدات المختبرة (قاعدة SQLite في الذاكرة ونفس أسماء الجداول والأعمدة).
+"""
+
+import asyncio
+import importlib.util
+import sys
+import types
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Integer, String
+)
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy.pool import StaticPool
+
+
+def _missing(name: str) -> bool:
+    return name not in sys.modules and importlib.util.find_spec(name) is None
+
+
+def _config_module() -> types.ModuleType:
+    module = types.ModuleType("config")
+    module.settings = types.SimpleNamespace(
+        BOT_TOKEN="123456:TEST",
+        SCHEDULER_TIMEZONE="UTC",
+        ADMIN_USER_IDS=[],
+        PUBLIC_CHANNEL_ID=None,
+        PRIVATE_CHANNEL_ID=None,
+        WEBHOOK_HOST=None,
+        WEBHOOK_PORT=None,
+        DATABASE_URL="sqlite+aiosqlite://"
+    )
+    module.LOGGING_CONFIG = {'version': 1, 'disable_existing_loggers': False}
+    return module
+
+
+def _database_module() -> types.ModuleType:
+    module = types.ModuleType("database")
+    module.IS_STAND_IN = True
+    Base = declarative_base()
+
+    class User(Base):
+        __tablename__ = "users"
+
+        id = Column(Integer, primary_key=True)
+        telegram_id = Column(BigInteger, unique=True, nullable=False)
+        username = Column(String(100))
+        first_name = Column(String(100))
+        last_name = Column(String(100))
+        preferred_language = Column(String(5))
+        is_admin = Column(Boolean, default=False)
+        is_active = Column(Boolean, default=True)
+        registration_date = Column(DateTime, default=datetime.utcnow)
+
+    class Plan(Base):
+        __tablename__ = "subscription_plans"
+
+        id = Column(Integer, primary_key=True)
+        name_ar = Column(String(100), default="")
+        name_en = Column(String(100), default="")
+
+    class Channel(Base):
+        __tablename__ = "channels"
+
+        id = Column(Integer, primary_key=True)
+        telegram_channel_id = Column(BigInteger)
+
+    class Subscription(Base):
+        __tablename__ = "subscriptions"
+
+        id = Column(Integer, primary_key=True)
+        user_id = Column(Integer, ForeignKey("users.id"))
+        plan_id = Column(Integer, ForeignKey("subscription_plans.id"))
+        channel_id = Column(Integer, ForeignKey("channels.id"))
+        status = Column(String(20), default="active")
+        end_date = Column(DateTime)
+        created_at = Column(DateTime, default=datetime.utcnow)
+        updated_at = Column(DateTime, default=datetime.utcnow)
+
+        user = relationship(User)
+        plan = relationship(Plan)
+        channel = relationship(Channel)
+
+    class Payment(Base):
+        __tablename__ = "payments"
+
+        id = Column(Integer, primary_key=True)
+        user_id = Column(Integer, ForeignKey("users.id"))
+        plan_id = Column(Integer, ForeignKey("subscription_plans.id"))
+        amount = Column(Float, default=0)
+        currency = Column(String(10), default="USD")
+        provider = Column(String(20), default="stripe")
+        status = Column(String(20), default="pending")
+        completed_at = Column(DateTime)
+
+    class ScheduledTask(Base):
+        __tablename__ = "scheduled_tasks"
+
+        id = Column(Integer, primary_key=True)
+        task_type = Column(String(50))
+        user_id = Column(Integer)
+        subscription_id = Column(Integer)
+        scheduled_time = Column(DateTime)
+        status = Column(String(20), default="pending")
+        task_data = Column(JSON, default=dict)
+        executed_at = Column(DateTime)
+
+    class Analytics(Base):
+        __tablename__ = "analytics"
+
+        id = Column(Integer, primary_key=True)
+        metric_name = Column(String(100))
+        metric_date = Column(DateTime)
+        metric_value = Column(Float)
+
+    class DatabaseManager:
+        """محرك SQLite في الذاكرة يعاد إنشاؤه لكل اختبار"""
+
+        def __init__(self):
+            self.engine = None
+            self._sessions = None
+
+        def connect(self):
+            self.engine = create_async_engine(
+                "sqlite+aiosqlite://", poolclass=StaticPool,
+                connect_args={'check_same_thread': False}
+            )
+            self._sessions = async_sessionmaker(
+                self.engine, class_=AsyncSession, expire_on_commit=False
+            )
+
+        @asynccontextmanager
+        async def get_session(self):
+            async with self._sessions() as session:
+                yield session
+
+        async def close(self):
+            if self.engine is not None:
+                await self.engine.dispose()
+
+    db_manager = DatabaseManager()
+
+    async def init_database():
+        async with db_manager.engine.begin() as connection:
+            await connection.run_sync(Base.metadata.create_all)
+
+    for name, value in {
+        'Base': Base, 'User': User, 'Plan': Plan, 'Channel': Channel,
+        'Subscription': Subscription, 'Payment': Payment,
+        'ScheduledTask': ScheduledTask, 'Analytics': Analytics,
+        'db_manager': db_manager, 'init_database': init_database,
+        'user_service': types.SimpleNamespace(),
+        'subscription_service': types.SimpleNamespace(),
+        'channel_service': types.SimpleNamespace(),
+        'plan_service': types.SimpleNamespace(),
+    }.items():
+        setattr(module, name, value)
+    return module
+
+
+def _localization_module() -> types.ModuleType:
+    module = types.ModuleType("localization")
+
+    class Translator:
+        """نصوص قابلة للاستبدال في الاختبارات"""
+
+        def __init__(self):
+            self.texts = {}
+
+        def get_text(self, key, language="en", **values):
+            return self.texts.get((key, language), key).format(**values)
+
+    module.translator = Translator()
+    module.get_user_language = lambda user_data: (user_data or {}).get('preferred_language') or "en"
+    module.message_formatter = types.SimpleNamespace()
+    return module
+
+
+STAND_INS = {
+    'config': _config_module,
+    'database': _database_module,
+    'localization': _localization_module,
+}
+
+for _name, _factory in STAND_INS.items():
+    if _missing(_name):
+        sys.modules[_name] = _factory()
+
+
+@pytest.fixture
+def run_db():
+    """تشغيل سيناريو غير متزامن على قاعدة بيانات فارغة بكل الجداول"""
+    import database
+    from database import Base, db_manager, init_database
+    from migrations import register_models
+
+    # لا تكتب الاختبارات أبداً في قاعدة بيانات حقيقية
+    if not getattr(database, 'IS_STAND_IN', False):
+        pytest.skip("requires the in-memory stand-in database")
+
+    register_models()
+
+    def run(scenario, *args):
+        async def main():
+            db_manager.connect()
+            try:
+                await init_database()
+                async with db_manager.engine.begin() as connection:
+                    await connection.run_sync(Base.metadata.create_all)
+                return await scenario(*args)
+            finally:
+                await db_manager.close()
+
+        return asyncio.run(main())
+
+    return run
@@ -0,0 +1,109 @@
+"""
+اختبارات قياس الأداء
+Benchmark Measurement and Report Tests
+"""
+
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import benchmark
+from benchmark import (
+    Benchmark, BenchmarkReport, LoadGenerator, UnsafeEnvironmentError, UpdateTracker
+)
+
+
+async def start_handler(event):
+    await asyncio.sleep(0)
+
+
+async def broken_handler(event):
+    raise RuntimeError("boom")
+
+
+def _dispatcher(tracker: UpdateTracker, handlers):
+    """يمرر التحديث عبر الوسيط الخارجي ثم الداخلي كما يفعل الموزع"""
+    async def deliver(update):
+        event = SimpleNamespace(update_id=update['update_id'])
+        callback = handlers.get(update['text'])
+        if callback is None:
+            # تحديث لا ينتهي: يبقى معلقاً حتى انتهاء المهلة
+            return
+
+        async def routed(event, data):
+            inner = {'handler': SimpleNamespace(callback=callback), 'event_update': event}
+            return await tracker(lambda event, data: callback(event), event, inner)
+
+        async def process():
+            try:
+                await tracker(routed, event, {})
+            except RuntimeError:
+                pass
+
+        asyncio.create_task(process())
+    return deliver
+
+
+def test_load_generator_times_each_handler_and_counts_unfinished():
+    async def scenario():
+        tracker = UpdateTracker()
+        deliver = _dispatcher(tracker, {'start': start_handler, 'broken': broken_handler})
+        updates = [
+            {'update_id': index, 'text': text}
+            for index, text in enumerate(['start', 'start', 'broken', 'lost'], start=1)
+        ]
+
+        generator = LoadGenerator(deliver, tracker, rate=1000, timeout=0.2)
+        duration, unfinished = await generator.run(iter(updates), len(updates))
+        return tracker, duration, unfinished
+
+    tracker, duration, unfinished = asyncio.run(scenario())
+    assert unfinished == 1
+    assert duration > 0
+    assert {name: len(samples) for name, samples in tracker.samples.items()} == {
+        'start_handler': 2, 'broken_handler': 1
+    }
+    assert tracker.errors == {'broken_handler': 1}
+
+
+def test_report_rows_and_summary():
+    tracker = UpdateTracker()
+    tracker.samples['start_handler'] = [0.003, 0.001, 0.002, 0.010]
+    tracker.samples['buy_handler'] = [0.020]
+    tracker.errors['buy_handler'] = 1
+    fake_api = SimpleNamespace(calls={'sendMessage': 5}, rate_limited={'sendMessage': 1})
+
+    report = BenchmarkReport("feed", 2.0, tracker, timeouts=1, fake_api=fake_api)
+    summary = report.as_dict()
+
+    assert [row['handler'] for row in report.rows] == ['start_handler', 'buy_handler']
+    start = report.rows[0]
+    assert start['count'] == 4
+    assert start['throughput'] == 2.0
+    assert start['p50_ms'] == pytest.approx(2.0)
+    assert start['p99_ms'] == pytest.approx(10.0)
+    assert summary['completed'] == 5
+    assert summary['throughput'] == 2.5
+    assert summary['timeouts'] == 1
+
+    text = report.format()
+    assert "5 updates in 2.0s" in text
+    assert "Bot API calls: sendMessage=5" in text
+    assert "Injected 429 responses: sendMessage=1" in text
+
+
+def test_refuses_to_run_outside_a_test_environment(monkeypatch):
+    settings = SimpleNamespace(DATABASE_URL="postgresql://prod/bot")
+    monkeypatch.setattr(benchmark, "settings", settings)
+    run = Benchmark(fake_api=SimpleNamespace(), include_payments=True)
+
+    with pytest.raises(UnsafeEnvironmentError):
+        run.check_environment()
+
+    settings.BENCHMARK_DATABASE_URL = "postgresql://prod/bot"
+    with pytest.raises(UnsafeEnvironmentError, match="payment"):
+        run.check_environment()
+
+    settings.PAYMENTS_SANDBOX = True
+    run.check_environment()
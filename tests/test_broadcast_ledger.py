@@ -0,0 +1,67 @@
+"""
+اختبارات سجل تسليم البث
+Broadcast Delivery Ledger Tests
+"""
+
+from broadcast import DeliveryLedger
+
+
+SENT = 1
+
+
+def _dispatch(ledger, *user_ids):
+    for user_id in user_ids:
+        ledger.dispatched(user_id)
+
+
+def test_checkpoint_waits_for_in_order_prefix():
+    ledger = DeliveryLedger(job_id=1)
+    _dispatch(ledger, 1, 2, 3)
+    ledger.settled(2, SENT)
+    ledger.settled(3, SENT)
+
+    rows = ledger.drain()
+    assert ledger.checkpoint_after(rows) == 0
+    assert ledger.persisted(rows) == 0
+
+    ledger.settled(1, SENT)
+    rows = ledger.drain()
+    assert ledger.checkpoint_after(rows) == 3
+    assert ledger.persisted(rows) == 3
+
+
+def test_checkpoint_after_does_not_change_state():
+    ledger = DeliveryLedger(job_id=1, checkpoint=10)
+    _dispatch(ledger, 11, 12)
+    ledger.settled(11, SENT)
+
+    rows = ledger.drain()
+    assert ledger.checkpoint_after(rows) == 11
+    assert ledger.checkpoint == 10
+
+
+def test_failed_write_keeps_rows_and_checkpoint():
+    ledger = DeliveryLedger(job_id=1)
+    _dispatch(ledger, 1, 2)
+    ledger.settled(1, SENT)
+    rows = ledger.drain()
+
+    # فشل الكتابة: السجلات تعود للمخزن ولا تتقدم نقطة الحفظ
+    ledger.restore(rows)
+    ledger.settled(2, SENT)
+    assert ledger.checkpoint == 0
+    assert ledger.pending_writes == 2
+
+    rows = ledger.drain()
+    assert rows[0] == (1, SENT)
+    assert ledger.persisted(rows) == 2
+    assert ledger.pending_writes == 0
+
+
+def test_resume_starts_from_saved_checkpoint():
+    ledger = DeliveryLedger(job_id=1, checkpoint=50)
+    _dispatch(ledger, 51)
+    assert ledger.advance() == 50
+
+    ledger.settled(51, SENT)
+    assert ledger.persisted(ledger.drain()) == 51
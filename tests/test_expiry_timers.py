@@ -0,0 +1,77 @@
+"""
+اختبارات مؤقتات انتهاء الاشتراكات
+Expiry Timer Tests
+"""
+
+from datetime import datetime, timedelta
+
+from database import Subscription, db_manager
+from expiry_timers import ExpiryTimers
+from scheduler import BotScheduler
+
+
+NOW = datetime(2024, 1, 1, 12, 0, 0)
+
+
+async def _noop(ids):
+    pass
+
+
+def _timers() -> ExpiryTimers:
+    return ExpiryTimers(_noop, _noop, reminder_lead=timedelta(hours=1),
+                        horizon=timedelta(hours=48))
+
+
+def test_pop_due_returns_only_due_deadlines():
+    timers = _timers()
+    timers.schedule(1, NOW - timedelta(seconds=1))
+    timers.schedule(2, NOW + timedelta(seconds=1))
+
+    expire_ids, remind_ids = timers._pop_due(NOW)
+
+    assert expire_ids == [1]
+    assert remind_ids == [1, 2]
+    # الموعد القريب غير المستحق يبقى في الكومة
+    assert len(timers) == 1
+    assert timers._pop_due(NOW + timedelta(seconds=1)) == ([2], [])
+
+
+def test_pop_due_skips_rescheduled_and_cancelled():
+    timers = _timers()
+    timers.schedule(1, NOW)
+    timers.schedule(1, NOW + timedelta(days=1))
+    timers.schedule(2, NOW)
+    timers.cancel(2)
+
+    assert timers._pop_due(NOW) == ([], [])
+    assert len(timers) == 1
+
+
+def test_reminder_fires_before_expiry():
+    timers = _timers()
+    timers.schedule(1, NOW + timedelta(minutes=30))
+
+    assert timers._pop_due(NOW) == ([], [1])
+    assert timers._pop_due(NOW + timedelta(minutes=30)) == ([1], [])
+
+
+def test_subscription_writes_update_the_leader_timers(run_db):
+    async def scenario():
+        scheduler = BotScheduler()
+        scheduler.elector.is_leader = True
+        scheduler._watch_subscriptions(True)
+        try:
+            async with db_manager.get_session() as session:
+                subscription = Subscription(user_id=1, plan_id=1,
+                                            end_date=datetime.utcnow() + timedelta(days=30))
+                session.add(subscription)
+                await session.commit()
+                tracked = len(scheduler.expiry_timers)
+
+                subscription.status = "cancelled"
+                await session.commit()
+                return tracked, len(scheduler.expiry_timers)
+        finally:
+            scheduler._watch_subscriptions(False)
+
+    assert run_db(scenario) == (1, 0)
@@ -0,0 +1,83 @@
+"""
+اختبارات فهرس الرسائل المجهز مسبقاً
+Message Catalog Tests
+"""
+
+import pytest
+
+import messages
+from messages import (
+    CompiledTemplate, LANGUAGES, MessageCatalog, MessageId, TranslatorTemplate
+)
+
+
+class FakeTranslator:
+    """مترجم بقوالب ثابتة؛ المفاتيح في broken تفشل عند التنسيق بالعلامات"""
+
+    def __init__(self, broken=()):
+        self.broken = set(broken)
+        self.calls = []
+
+    def get_text(self, key, language, **values):
+        self.calls.append((key, language, values))
+        if key in self.broken and values and all(
+            value == "{" + name + "}" for name, value in values.items()
+        ):
+            raise KeyError(key)
+        if not values:
+            return f"{key}:{language}"
+        return f"{key}:{language} " + " ".join(
+            f"{name}={value}" for name, value in sorted(values.items())
+        )
+
+
+@pytest.fixture
+def translator(monkeypatch):
+    fake = FakeTranslator(broken={'broadcast_confirm'})
+    monkeypatch.setattr(messages, "translator", fake)
+    return fake
+
+
+def test_compiled_template_formats_fields_and_specs():
+    template = CompiledTemplate("{name!r} paid {amount:.2f} ({count})")
+    assert template.render({'name': "x", 'amount': 3, 'count': 7}) == "'x' paid 3.00 (7)"
+
+
+def test_static_and_literal_templates_return_text_unchanged():
+    assert CompiledTemplate("no fields").render({}) == "no fields"
+    assert CompiledTemplate.literal("{not a field}").render({}) == "{not a field}"
+
+
+def test_compile_builds_every_message_and_language(translator):
+    catalog = MessageCatalog()
+    catalog.compile()
+    assert len(catalog._templates) == len(MessageId) * len(LANGUAGES)
+
+
+def test_render_uses_precompiled_translator_text(translator):
+    catalog = MessageCatalog()
+    catalog.compile()
+    translator.calls.clear()
+
+    text = catalog.render(MessageId.BROADCAST_SENT, "ar", sent_count=5, total_count=9)
+
+    assert text == "broadcast_sent:ar sent_count=5 total_count=9"
+    assert translator.calls == []
+
+
+def test_unparseable_template_falls_back_to_translator(translator):
+    catalog = MessageCatalog()
+    catalog.compile()
+    template = catalog._template(MessageId.BROADCAST_CONFIRM, "en")
+
+    assert isinstance(template, TranslatorTemplate)
+    assert catalog.render(MessageId.BROADCAST_CONFIRM, "en", user_count=3) == \
+        "broadcast_confirm:en user_count=3"
+
+
+def test_unknown_language_and_render_many(translator):
+    catalog = MessageCatalog()
+    assert catalog.render(MessageId.START, "fr") == "start:en"
+    assert catalog.render_many(MessageId.START, [("ar", {}), ("en", {}), ("ar", {})]) == [
+        "start:ar", "start:en", "start:ar"
+    ]
@@ -0,0 +1,82 @@
+"""
+اختبارات محدد معدل الطلبات
+Rate Limiter Tests
+"""
+
+import asyncio
+import time
+
+from rate_limiter import TokenBucket, TelegramRateLimiter
+
+
+def _elapsed(coro_factory) -> float:
+    async def run():
+        started = time.monotonic()
+        await coro_factory()
+        return time.monotonic() - started
+    return asyncio.run(run())
+
+
+def test_bucket_allows_burst_up_to_capacity():
+    bucket = TokenBucket(rate=10, capacity=5)
+
+    async def burst():
+        for _ in range(5):
+            await bucket.acquire()
+
+    assert _elapsed(burst) < 0.05
+    assert bucket.tokens < 1
+
+
+def test_bucket_waits_for_refill_when_empty():
+    bucket = TokenBucket(rate=20, capacity=1)
+
+    async def two():
+        await bucket.acquire()
+        await bucket.acquire()
+
+    # الرمز الثاني يحتاج 1/20 ثانية
+    assert _elapsed(two) >= 0.045
+
+
+def test_refill_is_capped_at_capacity():
+    bucket = TokenBucket(rate=10, capacity=3)
+    bucket.tokens = 0.0
+    bucket._refill(bucket.updated_at + 100)
+    assert bucket.tokens == 3.0
+
+
+def test_pause_drains_tokens_and_delays_acquire():
+    bucket = TokenBucket(rate=1000)
+
+    async def paused():
+        bucket.pause(0.1)
+        await bucket.acquire()
+
+    assert _elapsed(paused) >= 0.095
+
+
+def test_private_chat_interval_is_enforced_per_chat():
+    limiter = TelegramRateLimiter(global_rate=1000, private_interval=0.1)
+
+    async def same_chat():
+        await limiter.acquire(1)
+        await limiter.acquire(1)
+
+    async def other_chats():
+        await limiter.acquire(2)
+        await limiter.acquire(3)
+
+    assert _elapsed(same_chat) >= 0.095
+    assert _elapsed(other_chats) < 0.05
+
+
+def test_group_chats_use_group_interval():
+    limiter = TelegramRateLimiter(global_rate=1000, private_interval=0.0,
+                                  group_interval=0.1)
+
+    async def group():
+        await limiter.acquire(-100)
+        await limiter.acquire(-100)
+
+    assert _elapsed(group) >= 0.095
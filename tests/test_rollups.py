@@ -0,0 +1,91 @@
+"""
+اختبارات التجميع والضغط
+Rollup Fold and Compaction Tests
+"""
+
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from database import Payment, Subscription, db_manager
+from rollups import (
+    GRANULARITY_DAY, GRANULARITY_HOUR, GRANULARITY_MONTH, METRIC_REVENUE,
+    METRIC_SUBSCRIPTIONS_EXPIRED, WATERMARK_COMPACTION, RollupManager, RollupWatermark
+)
+
+
+# آخر يوم في الشهر حتى يعبر منتصف الليل حدود الشهر أيضاً
+DAY_ONE = datetime(2024, 1, 31)
+DAY_TWO = datetime(2024, 2, 1)
+
+
+async def _add(*rows):
+    async with db_manager.get_session() as session:
+        session.add_all(rows)
+        await session.commit()
+
+
+def _payment(amount: float, completed_at: datetime) -> Payment:
+    return Payment(amount=amount, status="completed", completed_at=completed_at, plan_id=1)
+
+
+async def _watermark(name: str) -> datetime:
+    async with db_manager.get_session() as session:
+        return await session.scalar(
+            select(RollupWatermark.position).where(RollupWatermark.name == name)
+        )
+
+
+async def _totals(manager: RollupManager, granularity: str, metric: str):
+    series = await manager.series(granularity, metric, datetime(2024, 1, 1), datetime(2024, 3, 1))
+    return {bucket: value for bucket, value, count in series}
+
+
+async def _cycle(manager: RollupManager, until: datetime):
+    await manager.fold(until)
+    await manager.compact(until)
+
+
+def test_fold_and_compact_across_midnight(run_db):
+    async def scenario():
+        manager = RollupManager()
+        await _add(_payment(100, DAY_ONE + timedelta(hours=23, minutes=30)))
+
+        await _cycle(manager, DAY_TWO + timedelta(seconds=10))
+        # اليوم المفتوح يتبع until وليس ساعة الجهاز
+        watermark = await _watermark(WATERMARK_COMPACTION)
+
+        await _add(_payment(50, DAY_TWO + timedelta(minutes=5)))
+        await _cycle(manager, DAY_TWO + timedelta(hours=1))
+        # تكرار الدورة بنفس النقطة لا يضاعف القيم
+        await _cycle(manager, DAY_TWO + timedelta(hours=1))
+
+        return (
+            watermark,
+            await _totals(manager, GRANULARITY_HOUR, METRIC_REVENUE),
+            await _totals(manager, GRANULARITY_DAY, METRIC_REVENUE),
+            await _totals(manager, GRANULARITY_MONTH, METRIC_REVENUE),
+        )
+
+    watermark, hourly, daily, monthly = run_db(scenario)
+    assert watermark == DAY_TWO
+    assert hourly == {DAY_ONE + timedelta(hours=23): 100, DAY_TWO: 50}
+    assert daily == {DAY_ONE: 100, DAY_TWO: 50}
+    assert monthly == {DAY_ONE.replace(day=1): 100, DAY_TWO: 50}
+
+
+def test_first_fold_counts_expirations_before_until(run_db):
+    async def scenario():
+        manager = RollupManager()
+        await _add(
+            Subscription(user_id=1, plan_id=1, status="expired",
+                         created_at=DAY_ONE - timedelta(days=30),
+                         updated_at=DAY_ONE + timedelta(hours=22)),
+            Subscription(user_id=2, plan_id=1, status="active",
+                         created_at=DAY_ONE, updated_at=DAY_ONE + timedelta(hours=1)),
+        )
+
+        await _cycle(manager, DAY_TWO)
+        return await _totals(manager, GRANULARITY_DAY, METRIC_SUBSCRIPTIONS_EXPIRED)
+
+    assert run_db(scenario) == {DAY_ONE: 1}
@@ -0,0 +1,110 @@
+"""
+اختبارات تقسيم أعمال المجدول
+Sweep Sharding Tests
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import select
+
+import sharding
+from database import ScheduledTask, Subscription, db_manager
+from scheduler import BotScheduler, EXPIRY_CLAIM_TIMEOUT_MINUTES, STATUS_EXPIRING
+from task_store import ScheduledTaskStore
+
+
+@pytest.fixture
+def shard(monkeypatch):
+    def configure(count: int, index: int):
+        monkeypatch.setattr(sharding, "SWEEP_SHARD_COUNT", count)
+        monkeypatch.setattr(sharding, "SWEEP_SHARD_INDEX", index)
+    return configure
+
+
+async def _add(*rows):
+    async with db_manager.get_session() as session:
+        session.add_all(rows)
+        await session.commit()
+
+
+async def _statuses():
+    async with db_manager.get_session() as session:
+        result = await session.execute(select(Subscription.user_id, Subscription.status))
+        return dict(result.all())
+
+
+def _due(user_id: int, **values) -> Subscription:
+    values.setdefault('end_date', datetime.utcnow() - timedelta(minutes=1))
+    return Subscription(user_id=user_id, plan_id=1, **values)
+
+
+def test_each_user_has_exactly_one_owner(shard):
+    owners = {}
+    for index in range(3):
+        shard(3, index)
+        for user_id in range(30):
+            if sharding.owns_user(user_id):
+                owners.setdefault(user_id, []).append(index)
+
+    assert all(len(indexes) == 1 for indexes in owners.values())
+    assert len(owners) == 30
+
+
+def test_claim_is_exclusive_and_limited_to_own_shard(run_db, shard):
+    shard(2, 0)
+
+    async def scenario():
+        await _add(*(_due(user_id) for user_id in range(1, 5)))
+        scheduler = BotScheduler()
+
+        first = await scheduler._claim_due_subscriptions()
+        second = await scheduler._claim_due_subscriptions()
+        return [s.user_id for s in first], second, await _statuses()
+
+    first, second, statuses = run_db(scenario)
+    assert sorted(first) == [2, 4]
+    assert second == []
+    assert statuses == {1: "active", 2: STATUS_EXPIRING, 3: "active", 4: STATUS_EXPIRING}
+
+
+def test_stale_expiring_claim_is_reclaimed(run_db, shard):
+    shard(1, 0)
+
+    async def scenario():
+        stale = datetime.utcnow() - timedelta(minutes=EXPIRY_CLAIM_TIMEOUT_MINUTES + 1)
+        await _add(
+            _due(1, status=STATUS_EXPIRING, updated_at=stale),
+            _due(2, status=STATUS_EXPIRING, updated_at=datetime.utcnow()),
+            _due(3, end_date=datetime.utcnow() + timedelta(days=1)),
+        )
+
+        claimed = await BotScheduler()._claim_due_subscriptions()
+        return [s.user_id for s in claimed]
+
+    assert run_db(scenario) == [1]
+
+
+def test_task_reload_only_runs_tasks_of_own_shard(run_db, shard):
+    shard(2, 1)
+
+    async def scenario():
+        overdue = datetime.utcnow() - timedelta(minutes=1)
+        await _add(*(
+            ScheduledTask(task_type="kick", user_id=user_id, scheduled_time=overdue, task_data={})
+            for user_id in (1, 2, 3, None)
+        ))
+
+        store = ScheduledTaskStore(AsyncIOScheduler())
+        ran = []
+
+        async def handler(records):
+            ran.extend(record.user_id for record in records)
+
+        store.register("kick", handler)
+        await store.load_pending()
+        return ran
+
+    # المهام دون مالك تعود للقسم الأول فقط
+    assert sorted(run_db(scenario)) == [1, 3]
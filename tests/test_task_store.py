@@ -0,0 +1,96 @@
+"""
+اختبارات مخزن المهام المجدولة
+Scheduled Task Store Tests
+"""
+
+from datetime import datetime, timedelta
+
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from sqlalchemy import select
+
+import task_store
+from database import ScheduledTask, db_manager
+from task_store import ScheduledTaskStore
+
+
+async def _add_task(**values) -> int:
+    async with db_manager.get_session() as session:
+        task = ScheduledTask(task_type="kick", task_data={}, **values)
+        session.add(task)
+        await session.commit()
+        return task.id
+
+
+async def _task(task_id: int) -> ScheduledTask:
+    async with db_manager.get_session() as session:
+        return await session.scalar(select(ScheduledTask).where(ScheduledTask.id == task_id))
+
+
+def test_overdue_task_runs_once_when_reload_races_the_trigger(run_db):
+    async def scenario():
+        store = ScheduledTaskStore(AsyncIOScheduler())
+        calls = []
+
+        async def handler(records):
+            calls.extend(record.id for record in records)
+
+        store.register("kick", handler)
+        task_id = await _add_task(scheduled_time=datetime.utcnow() - timedelta(minutes=1))
+        task = await _task(task_id)
+
+        # وظيفة DateTrigger وإعادة التحميل تحملان نفس الصف
+        await store._execute("kick", [store._record(task)])
+        await store.load_pending()
+        await store.flush()
+
+        return calls, (await _task(task_id)).status
+
+    calls, status = run_db(scenario)
+    assert len(calls) == 1
+    assert status == task_store.TASK_COMPLETED
+
+
+def test_failed_task_is_retried_with_backoff_then_marked_failed(run_db, monkeypatch):
+    monkeypatch.setattr(task_store, "TASK_MAX_ATTEMPTS", 2)
+
+    async def scenario():
+        store = ScheduledTaskStore(AsyncIOScheduler())
+
+        async def handler(records):
+            raise RuntimeError("telegram is down")
+
+        store.register("kick", handler)
+        task_id = await _add_task(scheduled_time=datetime.utcnow() - timedelta(minutes=1))
+        await store._execute("kick", [store._record(await _task(task_id))])
+        retried = await _task(task_id)
+
+        await store._execute("kick", [store._record(retried)])
+        await store.flush()
+        return retried, await _task(task_id)
+
+    retried, final = run_db(scenario)
+    assert retried.status == task_store.TASK_PENDING
+    assert retried.task_data == {'attempts': 1}
+    assert retried.scheduled_time > datetime.utcnow()
+    assert final.status == task_store.TASK_FAILED
+
+
+def test_stale_running_task_is_reclaimed(run_db):
+    async def scenario():
+        store = ScheduledTaskStore(AsyncIOScheduler())
+        calls = []
+
+        async def handler(records):
+            calls.extend(record.id for record in records)
+
+        store.register("kick", handler)
+        past = datetime.utcnow() - timedelta(minutes=task_store.TASK_CLAIM_TIMEOUT_MINUTES + 1)
+        stale = await _add_task(scheduled_time=past, status=task_store.TASK_RUNNING, executed_at=past)
+        fresh = await _add_task(scheduled_time=past, status=task_store.TASK_RUNNING,
+                                executed_at=datetime.utcnow())
+
+        await store.load_pending()
+        return calls, stale, fresh
+
+    calls, stale, fresh = run_db(scenario)
+    assert calls == [stale]
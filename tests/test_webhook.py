@@ -0,0 +1,58 @@
+"""
+اختبارات استقبال webhook
+Webhook Ingestion Tests
+"""
+
+import asyncio
+
+import pytest
+
+import webhook
+from webhook import UpdateLanes, WebhookIngress
+
+
+def _message(chat_id: int) -> dict:
+    return {"message": {"chat": {"id": chat_id}}}
+
+
+def test_busy_chat_can_use_the_whole_bound():
+    async def scenario():
+        lanes = UpdateLanes(None, None, queue_size=10, workers=4, name="test")
+        accepted = [lanes.offer(_message(5)) for _ in range(12)]
+        return accepted, lanes.offer(_message(6)), lanes.depth
+
+    accepted, other_chat, depth = asyncio.run(scenario())
+    assert accepted == [True] * 10 + [False] * 2
+    assert not other_chat
+    assert depth == 10
+
+
+def test_put_waits_until_a_worker_frees_space():
+    async def scenario():
+        handled = []
+
+        class Dispatcher:
+            async def feed_raw_update(self, bot, update):
+                handled.append(update)
+
+        lanes = UpdateLanes(Dispatcher(), None, queue_size=1, workers=2, name="test")
+        lanes.offer(_message(1))
+        waiting = asyncio.create_task(lanes.put(_message(2)))
+        await asyncio.sleep(0)
+        assert not waiting.done()
+
+        await lanes.start()
+        await asyncio.wait_for(waiting, timeout=1)
+        await lanes.stop()
+        return handled
+
+    assert len(asyncio.run(scenario())) == 2
+
+
+def test_random_secret_is_refused_with_several_instances(monkeypatch):
+    monkeypatch.setattr(webhook, "WEBHOOK_INSTANCES", 2)
+    with pytest.raises(ValueError):
+        WebhookIngress(None, None, secret_token=None)
+
+    monkeypatch.setattr(webhook, "WEBHOOK_INSTANCES", 1)
+    assert WebhookIngress(None, None, secret_token=None, router=lambda update: True).secret_token
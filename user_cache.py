@@ -0,0 +1,199 @@
+"""
+ذاكرة مؤقتة لملفات المستخدمين
+User Profile Cache
+"""
+
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Dict, Iterable, Optional
+
+from config import settings
+from database import user_service
+from stats_counters import stats_counters
+
+
+# إعدادات الذاكرة المؤقتة
+USER_CACHE_SIZE = getattr(settings, 'USER_CACHE_SIZE', 50000)
+USER_CACHE_TTL = getattr(settings, 'USER_CACHE_TTL', 300)
+
+
+@dataclass(slots=True)
+class CachedUser:
+    """سجل مضغوط لبيانات المستخدم"""
+    id: int
+    telegram_id: int
+    preferred_language: Optional[str]
+    is_admin: bool
+    username: Optional[str]
+    first_name: Optional[str]
+    last_name: Optional[str]
+    language_code: Optional[str]
+    expires_at: float
+
+    def matches(self, telegram_user) -> bool:
+        """هل تطابق بيانات تلجرام الحالية ما هو محفوظ"""
+        return (
+            self.username == telegram_user.username
+            and self.first_name == telegram_user.first_name
+            and self.last_name == telegram_user.last_name
+            and self.language_code == telegram_user.language_code
+        )
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'telegram_id': self.telegram_id,
+            'preferred_language': self.preferred_language,
+            'is_admin': self.is_admin,
+            'username': self.username,
+            'first_name': self.first_name
+        }
+
+
+class UserCache:
+    """ذاكرة LRU مع مدة صلاحية لبيانات المستخدمين"""
+
+    def __init__(self, max_size: int = USER_CACHE_SIZE, ttl: float = USER_CACHE_TTL):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.logger = logging.getLogger(__name__)
+        self._entries: "OrderedDict[int, CachedUser]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, telegram_id: int) -> Optional[CachedUser]:
+        """الحصول على سجل صالح من الذاكرة"""
+        entry = self._entries.get(telegram_id)
+        if entry is None:
+            return None
+
+        if entry.expires_at < time.monotonic():
+            del self._entries[telegram_id]
+            return None
+
+        self._entries.move_to_end(telegram_id)
+        return entry
+
+    def put(self, user, telegram_user=None) -> CachedUser:
+        """حفظ مستخدم من قاعدة البيانات في الذاكرة"""
+        entry = CachedUser(
+            id=user.id,
+            telegram_id=user.telegram_id,
+            preferred_language=user.preferred_language,
+            is_admin=bool(user.is_admin),
+            username=user.username,
+            first_name=user.first_name,
+            last_name=getattr(user, 'last_name', None),
+            language_code=getattr(telegram_user, 'language_code', None),
+            expires_at=time.monotonic() + self.ttl
+        )
+
+        self._entries[entry.telegram_id] = entry
+        self._entries.move_to_end(entry.telegram_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+        return entry
+
+    def invalidate(self, telegram_id: int):
+        """حذف مستخدم من الذاكرة"""
+        self._entries.pop(telegram_id, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    async def get_user_data(self, telegram_user) -> Dict[str, Any]:
+        """بيانات المستخدم مع الكتابة لقاعدة البيانات عند تغير الملف فقط"""
+        entry = self.get(telegram_user.id)
+        if entry is not None and entry.matches(telegram_user):
+            self.hits += 1
+            return entry.as_dict()
+
+        self.misses += 1
+
+        # المستخدم غير الموجود في الذاكرة قد يكون جديداً: العد عند الإدراج الفعلي فقط
+        if entry is None and await self._insert_new_user(telegram_user):
+            stats_counters.record_registration()
+
+        user = await user_service.create_or_update_user(telegram_user)
+        return self.put(user, telegram_user).as_dict()
+
+    async def _insert_new_user(self, telegram_user) -> bool:
+        """إدراج المستخدم إن لم يكن موجوداً؛ يعيد True فقط إذا أدرج فعلاً"""
+        from sqlalchemy import insert
+        from sqlalchemy.exc import IntegrityError
+        from database import db_manager, User
+
+        row = {
+            'telegram_id': telegram_user.id,
+            'username': telegram_user.username,
+            'first_name': telegram_user.first_name,
+            'registration_date': datetime.utcnow()
+        }
+
+        async with db_manager.get_session() as session:
+            dialect = session.get_bind().dialect.name
+
+            if dialect in ("postgresql", "sqlite"):
+                if dialect == "postgresql":
+                    from sqlalchemy.dialects.postgresql import insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert
+
+                result = await session.execute(
+                    insert(User).values(**row).on_conflict_do_nothing()
+                )
+                await session.commit()
+                return bool(result.rowcount)
+
+            # قواعد أخرى: القيد الفريد على telegram_id يرفض المستخدم الموجود
+            try:
+                await session.execute(insert(User).values(**row))
+                await session.commit()
+                return True
+            except IntegrityError:
+                await session.rollback()
+                return False
+
+    async def update_user_language(self, telegram_id: int, language: str):
+        """تحديث لغة المستخدم مع إبطال الذاكرة"""
+        result = await user_service.update_user_language(telegram_id, language)
+        self.invalidate(telegram_id)
+        return result
+
+    async def set_admin_status(self, telegram_id: int, is_admin: bool):
+        """تحديث صلاحية المدير مع إبطال الذاكرة"""
+        result = await user_service.set_admin_status(telegram_id, is_admin)
+        self.invalidate(telegram_id)
+        return result
+
+    async def set_admin_statuses(self, telegram_ids: Iterable[int], is_admin: bool) -> int:
+        """تحديث صلاحية عدة مستخدمين باستعلام واحد مع إبطال الذاكرة"""
+        from sqlalchemy import update
+        from database import db_manager, User
+
+        telegram_ids = list(telegram_ids)
+        if not telegram_ids:
+            return 0
+
+        async with db_manager.get_session() as session:
+            result = await session.execute(
+                update(User)
+                .where(User.telegram_id.in_(telegram_ids))
+                .values(is_admin=is_admin)
+            )
+            await session.commit()
+
+        for telegram_id in telegram_ids:
+            self.invalidate(telegram_id)
+        return result.rowcount
+
+
+# إنشاء مثيل الذاكرة المؤقتة العام
+user_cache = UserCache()
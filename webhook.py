@@ -0,0 +1,218 @@
+"""
+استقبال تحديثات تلجرام عبر webhook
+Telegram Webhook Update Ingestion
+"""
+
+import asyncio
+import hmac
+import logging
+import secrets
+from typing import Any, Callable, Dict, List, Optional
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+
+from config import settings
+from metrics import queue_depth, register_metrics_route
+from sharding import SWEEP_SHARD_COUNT
+
+
+# إعدادات وضع الاستقبال
+UPDATE_MODE = getattr(settings, 'UPDATE_MODE', 'polling')
+TELEGRAM_WEBHOOK_PATH = getattr(settings, 'TELEGRAM_WEBHOOK_PATH', '/telegram/webhook')
+TELEGRAM_WEBHOOK_PORT = getattr(settings, 'TELEGRAM_WEBHOOK_PORT', 8081)
+WEBHOOK_SECRET_TOKEN = getattr(settings, 'WEBHOOK_SECRET_TOKEN', None)
+WEBHOOK_QUEUE_SIZE = getattr(settings, 'WEBHOOK_QUEUE_SIZE', 1000)
+WEBHOOK_WORKERS = getattr(settings, 'WEBHOOK_WORKERS', 16)
+WEBHOOK_DRAIN_TIMEOUT = getattr(settings, 'WEBHOOK_DRAIN_TIMEOUT', 10)
+# عدد النسخ التي قد تستقبل webhook لنفس التوكن (كل قسم نسخة مستقلة)
+WEBHOOK_INSTANCES = getattr(settings, 'WEBHOOK_INSTANCES', SWEEP_SHARD_COUNT)
+
+SECRET_TOKEN_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+# أنواع التحديثات التي تحمل محادثة
+CHAT_UPDATE_TYPES = (
+    "message", "edited_message", "channel_post", "edited_channel_post",
+    "my_chat_member", "chat_member", "chat_join_request"
+)
+
+
+def chat_id_of(update: Dict[str, Any]) -> int:
+    """معرف المحادثة (أو المستخدم) الذي ينتمي إليه التحديث"""
+    for update_type in CHAT_UPDATE_TYPES:
+        payload = update.get(update_type)
+        if payload:
+            return payload.get("chat", {}).get("id", 0)
+
+    callback = update.get("callback_query")
+    if callback:
+        message = callback.get("message")
+        if message:
+            return message.get("chat", {}).get("id", 0)
+        return callback.get("from", {}).get("id", 0)
+
+    # الأنواع الأخرى (inline_query, pre_checkout_query, ...) تحمل المرسل فقط
+    for payload in update.values():
+        if isinstance(payload, dict) and "from" in payload:
+            return payload["from"].get("id", 0)
+    return 0
+
+
+class UpdateLanes:
+    """طوابير معالجة تتشارك حداً واحداً؛ تحديثات المحادثة الواحدة تمر بنفس الطابور بالترتيب"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS,
+                 name: str = "updates"):
+        self.dp = dp
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+
+        # الحد للمجموع وليس لكل طابور: محادثة نشطة واحدة لا تملأ طابورها وحدها
+        self.queue_size = queue_size
+        self._queues: List[asyncio.Queue] = [asyncio.Queue() for _ in range(workers)]
+        self._space = asyncio.Event()
+        self._workers: List[asyncio.Task] = []
+        queue_depth.set_function(lambda: self.depth, queue=name)
+
+    @property
+    def depth(self) -> int:
+        """عدد التحديثات المنتظرة"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def _queue_for(self, update: Dict[str, Any]) -> asyncio.Queue:
+        return self._queues[chat_id_of(update) % len(self._queues)]
+
+    def offer(self, update: Dict[str, Any]) -> bool:
+        """إضافة تحديث دون انتظار؛ يعيد False إذا كان الطابور ممتلئاً"""
+        if self.depth >= self.queue_size:
+            return False
+        self._queue_for(update).put_nowait(update)
+        return True
+
+    async def put(self, update: Dict[str, Any]):
+        """إضافة تحديث مع الانتظار حتى يتوفر مكان"""
+        while self.depth >= self.queue_size:
+            self._space.clear()
+            await self._space.wait()
+        self._queue_for(update).put_nowait(update)
+
+    async def _worker(self, queue: asyncio.Queue):
+        """تمرير التحديثات إلى الموزع"""
+        while True:
+            update = await queue.get()
+            self._space.set()
+            try:
+                await self.dp.feed_raw_update(self.bot, update)
+            except Exception as e:
+                self.logger.error(f"Error processing update: {e}")
+            finally:
+                queue.task_done()
+
+    async def start(self):
+        """بدء العمال"""
+        if not self._workers:
+            self._workers = [
+                asyncio.create_task(self._worker(queue)) for queue in self._queues
+            ]
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        """إنهاء التحديثات المنتظرة ثم إيقاف العمال"""
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*(queue.join() for queue in self._queues)),
+                timeout=timeout
+            )
+        except asyncio.TimeoutError:
+            self.logger.warning(f"Dropped {self.depth} queued updates on shutdown")
+
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+
+class WebhookIngress:
+    """استقبال التحديثات والرد فوراً ثم تمريرها للمعالجة"""
+
+    def __init__(self, dp: Dispatcher, bot: Bot,
+                 queue_size: int = WEBHOOK_QUEUE_SIZE,
+                 workers: int = WEBHOOK_WORKERS,
+                 secret_token: Optional[str] = WEBHOOK_SECRET_TOKEN,
+                 router: Optional[Callable[[Dict[str, Any]], bool]] = None):
+        self.dp = dp
+        self.bot = bot
+        self.logger = logging.getLogger(__name__)
+
+        # بدون سر يمكن لأي أحد إرسال تحديثات مزيفة؛ السر العشوائي يصلح لنسخة واحدة فقط
+        # لأن كل نسخة تسجل سرها لدى تلجرام فترفض النسخ الأخرى كل التحديثات
+        if not secret_token:
+            if WEBHOOK_INSTANCES > 1:
+                raise ValueError(
+                    f"WEBHOOK_SECRET_TOKEN must be set when {WEBHOOK_INSTANCES} instances "
+                    "share the webhook"
+                )
+            secret_token = secrets.token_urlsafe(32)
+            self.logger.warning(
+                "WEBHOOK_SECRET_TOKEN is not set, using a random secret for this process"
+            )
+        self.secret_token = secret_token
+
+        # المعالجة محلياً في هذه العملية ما لم يمرر موجه خارجي
+        self.lanes = None if router else UpdateLanes(dp, bot, queue_size, workers)
+        self.router = router or self.lanes.offer
+        self._runner: Optional[web.AppRunner] = None
+
+    def register(self, app: web.Application, path: str = TELEGRAM_WEBHOOK_PATH):
+        """إضافة مسار webhook إلى تطبيق aiohttp"""
+        app.router.add_post(path, self.handle)
+
+    async def handle(self, request: web.Request) -> web.Response:
+        """الرد على تلجرام فوراً ووضع التحديث في الطابور"""
+        if not hmac.compare_digest(
+            request.headers.get(SECRET_TOKEN_HEADER, ""), self.secret_token
+        ):
+            return web.Response(status=401)
+
+        try:
+            update = await request.json()
+        except Exception:
+            return web.Response(status=400)
+
+        if not self.router(update):
+            # تلجرام يعيد إرسال التحديث لاحقاً
+            self.logger.warning("Update queue is full, asking Telegram to retry")
+            return web.Response(status=503)
+
+        return web.Response()
+
+    async def serve(self, host: str = "0.0.0.0", port: int = TELEGRAM_WEBHOOK_PORT):
+        """تشغيل خادم webhook وتسجيل العنوان لدى تلجرام"""
+        if self.lanes:
+            await self.lanes.start()
+
+        app = web.Application()
+        self.register(app)
+        register_metrics_route(app)
+
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, host, port).start()
+
+        await self.bot.set_webhook(
+            url=f"{settings.WEBHOOK_HOST.rstrip('/')}{TELEGRAM_WEBHOOK_PATH}",
+            secret_token=self.secret_token,
+            allowed_updates=self.dp.resolve_used_update_types(),
+            max_connections=100
+        )
+        self.logger.info(f"Telegram webhook listening on port {port}")
+
+    async def stop(self):
+        """إيقاف الاستقبال ثم إنهاء التحديثات المنتظرة"""
+        if self._runner:
+            await self._runner.cleanup()
+            self._runner = None
+
+        if self.lanes:
+            await self.lanes.stop()
@@ -0,0 +1,207 @@
+"""
+معالجة التحديثات في عدة عمليات
+Multi-Process Update Processing
+"""
+
+import asyncio
+import logging
+import logging.config
+import multiprocessing
+import queue
+from typing import Any, Dict, List
+
+from aiogram import Bot, Dispatcher
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
+
+from config import settings, LOGGING_CONFIG
+from metrics import queue_depth, METRICS_PORT
+from webhook import chat_id_of
+
+
+# إعدادات العمليات
+PROCESS_WORKERS = getattr(settings, 'PROCESS_WORKERS', 0)
+PROCESS_QUEUE_SIZE = getattr(settings, 'PROCESS_QUEUE_SIZE', 1000)
+PROCESS_LANES = getattr(settings, 'PROCESS_LANES', 8)
+PROCESS_STOP_TIMEOUT = getattr(settings, 'PROCESS_STOP_TIMEOUT', 15)
+POLLING_TIMEOUT = getattr(settings, 'POLLING_TIMEOUT', 30)
+# كل عامل يعرض مقاييسه (زمن المعالجات وأخطاؤها) على منفذ خاص: الأساس + رقمه
+WORKER_METRICS_PORT = getattr(
+    settings, 'WORKER_METRICS_PORT', METRICS_PORT + 1 if METRICS_PORT else None
+)
+
+# علامة إيقاف العامل
+STOP_SIGNAL = None
+
+logger = logging.getLogger(__name__)
+
+
+async def _serve_updates(index: int, updates: multiprocessing.Queue):
+    """حلقة عملية العامل: موزع خاص يقرأ من طابور العملية"""
+    from broadcast import broadcast_engine
+    from catalog import catalog
+    from messages import messages
+    from database import db_manager
+    from handlers import setup_handlers, error_handler
+    from stats_counters import stats_counters, STATS_RECONCILE_MINUTES
+    from storage import create_fsm_storage
+    from metrics import instrument_bot, instrument_engine, serve_metrics
+    from profiler import db_profiler
+    from webhook import UpdateLanes
+
+    bot = Bot(
+        token=settings.BOT_TOKEN,
+        default=DefaultBotProperties(parse_mode=ParseMode.HTML)
+    )
+    instrument_bot(bot)
+    instrument_engine(db_manager.engine)
+    db_profiler.instrument(db_manager.engine)
+    stats_counters.instrument()
+
+    messages.compile()
+
+    # البث يعمل في العملية الرئيسية فقط؛ العامل ينشئ المهمة ويتركها لها
+    broadcast_engine.launch_jobs = False
+
+    # الحالات في Redis مشتركة بين كل العمليات
+    dp = Dispatcher(storage=create_fsm_storage())
+    dp.errors.register(error_handler)
+    setup_handlers(dp, bot)
+
+    # كل عملية تحمل الفهرس وتستمع لتحديثاته
+    await catalog.load()
+    await catalog.start_listener()
+
+    lanes = UpdateLanes(dp, bot, queue_size=PROCESS_QUEUE_SIZE,
+                        workers=PROCESS_LANES, name=f"worker_{index}")
+    await lanes.start()
+
+    # سجل المقاييس خاص بكل عملية؛ /metrics في العملية الرئيسية لا يراه
+    metrics_runner = None
+    if WORKER_METRICS_PORT:
+        metrics_runner = await serve_metrics(port=WORKER_METRICS_PORT + index)
+
+    # العدادات تطابق في العملية الرئيسية؛ العامل يعيد تحميل قيمها دورياً
+    async def refresh_counters():
+        while True:
+            await stats_counters.load()
+            await asyncio.sleep(STATS_RECONCILE_MINUTES * 60)
+
+    refresher = asyncio.create_task(refresh_counters())
+    loop = asyncio.get_running_loop()
+
+    logger.info(f"Update worker {index} started")
+    try:
+        while True:
+            update = await loop.run_in_executor(None, updates.get)
+            if update is STOP_SIGNAL:
+                break
+            await lanes.put(update)
+    finally:
+        refresher.cancel()
+        if metrics_runner:
+            await metrics_runner.cleanup()
+        await catalog.stop()
+        await lanes.stop()
+        await broadcast_engine.stop()
+        db_profiler.report()
+        await dp.storage.close()
+        await db_manager.close()
+        await bot.session.close()
+        logger.info(f"Update worker {index} stopped")
+
+
+def _worker_main(index: int, updates: multiprocessing.Queue):
+    """نقطة دخول عملية العامل"""
+    logging.config.dictConfig(LOGGING_CONFIG)
+    try:
+        asyncio.run(_serve_updates(index, updates))
+    except KeyboardInterrupt:
+        pass
+
+
+class ProcessRouter:
+    """توجيه التحديثات إلى عمليات العمال حسب المحادثة"""
+
+    def __init__(self, workers: int = PROCESS_WORKERS,
+                 queue_size: int = PROCESS_QUEUE_SIZE):
+        # spawn يمنع وراثة حلقة الأحداث واتصالات قاعدة البيانات
+        self._context = multiprocessing.get_context("spawn")
+        self._queues: List[multiprocessing.Queue] = [
+            self._context.Queue(maxsize=queue_size) for _ in range(workers)
+        ]
+        self._processes: List[multiprocessing.Process] = []
+        self.logger = logging.getLogger(__name__)
+
+        for index, updates in enumerate(self._queues):
+            queue_depth.set_function(updates.qsize, queue=f"process_{index}")
+
+    def start(self):
+        """تشغيل عمليات العمال"""
+        for index, updates in enumerate(self._queues):
+            process = self._context.Process(
+                target=_worker_main,
+                args=(index, updates),
+                name=f"update-worker-{index}",
+                daemon=True
+            )
+            process.start()
+            self._processes.append(process)
+
+        self.logger.info(f"Started {len(self._processes)} update worker processes")
+
+    def _queue_for(self, update: Dict[str, Any]) -> multiprocessing.Queue:
+        # نفس المحادثة تذهب دائماً لنفس العملية للحفاظ على الترتيب
+        return self._queues[chat_id_of(update) % len(self._queues)]
+
+    def offer(self, update: Dict[str, Any]) -> bool:
+        """توجيه دون انتظار (لوضع webhook)"""
+        try:
+            self._queue_for(update).put_nowait(update)
+            return True
+        except queue.Full:
+            return False
+
+    async def route(self, update: Dict[str, Any]):
+        """توجيه مع الانتظار عند امتلاء طابور العامل (لوضع الاستطلاع)"""
+        if not self.offer(update):
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self._queue_for(update).put, update)
+
+    async def poll(self, bot: Bot, allowed_updates: List[str]):
+        """استطلاع التحديثات وتوجيهها إلى العمال"""
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(
+                    offset=offset,
+                    timeout=POLLING_TIMEOUT,
+                    allowed_updates=allowed_updates
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Error fetching updates: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            for update in updates:
+                offset = update.update_id + 1
+                await self.route(
+                    update.model_dump(mode="json", exclude_none=True, by_alias=True)
+                )
+
+    async def stop(self):
+        """إرسال علامة الإيقاف وانتظار انتهاء العمال"""
+        loop = asyncio.get_running_loop()
+
+        for updates in self._queues:
+            await loop.run_in_executor(None, updates.put, STOP_SIGNAL)
+
+        for process in self._processes:
+            await loop.run_in_executor(None, process.join, PROCESS_STOP_TIMEOUT)
+            if process.is_alive():
+                self.logger.warning(f"Terminating unresponsive {process.name}")
+                process.terminate()
+
+        self._processes = []